@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Exhaustive conformance check of an ALU chip against a reference model.
+
+The chip's HDL is flattened by hdl.Netlist and evaluated bitsliced on NumPy lanes, one
+operand pair per bit, for all 64 combinations of the control bits zx nx zy ny f no. The
+expected out, zr and ng come from reference_alu, the ALU semantics written as NumPy
+array operations, so both sides handle a whole operand grid at once.
+
+The grid is every pair of the edge values (0, 1, -1, 0x7FFF, 0x8000, single bits and
+their complements ...) plus random pairs drawn from all 2^32 (x, y). The x and y bit
+slices are packed once and reused for every control; controls are constants.
+
+A mismatch is shrunk to a minimal counterexample: bits of x and y are cleared one at a
+time, all candidates in one batch, for as long as the mismatch remains. Controls are
+named by their comp mnemonic (x is D, y is A) when the Hack instruction set has one.
+
+Requires NumPy.
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import assembler
+import hdl
+
+"""Operand values that exercise carries, signs and zero"""
+edge_values = sorted(set([0, 1, 2, 3, 0x7FFE, 0x7FFF, 0x8000, 0x8001, 0xFFFE, 0xFFFF, 0x5555, 0xAAAA] +
+                         [1 << bit for bit in range(16)] + [0xFFFF ^ (1 << bit) for bit in range(16)]))
+
+"""Comp mnemonics by control bits zx nx zy ny f no, for the comps that use A"""
+control_mnemonics = dict((int(pattern[1:], 2), mnemonic)
+                         for mnemonic, pattern in reversed(list(assembler.valid_comp_patterns.items()))
+                         if pattern[0] == '0')
+
+
+def reference_alu(x, y, control):
+    """The Hack ALU on uint16 arrays x and y under the control bits packed in control
+    (zx is bit 5). Returns the arrays (out, zr, ng).
+    """
+    x = np.asarray(x, dtype=np.uint16)
+    y = np.asarray(y, dtype=np.uint16)
+    if control & 0x20:
+        x = np.zeros_like(x)
+    if control & 0x10:
+        x = ~x
+    if control & 0x08:
+        y = np.zeros_like(y)
+    if control & 0x04:
+        y = ~y
+    out = x + y if control & 0x02 else x & y
+    if control & 0x01:
+        out = ~out
+    return out, (out == 0).astype(np.uint16), out >> 15
+
+
+def operand_grid(samples, seed=0):
+    """Arrays (x, y) of every pair of edge values followed by samples random pairs"""
+    edges = np.array(edge_values, dtype=np.uint16)
+    x = np.repeat(edges, len(edges))
+    y = np.tile(edges, len(edges))
+    pairs = np.random.RandomState(seed).randint(0, 1 << 32, size=samples, dtype=np.uint64)
+    return (np.concatenate((x, (pairs >> np.uint64(16)).astype(np.uint16))),
+            np.concatenate((y, (pairs & np.uint64(0xFFFF)).astype(np.uint16))))
+
+
+def control_name(control):
+    """zx..no bits of control, with the comp mnemonic if there is one"""
+    bits = format(control, '06b')
+    return '%s (%s)' % (bits, control_mnemonics[control]) if control in control_mnemonics else bits
+
+
+class ALUChecker(object):
+    """Compares the ALU netlist with reference_alu. batch operand pairs are evaluated at a
+    time.
+    """
+    def __init__(self, netlist, batch=65536):
+        if np is None:
+            raise Exception('ALUChecker requires NumPy')
+        for pin in ('x', 'y', 'zx', 'nx', 'zy', 'ny', 'f', 'no'):
+            if pin not in netlist.inputs:
+                raise Exception('%s has no input pin %s' % (netlist.name, pin))
+        self.chip = hdl.BitslicedChip(netlist, 'numpy')
+        self.batch = batch
+
+    def evaluate(self, x, y, control):
+        """Arrays (out, zr, ng) of the chip for the operand arrays x and y"""
+        x_slices = hdl.pack_lanes(x, 16)
+        y_slices = hdl.pack_lanes(y, 16)
+        return self.evaluate_slices(x_slices, y_slices, control, len(x))
+
+    def evaluate_slices(self, x_slices, y_slices, control, count):
+        ones = np.full(len(x_slices[0]), 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+        zeros = np.zeros(len(x_slices[0]), dtype=np.uint64)
+        slices = {'x': x_slices, 'y': y_slices}
+        for i, pin in enumerate(('zx', 'nx', 'zy', 'ny', 'f', 'no')):
+            slices[pin] = [ones if (control >> (5 - i)) & 1 else zeros]
+        outputs = self.chip.evaluate_slices(slices, count)
+        return tuple(hdl.unpack_lanes(outputs[pin], count).astype(np.uint16) if pin in outputs
+                     else np.zeros(count, dtype=np.uint16) for pin in ('out', 'zr', 'ng'))
+
+    def mismatches(self, x, y, control):
+        """Boolean array of the pairs on which the chip and the reference differ"""
+        got = self.evaluate(x, y, control)
+        expected = reference_alu(x, y, control)
+        return (got[0] != expected[0]) | (got[1] != expected[1]) | (got[2] != expected[2])
+
+    def shrink(self, x, y, control):
+        """A counterexample with as few bits set as clearing single bits of the failing
+        pair (x, y) reaches
+        """
+        while True:
+            candidates = [(x & ~(1 << bit), y) for bit in range(16) if x >> bit & 1]
+            candidates += [(x, y & ~(1 << bit)) for bit in range(16) if y >> bit & 1]
+            if not candidates:
+                return x, y
+            xs = np.array([c[0] for c in candidates], dtype=np.uint16)
+            ys = np.array([c[1] for c in candidates], dtype=np.uint16)
+            failing = np.flatnonzero(self.mismatches(xs, ys, control))
+            if not len(failing):
+                return x, y
+            x, y = candidates[failing[0]]
+
+    def check(self, x, y, controls=range(64), limit=1):
+        """Check every control on the operand arrays x and y. Returns a list of
+        (control, x, y, (out, zr, ng) got, (out, zr, ng) expected) with up to limit
+        shrunk counterexamples per failing control, and the number of pairs that failed.
+        """
+        failures = []
+        failed = 0
+        for start in range(0, len(x), self.batch):
+            xb, yb = x[start:start + self.batch], y[start:start + self.batch]
+            x_slices = hdl.pack_lanes(xb, 16)
+            y_slices = hdl.pack_lanes(yb, 16)
+            for control in controls:
+                got = self.evaluate_slices(x_slices, y_slices, control, len(xb))
+                expected = reference_alu(xb, yb, control)
+                wrong = np.flatnonzero((got[0] != expected[0]) | (got[1] != expected[1]) | (got[2] != expected[2]))
+                failed += len(wrong)
+                reported = sum(1 for failure in failures if failure[0] == control)
+                for i in wrong[:max(0, limit - reported)]:
+                    fx, fy = self.shrink(int(xb[i]), int(yb[i]), control)
+                    pair = (np.array([fx], dtype=np.uint16), np.array([fy], dtype=np.uint16))
+                    failures.append((control, fx, fy,
+                                     tuple(int(value[0]) for value in self.evaluate(pair[0], pair[1], control)),
+                                     tuple(int(value[0]) for value in reference_alu(pair[0], pair[1], control))))
+        return failures, failed
+
+
+def check_alu_file(file_name, samples=1 << 20, seed=0):
+    """Check the ALU in an .hdl file on operand_grid(samples, seed) and print the result"""
+    netlist = hdl.Netlist(os.path.splitext(os.path.basename(file_name))[0],
+                          os.path.dirname(os.path.abspath(file_name)))
+    checker = ALUChecker(netlist)
+    x, y = operand_grid(samples, seed)
+    start = time.time()
+    failures, failed = checker.check(x, y)
+    elapsed = time.time() - start
+    for control, fx, fy, got, expected in failures:
+        print('%s  x = %d (0x%04X), y = %d (0x%04X): out, zr, ng = %d, %d, %d, expected %d, %d, %d' % (
+            (control_name(control), fx, fx, fy, fy) + got + expected))
+    print('%s: 64 controls x %d operand pairs, %d mismatches (%.2f s)' % (netlist.name, len(x), failed, elapsed))
+    return not failed
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 1:
+        print("Usage: Python alu_check.py file-name.hdl [samples] [seed]")
+        print("Checks the ALU chip against the reference model for all 64 controls, on every pair of")
+        print("edge values and samples (default 1048576) random operand pairs")
+        print("Example: Python alu_check.py ALU/ALU.hdl")
+    else:
+        samples = int(args[1]) if len(args) > 1 else 1 << 20
+        seed = int(args[2]) if len(args) > 2 else 0
+        sys.exit(0 if check_alu_file(args[0], samples, seed) else 1)
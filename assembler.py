@@ -5,8 +5,14 @@
 Student name(s): Zach Hammad
 """
 
+import json
 import os
 import sys
+import time
+from array import array
+from collections import OrderedDict
+
+import hack_binary
 
 """The comp field is a c1 c2 c3 c4 c5 c6"""
 valid_comp_patterns = {'0':'0101010', 
@@ -88,6 +94,141 @@ symbol_table = {'SP':0,
                 'KBD':24576
                 }
 
+"""Copy of the predefined symbols that every program starts from"""
+predefined_symbols = dict(symbol_table)
+
+"""Instruction kinds stored in the intermediate representation"""
+KIND_A_NUMERIC = 0
+KIND_A_SYMBOL = 1
+KIND_C = 2
+KIND_PSEUDO = 3
+
+"""Mnemonics are stored as small indices into these lists"""
+comp_mnemonics = list(valid_comp_patterns)
+dest_mnemonics = list(valid_dest_patterns)
+jmp_mnemonics = list(valid_jmp_patterns)
+comp_index = {m: i for i, m in enumerate(comp_mnemonics)}
+dest_index = {m: i for i, m in enumerate(dest_mnemonics)}
+jmp_index = {m: i for i, m in enumerate(jmp_mnemonics)}
+
+
+def pack_fields(comp, dest, jmp):
+    """Pack the comp, dest and jmp mnemonics of a C-instruction into one small integer"""
+    return (comp_index[comp] << 6) | (dest_index[dest] << 3) | jmp_index[jmp]
+
+
+def unpack_fields(code):
+    """Return the (comp, dest, jmp) mnemonics packed by pack_fields()"""
+    return comp_mnemonics[code >> 6], dest_mnemonics[(code >> 3) & 7], jmp_mnemonics[code & 7]
+
+
+def encode_c_instruction(code):
+    """Return the 16-bit machine code of a C-instruction from its packed fields"""
+    comp, dest, jmp = unpack_fields(code)
+    return '111' + valid_comp_patterns[comp] + valid_dest_patterns[dest] + valid_jmp_patterns[jmp]
+
+
+def pack_command(s):
+    """Pack a parsed command into a (kind, value, code) tuple.
+    value holds the constant of a numeric A-instruction and the symbol name of a 
+    symbolic A-instruction or label; code holds the packed fields of a C-instruction. 
+    Returns None for an empty command.
+    """
+    if s['instruction_type'] == 'A_INSTRUCTION':
+        if s['value'].isdigit():
+            return (KIND_A_NUMERIC, int(s['value']), 0)
+        return (KIND_A_SYMBOL, s['value'], 0)
+    if s['instruction_type'] == 'C_INSTRUCTION':
+        return (KIND_C, 0, pack_fields(s['comp'], s['dest'], s['jmp']))
+    if s['instruction_type'] == 'PSEUDO_INSTRUCTION':
+        return (KIND_PSEUDO, s['value'], 0)
+    return None
+
+
+class IntermediateRepresentation(object):
+    """Compact struct-of-arrays intermediate representation.
+    
+    Each instruction takes one entry in a handful of typed arrays instead of a 
+    dictionary of its own. Symbol names are interned in the operands table and 
+    referred to by index from the values array.
+    
+    Indexing or iterating yields the same dictionaries that parse() returns, so the 
+    print helpers and valid_tokens work on it unchanged.
+    """
+    def __init__(self, commands=None):
+        self.kinds = array('B')
+        self.values = array('q')
+        self.codes = array('H')
+        self.operands = []
+        self.operand_index = {}
+        self._append_kind = self.kinds.append
+        self._append_value = self.values.append
+        self._append_code = self.codes.append
+        if commands is not None:
+            for s in commands:
+                self.append(s)
+    
+    def intern(self, symbol):
+        """Return the index of symbol in the operands table, adding it if necessary"""
+        index = self.operand_index.get(symbol)
+        if index is None:
+            index = len(self.operands)
+            self.operand_index[symbol] = index
+            self.operands.append(symbol)
+        return index
+    
+    def append(self, s):
+        """Append a command in the dictionary form returned by parse()"""
+        packed = pack_command(s)
+        if packed is not None:
+            self.append_packed(packed)
+    
+    def append_packed(self, packed):
+        """Append a command in the tuple form returned by pack_command()"""
+        kind, value, code = packed
+        if kind == KIND_A_SYMBOL or kind == KIND_PSEUDO:
+            index = self.operand_index.get(value)
+            value = self.intern(value) if index is None else index
+        self._append_kind(kind)
+        self._append_value(value)
+        self._append_code(code)
+    
+    def __len__(self):
+        return len(self.kinds)
+    
+    def __getitem__(self, i):
+        s = {}
+        s['instruction_type'] = ''
+        s['value'] = ''
+        s['value_type'] = ''
+        s['dest'] = ''
+        s['comp'] = ''
+        s['jmp'] = ''
+        s['status'] = 0
+        
+        kind = self.kinds[i]
+        if kind == KIND_A_NUMERIC:
+            s['instruction_type'] = 'A_INSTRUCTION'
+            s['value_type'] = 'NUMERIC'
+            s['value'] = str(self.values[i])
+        elif kind == KIND_A_SYMBOL:
+            s['instruction_type'] = 'A_INSTRUCTION'
+            s['value_type'] = 'SYMBOL'
+            s['value'] = self.operands[self.values[i]]
+        elif kind == KIND_PSEUDO:
+            s['instruction_type'] = 'PSEUDO_INSTRUCTION'
+            s['value_type'] = 'SYMBOL'
+            s['value'] = self.operands[self.values[i]]
+        else:
+            s['instruction_type'] = 'C_INSTRUCTION'
+            s['comp'], s['dest'], s['jmp'] = unpack_fields(self.codes[i])
+        return s
+    
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+
 def print_intermediate_representation(ir):
     """Print intermediate representation"""
     
@@ -224,41 +365,194 @@ def parse(command):
     s['status'] = -1
     return s
 
-   
-def generate_machine_code(commands):
-    machine_code = []
-    next_free_ram_address = 16  # Start RAM address for variables
 
-    # Pass 1: Address resolution
+def parse_packed(command):
+    """Same automaton as parse(), but returns the (kind, value, code) tuple 
+    of pack_command() directly, without building the dictionary. Returns None for 
+    empty commands and for commands that parse() marks with status -1.
+    """
+    if '//' in command:
+        command = command.split("//")[0]
+    command = command.strip()
+
+    if not command:
+        return None
+
+    # A-instruction
+    if command[0] == '@':
+        value = command[1:]
+        if value[0].isalpha() or value[0] in '_.$:':
+            return (KIND_A_SYMBOL, value, 0)
+        elif value.isdigit():
+            return (KIND_A_NUMERIC, int(value), 0)
+        elif value.isnumeric():
+            return (KIND_A_SYMBOL, value, 0)
+        return None
+
+    # Pseudo-instruction
+    if command[0] == '(' and command[-1] == ')':
+        return (KIND_PSEUDO, command[1:-1], 0)
+
+    # C-instruction and J-instruction
+    dest = comp = jmp = ''
+    if '=' in command:
+        parts = command.split('=')
+        dest = parts[0].strip()
+        comp = parts[1].split(';')[0].strip().replace(" ", "")
+        if ';' not in parts[1]:
+            jmp = 'null'
+    elif ';' in command:
+        parts = command.split(';')
+        comp = parts[0].strip()
+        jmp = parts[1].strip()
+        dest = 'null'
+    return (KIND_C, 0, pack_fields(comp, dest, jmp))
+
+
+
+class ParseCache(object):
+    """Bounded LRU cache from source line to its parsed form.
+    
+    Translator output repeats the same few lines (@SP, A = M, M = M + 1, ...) over 
+    and over, so most lines are found here instead of being scanned again. Each entry 
+    holds the packed command from parse_packed() and, when no symbol is involved, 
+    the final 16-bit machine code. Keys are lines with the surrounding white space 
+    already stripped.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def lookup(self, line):
+        """Return (packed command, machine code or None) for line"""
+        entry = self.entries.get(line)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(line)
+            return entry
+        
+        self.misses += 1
+        packed = parse_packed(line)
+        code = None
+        if packed is not None:
+            if packed[0] == KIND_A_NUMERIC:
+                code = '0' + format(packed[1], '015b')
+            elif packed[0] == KIND_C:
+                code = encode_c_instruction(packed[2])
+        entry = (packed, code)
+        
+        self.entries[line] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)   # Evict the least recently used line
+        return entry
+    
+    def parse(self, line):
+        """Cached equivalent of parse_packed()"""
+        return self.lookup(line)[0]
+    
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def stats(self):
+        """Return hit-rate statistics as a dictionary"""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate(),
+                'size': len(self.entries),
+                'maxsize': self.maxsize}
+    
+    def clear(self):
+        """Drop all entries and reset the statistics"""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+"""Parse cache shared by the assemblers in this module"""
+parse_cache = ParseCache()
+
+   
+def resolve_labels(commands, table):
+    """Pass 1 of code generation: add the ROM address of every label in the 
+    IntermediateRepresentation commands to table. Returns the number of labels.
+    """
+    kinds = commands.kinds
+    values = commands.values
+    operands = commands.operands
+    
     rom_address = 0
-    for command in commands:
-        if command['instruction_type'] == 'PSEUDO_INSTRUCTION':
-            symbol_table[command['value']] = rom_address
+    labels = 0
+    for i, kind in enumerate(kinds):
+        if kind == KIND_PSEUDO:
+            table[operands[values[i]]] = rom_address
+            labels += 1
         else:
             rom_address += 1
+    return labels
 
-    # Pass 2: Code translation
-    for command in commands:
-        if command['instruction_type'] == 'A_INSTRUCTION':
-            value = command['value']
-            
-            if value.isdigit():  # Numeric address
-                address = int(value)
-            elif value in symbol_table:  # Label or previously seen variable
-                address = symbol_table[value]
-            else:  # New variable
-                address = next_free_ram_address
-                symbol_table[value] = address
-                next_free_ram_address += 1
-            
-            machine_code.append('0' + format(address, '015b'))
 
-        elif command['instruction_type'] == 'C_INSTRUCTION':
-            comp = valid_comp_patterns[command['comp']]
-            dest = valid_dest_patterns[command['dest']]
-            jmp = valid_jmp_patterns[command['jmp']]
-            machine_code.append('111' + comp + dest + jmp)
+def translate(commands, table):
+    """Pass 2 of code generation: translate the IntermediateRepresentation commands to 
+    machine code, allocating variables in table. Returns (machine code, variables allocated).
+    """
+    machine_code = []
+    next_free_ram_address = 16  # Start RAM address for variables
+    kinds = commands.kinds
+    values = commands.values
+    operands = commands.operands
+    codes = commands.codes
+    c_codes = {}                               # Encoded C-instruction per packed code
+    operand_codes = [None] * len(operands)     # Encoded A-instruction per symbol
+    
+    for i, kind in enumerate(kinds):
+        if kind == KIND_A_SYMBOL:
+            code = operand_codes[values[i]]
+            if code is None:
+                value = operands[values[i]]
+                if value in table:  # Label or previously seen variable
+                    address = table[value]
+                else:  # New variable
+                    address = next_free_ram_address
+                    table[value] = address
+                    next_free_ram_address += 1
+                code = '0' + format(address, '015b')
+                operand_codes[values[i]] = code
+            machine_code.append(code)
+        
+        elif kind == KIND_A_NUMERIC:  # Numeric address
+            machine_code.append('0' + format(values[i], '015b'))
+
+        elif kind == KIND_C:
+            code = c_codes.get(codes[i])
+            if code is None:
+                code = encode_c_instruction(codes[i])
+                c_codes[codes[i]] = code
+            machine_code.append(code)
             
+    return machine_code, next_free_ram_address - 16
+
+
+def generate_machine_code(commands, table=None):
+    """Translate the intermediate representation to machine code. 
+    commands may also be a list of dictionaries as returned by parse().
+    
+    Labels and variables are added to table, which defaults to a fresh copy of the 
+    predefined symbols.
+    """
+    if not isinstance(commands, IntermediateRepresentation):
+        commands = IntermediateRepresentation(commands)
+    if table is None:
+        table = dict(predefined_symbols)
+    
+    # Pass 1: Address resolution
+    resolve_labels(commands, table)
+    
+    # Pass 2: Code translation
+    machine_code, _ = translate(commands, table)
     return machine_code
 
     
@@ -272,26 +566,242 @@ def print_machine_code(machine_code):
         rom_address = rom_address + 1
 
 
-def run_assembler(file_name):      
-    """Pass 1: Parse the assembly code into an intermediate data structure.
-    The intermediate data structure can be a list of elements, called ir, where 
-    each element is a dictionary with the following structure: 
+def read_commands(file_name, cache=None):
+    """Generator that yields (packed command, machine code or None) pairs from file_name 
+    one line at a time, so the whole program never has to be held in memory.
+    """
+    if cache is None:
+        cache = parse_cache
+    lookup = cache.lookup
     
-    s['instruction_type'] = ''
-    s['value'] = ''
-    s['value_type'] = ''
-    s['dest'] = ''
-    s['comp'] = ''
-    s['jmp'] = ''
-    s['status'] = 0
+    with open(file_name, 'r') as f:
+        for line in f:
+            line = line.strip()  # Remove white spaces
+            
+            # Ignore empty lines and comments
+            if not line or line[:2] == "//":
+                continue
+            
+            entry = lookup(line)
+            if entry[0] is not None:  # Successful parsing
+                yield entry
+
+
+def run_assembler_streaming(file_name, output_file, cache=None):
+    """Single-pass assembler that writes machine code to output_file as it goes.
+    
+    A-instructions that refer to symbols not yet defined are written as 16-bit placeholders 
+    and backpatched in place, by file offset, once the whole file has been read. Only the forward 
+    references are kept in memory, so peak memory stays flat as the input grows.
+    
+    Labels resolve to the same addresses, and variables are allocated from RAM 16 upward 
+    in the same order of first use, as in run_assembler. Returns the number of words written.
+    """
+    table = dict(predefined_symbols)
+    forward_references = {}     # Symbol -> file offsets waiting for it, in order of first use
+    rom_address = 0
+    offset = 0
+    
+    with open(output_file, 'wb+') as out:
+        for (kind, value, fields), code in read_commands(file_name, cache):
+            if kind == KIND_PSEUDO:
+                table[value] = rom_address
+                continue
+            
+            if kind == KIND_A_SYMBOL:
+                if value in table:  # Label defined above or predefined symbol
+                    address = table[value]
+                else:  # Label defined further down, or a variable
+                    forward_references.setdefault(value, []).append(offset)
+                    address = 0
+                code = '0' + format(address, '015b')
+            
+            out.write(code.encode('ascii') + b'\n')
+            offset += len(code) + 1
+            rom_address += 1
+        
+        # Backpatch: whatever is still undefined is a variable
+        next_free_ram_address = 16
+        wide_patches = []
+        for value, addresses in forward_references.items():
+            if value in table:
+                address = table[value]
+            else:
+                address = next_free_ram_address
+                table[value] = address
+                next_free_ram_address += 1
+            
+            code = ('0' + format(address, '015b')).encode('ascii')
+            for patch_offset in addresses:
+                if len(code) == 16:
+                    out.seek(patch_offset)
+                    out.write(code)
+                else:
+                    wide_patches.append((patch_offset, code))
+    
+    # Addresses past 15 bits do not fit the placeholder, so splice them in with a copy
+    if wide_patches:
+        splice_patches(output_file, sorted(wide_patches))
     
-    The symbol table is also generated in this step.    
+    return rom_address
+
+
+def splice_patches(file_name, patches):
+    """Replace the 16-byte placeholders at the given (offset, code) pairs with 
+    codes of a different width, copying the file through in order.
     """
-    intermediate_representation = []
+    temp_file = file_name + '.tmp'
+    with open(file_name, 'rb') as src, open(temp_file, 'wb') as dst:
+        position = 0
+        for patch_offset, code in patches:
+            dst.write(src.read(patch_offset - position))
+            dst.write(code)
+            src.seek(16, 1)
+            position = patch_offset + 16
+        while True:
+            block = src.read(1 << 20)
+            if not block:
+                break
+            dst.write(block)
+    os.replace(temp_file, file_name)
+
+
+def scan_chunk(lines):
+    """Worker for run_assembler_parallel: parse a chunk of source lines and discover its labels.
+    
+    Returns (labels, count, symbols) where labels maps each label to its ROM offset 
+    within the chunk, count is the number of instructions in the chunk, and symbols 
+    lists the symbolic A-instruction operands in order of first use.
+    """
+    labels = {}
+    symbols = {}
+    count = 0
+    parse_line = parse_cache.parse
+    for line in lines:
+        line = line.strip()
+        if not line or line[:2] == "//":
+            continue
+        
+        packed_command = parse_line(line)
+        if packed_command is None:
+            continue
+        kind = packed_command[0]
+        if kind == KIND_PSEUDO:
+            labels[packed_command[1]] = count
+            continue
+        if kind == KIND_A_SYMBOL and packed_command[1] not in symbols:
+            symbols[packed_command[1]] = None
+        count += 1
+    return labels, count, list(symbols)
+
+
+def encode_chunk(lines, table):
+    """Worker for run_assembler_parallel: translate a chunk of source lines to machine code.
+    table must resolve every symbol the chunk refers to.
+    """
+    machine_code = []
+    lookup = parse_cache.lookup
+    for line in lines:
+        line = line.strip()
+        if not line or line[:2] == "//":
+            continue
+        
+        packed_command, code = lookup(line)
+        if packed_command is None or packed_command[0] == KIND_PSEUDO:
+            continue
+        if code is None:
+            code = '0' + format(table[packed_command[1]], '015b')
+        machine_code.append(code)
+    return machine_code
+
+
+def run_assembler_parallel(file_name, workers=None, chunks_per_worker=4):
+    """Assemble file_name with a pool of worker processes.
+    
+    The source is split into chunks of lines. In the first round the workers parse 
+    their chunks and report local labels, instruction counts and symbols used; the 
+    label tables are merged here with each chunk's ROM offset, and variables are 
+    allocated from RAM 16 upward in order of first use across the chunks, exactly as 
+    run_assembler does. In the second round the workers encode their chunks against 
+    the merged table. The machine code is identical to run_assembler's.
+    """
+    from concurrent.futures import ProcessPoolExecutor
     
-    # Pass 1: Parse the assembly code to generate the intermediate data structure
     with open(file_name, 'r') as f:
-        for line in f:
+        lines = f.readlines()
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunk_size = max(1, -(-len(lines) // (workers * chunks_per_worker)))
+    chunks = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Round 1: parsing and label discovery
+        scanned = list(executor.map(scan_chunk, chunks))
+        
+        # Merge label tables, offsetting each chunk by the instructions before it
+        table = dict(predefined_symbols)
+        rom_address = 0
+        for labels, count, _ in scanned:
+            for label, offset in labels.items():
+                table[label] = rom_address + offset
+            rom_address += count
+        
+        # Allocate variables in order of first use
+        next_free_ram_address = 16
+        for _, _, symbols in scanned:
+            for symbol in symbols:
+                if symbol not in table:
+                    table[symbol] = next_free_ram_address
+                    next_free_ram_address += 1
+        
+        # Round 2: encoding, with only the symbols each chunk needs
+        tables = [{symbol: table[symbol] for symbol in symbols} for _, _, symbols in scanned]
+        machine_code = []
+        for codes in executor.map(encode_chunk, chunks, tables):
+            machine_code.extend(codes)
+    
+    return machine_code
+
+
+class Assembler(object):
+    """Reusable assembler.
+    
+    Each instance owns its symbol table, which starts every program as a copy of the 
+    predefined symbols, so one instance can assemble any number of files in the same 
+    process without labels or variables leaking from one into the next.
+    
+    With optimize set, the peephole optimizer runs between parsing and code generation 
+    and its statistics are kept in optimizer_stats.
+    
+    Every assembly also records wall time per phase and counters in stats; see 
+    run_assembler_with_stats for the fields.
+    
+    With source_map set, rom_lines records the source line number (from 1) of the 
+    instruction at each ROM address and labels the address of each label; see 
+    write_source_map. The peephole optimizer 
+    rewrites instructions, so the two cannot be combined.
+    """
+    def __init__(self, cache=None, optimize=False, source_map=False):
+        if cache is None:
+            cache = parse_cache
+        if optimize and source_map:
+            raise Exception('A source map cannot be generated for optimized code')
+        self.cache = cache
+        self.optimize = optimize
+        self.source_map = source_map
+        self.optimizer_stats = None
+        self.symbol_table = dict(predefined_symbols)
+        self.stats = None
+        self.rom_lines = None
+        self.labels = None
+    
+    def parse_lines(self, lines):
+        """Parse source lines into an IntermediateRepresentation"""
+        intermediate_representation = IntermediateRepresentation()
+        parse_line = self.cache.parse
+        line_numbers = array('I')
+        for number, line in enumerate(lines, 1):
             line = line.strip()  # Remove white spaces
             
             # Ignore empty lines and comments
@@ -299,39 +809,245 @@ def run_assembler(file_name):
                 continue
             
             # Parse the command and append to intermediate representation
-            parsed_command = parse(line)
-            if parsed_command['status'] == 0:  # Successful parsing
-                intermediate_representation.append(parsed_command)
+            packed_command = parse_line(line)
+            if packed_command is not None:  # Successful parsing
+                intermediate_representation.append_packed(packed_command)
+                if self.source_map:
+                    line_numbers.append(number)
+        
+        if self.source_map:  # Labels take no ROM address
+            kinds = intermediate_representation.kinds
+            self.rom_lines = array('I', [number for number, kind in zip(line_numbers, kinds) 
+                                         if kind != KIND_PSEUDO])
+        return intermediate_representation
+    
+    def assemble_lines(self, lines):
+        """Assemble source lines and return the machine code"""
+        phases = {}
+        hits, misses = self.cache.hits, self.cache.misses
+        
+        start = time.perf_counter()
+        intermediate_representation = self.parse_lines(lines)
+        phases['parse'] = time.perf_counter() - start
+        
+        if self.optimize:
+            import peephole
+            start = time.perf_counter()
+            intermediate_representation, self.optimizer_stats = peephole.optimize(intermediate_representation)
+            phases['optimize'] = time.perf_counter() - start
+        
+        self.symbol_table = dict(predefined_symbols)
+        start = time.perf_counter()
+        labels = resolve_labels(intermediate_representation, self.symbol_table)
+        phases['resolve'] = time.perf_counter() - start
+        if self.source_map:
+            operands = intermediate_representation.operands
+            values = intermediate_representation.values
+            self.labels = dict((operands[values[i]], self.symbol_table[operands[values[i]]]) 
+                               for i, kind in enumerate(intermediate_representation.kinds) 
+                               if kind == KIND_PSEUDO)
+        
+        start = time.perf_counter()
+        machine_code, variables = translate(intermediate_representation, self.symbol_table)
+        if self.optimize:   # allocated by the optimizer
+            self.symbol_table.update(self.optimizer_stats['variables'])
+            variables += len(self.optimizer_stats['variables'])
+        phases['encode'] = time.perf_counter() - start
+        
+        kinds = intermediate_representation.kinds
+        self.stats = {'phases': phases,
+                      'instructions': {'a_numeric': kinds.count(KIND_A_NUMERIC),
+                                       'a_symbol': kinds.count(KIND_A_SYMBOL),
+                                       'c': kinds.count(KIND_C),
+                                       'labels': labels},
+                      'words': len(machine_code),
+                      'symbols': len(self.symbol_table),
+                      'variables': variables,
+                      'parse_cache': {'hits': self.cache.hits - hits, 
+                                      'misses': self.cache.misses - misses},
+                      'optimizer': self.optimizer_stats if self.optimize else None}
+        return machine_code
+    
+    def assemble_file(self, file_name):
+        """Assemble file_name and return the machine code"""
+        start = time.perf_counter()
+        with open(file_name, 'r') as f:
+            lines = f.read().splitlines()
+        read_time = time.perf_counter() - start
+        
+        machine_code = self.assemble_lines(lines)
+        self.stats['file'] = file_name
+        self.stats['lines'] = len(lines)
+        phases = {'read': read_time}
+        phases.update(self.stats['phases'])
+        self.stats['phases'] = phases
+        return machine_code
+    
+    def write_output(self, machine_code, output_file, binary=False):
+        """Write machine code to output_file, as text or in the packed binary format"""
+        start = time.perf_counter()
+        if binary:
+            hack_binary.write_binary(output_file, hack_binary.words_from_machine_code(machine_code))
+        else:
+            with open(output_file, 'w') as f:
+                for s in machine_code:
+                    f.write('%s\n' %s)
+        
+        if self.stats is not None:
+            self.stats['phases']['write'] = self.stats['phases'].get('write', 0.0) + time.perf_counter() - start
+            self.stats['bytes_written'] = self.stats.get('bytes_written', 0) + os.path.getsize(output_file)
+    
+    def write_source_map(self, map_file, source_file):
+        """Write the source map of the last assembly to map_file as JSON: 
+        
+        source      the assembly file, source_file
+        lines       source line number of the instruction at each ROM address
+        labels      ROM address of each label
+        
+        The profiler uses it to map ROM addresses back to assembly and VM lines.
+        """
+        if self.rom_lines is None:
+            raise Exception('No source map: the Assembler was created without source_map')
+        with open(map_file, 'w') as f:
+            json.dump({'source': source_file, 'lines': list(self.rom_lines), 
+                       'labels': self.labels}, f)
 
-    # Convert the intermediate representation to machine code
-    machine_code = generate_machine_code(intermediate_representation)
 
-    return machine_code
+def run_assembler_with_stats(file_name, output_file=None, optimize=False, cache=None):
+    """Assemble file_name, optionally writing the machine code to output_file, and 
+    return (machine_code, stats). stats is a dictionary with:
+    
+    stats['file'], stats['lines']       source file and its number of lines
+    stats['phases']                     wall time in seconds of read, parse, optimize 
+                                        (if enabled), resolve, encode and write
+    stats['total']                      sum of the phase times
+    stats['instructions']               counts of a_numeric, a_symbol and c instructions 
+                                        and of labels
+    stats['words']                      machine code words generated
+    stats['symbols'], stats['variables']   symbol table size and variables allocated
+    stats['bytes_written']              size of output_file, 0 without one
+    stats['parse_cache']                parse cache hits and misses for this file
+    stats['optimizer']                  peephole optimizer statistics, or None
+    stats['words_per_second']           throughput over the total time
+    """
+    asm = Assembler(cache, optimize)
+    machine_code = asm.assemble_file(file_name)
+    asm.stats['bytes_written'] = 0
+    if output_file is not None:
+        asm.write_output(machine_code, output_file)
+    return machine_code, finish_stats(asm.stats)
+
+
+def finish_stats(stats):
+    """Add the total time and throughput to Assembler.stats and return it"""
+    stats.setdefault('bytes_written', 0)
+    stats['total'] = sum(stats['phases'].values())
+    stats['words_per_second'] = stats['words'] / stats['total'] if stats['total'] else 0.0
+    return stats
+
+
+def format_stats(stats):
+    """Human-readable summary of run_assembler_with_stats statistics"""
+    lines = ['Phase times (ms):']
+    for phase, seconds in stats['phases'].items():
+        lines.append('    %-10s %10.3f' % (phase, 1000 * seconds))
+    lines.append('    %-10s %10.3f' % ('total', 1000 * stats['total']))
+    lines.append('Instructions: %d A (numeric), %d A (symbolic), %d C, %d labels' % 
+                 (stats['instructions']['a_numeric'], stats['instructions']['a_symbol'], 
+                  stats['instructions']['c'], stats['instructions']['labels']))
+    lines.append('Symbols: %d, variables allocated: %d' % (stats['symbols'], stats['variables']))
+    lines.append('Words: %d, bytes written: %d, %.0f words/s' % 
+                 (stats['words'], stats['bytes_written'], stats['words_per_second']))
+    return '\n'.join(lines)
+
+
+def run_assembler(file_name, cache=None, optimize=False):      
+    """Pass 1: Parse the assembly code into an intermediate data structure.
+    Each command is parsed into a dictionary with the following structure: 
+    
+    s['instruction_type'] = ''
+    s['value'] = ''
+    s['value_type'] = ''
+    s['dest'] = ''
+    s['comp'] = ''
+    s['jmp'] = ''
+    s['status'] = 0
+    
+    but here each command goes straight into an IntermediateRepresentation through 
+    parse_packed(), which keeps the fields in typed arrays so that large programs do not 
+    allocate one dictionary per line. Repeated lines are looked up in cache, 
+    a ParseCache that defaults to the module-wide parse_cache.
+    
+    The symbol table is also generated in this step, in a fresh Assembler, so 
+    consecutive calls do not see each other's labels and variables. With optimize set, 
+    the peephole optimizer runs before code generation.
+    """
+    return Assembler(cache, optimize).assemble_file(file_name)
     
   
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: Python assembler.py file-name.asm")
+    argv = sys.argv[1:]
+    stats_format = None
+    if '--stats' in argv:  # --stats takes a value: json or text
+        i = argv.index('--stats')
+        stats_format = argv[i + 1] if i + 1 < len(argv) else 'text'
+        del argv[i:i + 2]
+    options = [arg for arg in argv if arg.startswith('--')]
+    args = [arg for arg in argv if not arg.startswith('--')]
+    if len(args) < 1 or stats_format not in (None, 'json', 'text'):
+        print("Usage: Python assembler.py [--stream | --parallel | --optimize] [--binary] [--map] [--stats json|text] file-name.asm")
+        print("--stream: assemble in a single pass, writing the output as it goes")
+        print("--parallel: parse and encode chunks of the file in worker processes")
+        print("--binary: also write the packed binary image file-name.hackb")
+        print("--optimize: run the peephole optimizer before generating code")
+        print("--map: also write the source map file-name.map (ROM address to source line) for the profiler")
+        print("--stats json|text: report per-phase timings and counters; json is printed as the last line")
         print("Example: Python assembler.py mult.asm")
     else:
-        print("Assembling file:", sys.argv[1])
+        print("Assembling file:", args[0])
         print()
-        file_name_minus_extension, _ = os.path.splitext(sys.argv[1])
+        file_name_minus_extension, _ = os.path.splitext(args[0])
         output_file = file_name_minus_extension + '.hack'
-        machine_code = run_assembler(sys.argv[1])
-        if machine_code:
-            print('Machine code generated successfully');
+        asm = None
+        if len([option for option in ('--stream', '--parallel', '--optimize') if option in options]) > 1:
+            print('--stream, --parallel and --optimize cannot be combined')
+        elif '--map' in options and ('--stream' in options or '--parallel' in options or '--optimize' in options):
+            print('--map is only available for the default mode')
+        elif '--stream' in options:
             print('Writing output to file:', output_file)
-            f = open(output_file, 'w')
-            for s in machine_code:
-                f.write('%s\n' %s)
-            f.close()
+            count = run_assembler_streaming(args[0], output_file)
+            print('Machine code generated successfully:', count, 'words')
+            if '--binary' in options:
+                print('Writing binary image to file:', file_name_minus_extension + '.hackb')
+                hack_binary.text_to_binary(output_file, file_name_minus_extension + '.hackb')
         else:
-            print('Error generating machine code')
-            
-        
-
-    
-    
-    
-    
+            asm = Assembler(optimize='--optimize' in options, source_map='--map' in options)
+            if '--parallel' in options:
+                machine_code = run_assembler_parallel(args[0])
+            else:
+                machine_code = asm.assemble_file(args[0])
+            if machine_code:
+                print('Machine code generated successfully');
+                print('Writing output to file:', output_file)
+                asm.write_output(machine_code, output_file)
+                if '--binary' in options:
+                    print('Writing binary image to file:', file_name_minus_extension + '.hackb')
+                    asm.write_output(machine_code, file_name_minus_extension + '.hackb', binary=True)
+                if '--map' in options:
+                    print('Writing source map to file:', file_name_minus_extension + '.map')
+                    asm.write_source_map(file_name_minus_extension + '.map', args[0])
+            else:
+                print('Error generating machine code')
+            if asm.optimizer_stats:
+                print('Optimizer: %d -> %d instructions' % (asm.optimizer_stats['instructions_before'], asm.optimizer_stats['instructions_after']))
+                for name, count in asm.optimizer_stats['rules'].items():
+                    print('    %-20s %d' % (name, count))
+        stats = parse_cache.stats()
+        print('Parse cache: %d hits, %d misses (%.1f%% hit rate)' % (stats['hits'], stats['misses'], 100 * stats['hit_rate']))
+        if stats_format is not None:
+            if asm is None or asm.stats is None:
+                print('--stats is only available for the default and --optimize modes')
+            elif stats_format == 'json':
+                print(json.dumps(finish_stats(asm.stats), sort_keys=True))
+            else:
+                print(format_stats(finish_stats(asm.stats)))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Long-lived assembler service for the Hack processor.
+
+Batch jobs that assemble many files can send them to one resident process instead
+of starting a new interpreter per file. Requests and responses are JSON objects,
+one per line, read from stdin and written to stdout or exchanged over a Unix socket.
+
+Request fields:
+    input      path of the .asm file to assemble, or
+    source     the assembly code itself
+    output     path to write the machine code to (optional); written in the packed
+               binary format if it ends in .hackb
+    
+Response fields:
+    ok         true or false
+    words      number of instructions generated
+    output     the path written, if any
+    machine_code   list of 16-bit strings, when no output path was given
+    error      the error message, when ok is false
+
+Student name(s): Zach Hammad
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+
+import assembler
+import hack_binary
+
+
+def handle_request(asm, request):
+    """Assemble one request with the Assembler asm and return the response"""
+    try:
+        if 'input' in request:
+            machine_code = asm.assemble_file(request['input'])
+        elif 'source' in request:
+            machine_code = asm.assemble_lines(request['source'].splitlines())
+        else:
+            return {'ok': False, 'error': 'Request needs an input or source field'}
+
+        response = {'ok': True, 'words': len(machine_code)}
+        output_file = request.get('output')
+        if output_file:
+            if output_file.endswith('.hackb'):
+                hack_binary.write_binary(output_file, hack_binary.words_from_machine_code(machine_code))
+            else:
+                with open(output_file, 'w') as f:
+                    for s in machine_code:
+                        f.write('%s\n' % s)
+            response['output'] = output_file
+        else:
+            response['machine_code'] = machine_code
+        return response
+    except Exception as e:
+        return {'ok': False, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def serve_stream(infile, outfile, asm=None):
+    """Answer requests read line by line from infile until end of input"""
+    if asm is None:
+        asm = assembler.Assembler()
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'ok': False, 'error': 'Bad request: %s' % e}
+        else:
+            response = handle_request(asm, request)
+        outfile.write(json.dumps(response) + '\n')
+        outfile.flush()
+
+
+class AssemblerRequestHandler(socketserver.StreamRequestHandler):
+    """Serves one connection; a connection may send any number of requests"""
+    def handle(self):
+        infile = (line.decode('utf-8') for line in self.rfile)
+        serve_stream(infile, StreamWriter(self.wfile), self.server.asm)
+
+
+class StreamWriter(object):
+    """Text front end for a binary socket stream"""
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def serve_socket(path):
+    """Serve requests on the Unix socket at path, one connection at a time"""
+    if os.path.exists(path):
+        os.remove(path)
+    server = socketserver.UnixStreamServer(path, AssemblerRequestHandler)
+    server.asm = assembler.Assembler()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def assemble_remote(path, requests):
+    """Client side: send requests to the service at path and return the responses"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        f = sock.makefile('rwb')
+        for request in requests:
+            f.write((json.dumps(request) + '\n').encode('utf-8'))
+        f.flush()
+        sock.shutdown(socket.SHUT_WR)
+        return [json.loads(line.decode('utf-8')) for line in f]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        print("Usage: Python assembler_service.py [--socket path]")
+        print("Without --socket, reads one JSON request per line from stdin and answers on stdout")
+        print('Example request: {"input": "mult.asm", "output": "mult.hack"}')
+    elif len(sys.argv) > 2 and sys.argv[1] == '--socket':
+        serve_socket(sys.argv[2])
+    else:
+        serve_stream(sys.stdin, sys.stdout)
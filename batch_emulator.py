@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""Lockstep emulator that runs one Hack program on many machines at once.
+
+The A, D and PC registers of N machines are NumPy arrays of N words and their RAM is
+a ram_size x N array, so every instruction executes for all machines with a handful
+of vectorized operations instead of N interpreter dispatches. The semantics are those
+of emulator.Emulator.
+
+While the machines run together the value of A is usually the same on all of them (it
+was just loaded by an A-instruction), so M is one contiguous row of the RAM array;
+only when A differs between machines does an access gather and scatter per machine.
+
+Each step groups the running machines by PC. When they all agree, which is the common
+case for data-independent code, the instruction runs on all of them at once; when
+their PCs have diverged (different branches taken on different inputs), it runs once
+per distinct PC on the machines at that PC, which is masked execution.
+
+A machine whose PC reaches one of halt_pcs is retired: it stops executing, the number
+of instructions it executed is recorded in cycles, and it is swapped out of the range
+of slots the instructions operate on, so finished machines cost nothing. Unless
+detect_halts is cleared, the final (END) @END 0;JMP loops that emulator.find_halt_loops
+finds are halt_pcs too, so a batch finishes when its programs do.
+
+ram_size may be reduced to save memory when the program only uses low RAM; an
+access at or above it then raises an exception. Only the full 32768 words include
+the Screen and Keyboard.
+
+Requires NumPy.
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import emulator
+from emulator import KBD, SCREEN, RAM_SIZE
+
+"""Jump conditions on uint16 arrays, by j1 j2 j3"""
+vector_jump_conditions = [None,
+                          '(out != 0) & (out < 0x8000)',
+                          'out == 0',
+                          'out < 0x8000',
+                          'out >= 0x8000',
+                          'out != 0',
+                          '(out == 0) | (out >= 0x8000)',
+                          None]
+
+
+def c_instruction_lines(word, ram_size, known):
+    """Body of op() for C-instruction word, for A known to be the same int k on every
+    selected machine (known set) or per-machine in a (known not set)
+    """
+    control = (word >> 6) & 0x3F
+    dest = (word >> 3) & 7
+    jump = word & 7
+    lines = []
+    if known:
+        y = 'k'
+        target = 'k & 0x7FFF'
+        if word & 0x1000 or dest & 1:
+            lines.append('address = k & 0x7FFF')
+            if ram_size < RAM_SIZE:
+                lines.append('if address >= %d:' % ram_size)
+                lines.append("    raise Exception('RAM access above ram_size %d')" % ram_size)
+        if word & 0x1000:
+            lines.append('m = RAM[address, idx]')
+    else:
+        y = 'a'
+        target = 'a & 0x7FFF'
+        lines.append('a = A[idx]')
+        if word & 0x1000 or dest & 1:
+            lines.append('address = a & 0x7FFF')
+            if ram_size < RAM_SIZE:
+                lines.append('if (address >= %d).any():' % ram_size)
+                lines.append("    raise Exception('RAM access above ram_size %d')" % ram_size)
+            lines.append('columns = COLUMNS[idx]')
+        if word & 0x1000:
+            lines.append('m = RAM[address, columns]')
+    if word & 0x1000:
+        y = 'm'
+
+    out = emulator.alu_expression(control, y)
+    if 'd' in out:
+        lines.append('d = D[idx]')
+    lines.append('out = ' + out)
+    if dest & 1:
+        if known:
+            if ram_size == RAM_SIZE:
+                lines.append('if address >= %d:' % KBD)
+                lines.append('    address = %d | (address & 0x1FFF)' % SCREEN)
+            lines.append('RAM[address, idx] = out')
+        else:
+            if ram_size == RAM_SIZE:
+                lines.append('address = np.where(address >= %d, %d | (address & 0x1FFF), address)' % (KBD, SCREEN))
+            lines.append('RAM[address, columns] = out')
+    if jump == 7:
+        lines.append('PC[idx] = ' + target)
+    elif jump:
+        lines.append('PC[idx] = np.where(%s, %s, pc + 1)' % (vector_jump_conditions[jump], target))
+    else:
+        lines.append('PC[idx] = pc + 1')
+    if dest & 2:
+        lines.append('D[idx] = out')
+    if dest & 4:
+        lines.append('A[idx] = out')
+    return lines
+
+
+def vector_instruction_source(word, ram_size):
+    """Source of a function op(idx, k, pc) executing instruction word at ROM address pc
+    on the machines selected by idx. k is the value of A when it is the same on all of
+    them, and -1 otherwise. The registers are the globals A, D and PC and the RAM is
+    RAM, indexed [address, machine].
+    """
+    lines = ['def op(idx, k, pc):']
+    if word < 32768:
+        lines.append('    A[idx] = %d' % word)
+        lines.append('    PC[idx] = pc + 1')
+        return '\n'.join(lines) + '\n'
+
+    lines.append('    if k >= 0:')
+    lines.extend(['        ' + line for line in c_instruction_lines(word, ram_size, True)])
+    lines.append('    else:')
+    lines.extend(['        ' + line for line in c_instruction_lines(word, ram_size, False)])
+    return '\n'.join(lines) + '\n'
+
+
+def split_groups(slots, pcs, first, same):
+    """Group slots by their pcs into (pc, slots) pairs; same is pcs == first. Peels off a
+    few groups with masks, which is cheaper than sorting when branches split the
+    machines two or three ways, and sorts the rest.
+    """
+    groups = []
+    while len(groups) < 4:
+        groups.append((first, slots[same]))
+        others = ~same
+        slots = slots[others]
+        pcs = pcs[others]
+        if not slots.size:
+            return groups
+        first = int(pcs[0])
+        same = pcs == first
+    values, inverse = np.unique(pcs, return_inverse=True)
+    groups.extend((int(value), slots[inverse == i]) for i, value in enumerate(values))
+    return groups
+
+
+class BatchEmulator(object):
+    """machines Hack computers running the same rom in lockstep.
+
+    Machines live in slots: the registers are the arrays a, d and pc indexed by slot, and
+    ram[address] holds RAM[address] of every slot. ids[slot] is the machine in a slot and
+    slots[machine] the slot of a machine. The running machines occupy slots 0 to
+    window - 1, so the instructions of the common case operate on plain slices; a
+    machine that halts is swapped to just past the window. Use get(), registers() and
+    machine_ram() to read results by machine. cycles[machine] is the number of
+    instructions the machine executed.
+    """
+    def __init__(self, rom, machines, ram_size=RAM_SIZE, halt_pcs=(), detect_halts=True):
+        if np is None:
+            raise Exception('BatchEmulator requires NumPy')
+        if ram_size > RAM_SIZE:
+            raise Exception('ram_size above %d' % RAM_SIZE)
+        self.machines = machines
+        self.ram_size = ram_size
+        self.a = np.zeros(machines, np.uint16)
+        self.d = np.zeros(machines, np.uint16)
+        self.pc = np.zeros(machines, np.uint16)
+        self.ram = np.zeros((ram_size, machines), np.uint16)
+        self.ids = np.arange(machines)
+        self.slots = np.arange(machines)
+        self.cycles = np.zeros(machines, np.int64)
+        self.window = machines
+        self.steps = 0
+        self.halt_pcs = set(halt_pcs)
+        if detect_halts:
+            self.halt_pcs.update(emulator.find_halt_loops(rom))
+        self.namespace = {'np': np, 'A': self.a, 'D': self.d, 'PC': self.pc,
+                          'RAM': self.ram, 'COLUMNS': np.arange(machines)}
+        self.load(rom)
+
+    def load(self, rom):
+        """Compile one vectorized op per distinct ROM word"""
+        if len(rom) > emulator.ROM_SIZE:
+            raise Exception('Program does not fit in ROM: %d words' % len(rom))
+        compiled = {}
+        self.ops = []
+        self.loads = []     # per address: the constant an A-instruction loads, -1 if A changes otherwise, -2 if not
+        for word in list(rom) + [0] * (emulator.ROM_SIZE - len(rom)):
+            word = int(word)
+            if word not in compiled:
+                scope = {}
+                source = vector_instruction_source(word, self.ram_size)
+                exec(compile(source, '<hack batch %s>' % format(word, '016b'), 'exec'), self.namespace, scope)
+                compiled[word] = scope['op']
+            self.ops.append(compiled[word])
+            self.loads.append(word if word < 32768 else (-1 if word & 0x20 else -2))
+        self.ops.append(self.wrap)
+        self.loads.append(-1)
+
+    def wrap(self, idx, k, pc):
+        """PC + 1 ran past the end of the ROM: the 15-bit PC wraps to 0"""
+        self.ops[0](idx, k, 0)
+
+    def set(self, address, values):
+        """Set RAM[address] of every machine; values is a scalar or one value per machine"""
+        if np.ndim(values):
+            values = np.asarray(values)[self.ids]
+        self.ram[address] = values
+
+    def get(self, address):
+        """RAM[address] of every machine"""
+        return self.ram[address][self.slots]
+
+    def registers(self):
+        """(A, D, PC) arrays, by machine"""
+        return self.a[self.slots], self.d[self.slots], self.pc[self.slots]
+
+    def machine_ram(self, machine):
+        """RAM of one machine"""
+        return self.ram[:, self.slots[machine]]
+
+    def retire(self, slots):
+        """Stop the machines in slots, recording their cycle counts, and shrink the window
+        by swapping them with running machines from its end
+        """
+        self.cycles[self.ids[slots]] = self.steps
+        window = self.window - slots.size
+        front = slots[slots < window]
+        back = np.setdiff1d(np.arange(window, self.window), slots, assume_unique=True)
+        for array in (self.a, self.d, self.pc, self.ids):
+            array[front], array[back] = array[back], array[front]
+        self.ram[:, front], self.ram[:, back] = self.ram[:, back], self.ram[:, front]
+        self.slots[self.ids[front]] = front
+        self.slots[self.ids[back]] = back
+        self.window = window
+
+    def run(self, max_cycles):
+        """Step the running machines until all have halted or max_cycles steps have been
+        taken. Returns the total number of instructions executed across the batch.
+        """
+        ops = self.ops
+        loads = self.loads
+        pc = self.pc
+        halt_pcs = self.halt_pcs
+        start = self.steps
+        executed = 0
+        k = -1          # value of A if it is the same on every running machine
+        while self.window and self.steps - start < max_cycles:
+            everything = slice(0, self.window)
+            pcs = pc[everything]
+            first = int(pcs[0])
+            same = pcs == first
+            if same.all():
+                groups = [(first, everything)]
+            else:
+                groups = split_groups(np.arange(self.window), pcs, first, same)
+                k = -1
+
+            retired = []
+            for address, idx in groups:
+                if address in halt_pcs:
+                    retired.append(np.arange(self.window) if idx is everything else idx)
+                    continue
+                ops[address](idx, k, address)
+                executed += self.window if idx is everything else idx.size
+                if idx is everything:
+                    load = loads[address]
+                    if load != -2:
+                        k = load
+            if retired:
+                self.retire(np.concatenate(retired))
+            self.steps += 1
+        self.cycles[self.ids[:self.window]] = self.steps
+        return executed
+
+
+def benchmark(machines=10000, cycles=None, seed=0):
+    """Multiply random pairs on machines machines with the batch emulator and on the
+    scalar emulator, check the products, and return (batch instructions/s, scalar
+    instructions/s)
+    """
+    import assembler
+    program = ['@2', 'M=0',
+               '(LOOP)', '@1', 'D=M', '@END', 'D;JEQ',
+               '@0', 'D=M', '@2', 'M=M+D', '@1', 'M=M-1', '@LOOP', '0;JMP',
+               '(END)', '@END', '0;JMP']
+    rom = [int(code, 2) for code in assembler.Assembler().assemble_lines(program)]
+
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, 1000, machines).astype(np.uint16)
+    y = rng.integers(0, 100, machines).astype(np.uint16)
+
+    batch = BatchEmulator(rom, machines, ram_size=16)
+    batch.set(0, x)
+    batch.set(1, y)
+    start = time.perf_counter()
+    executed = batch.run(cycles or 10 ** 9)
+    batch_rate = executed / (time.perf_counter() - start)
+    if not (batch.get(2) == (x.astype(np.int64) * y) & 0xFFFF).all():
+        raise Exception('Batch emulator computed wrong products')
+
+    scalar = emulator.Emulator(rom, detect_halts=True)
+    scalar_executed = 0
+    start = time.perf_counter()
+    for m in range(min(machines, 1000)):
+        scalar.reset()
+        scalar.cycles = 0
+        scalar.ram[0] = int(x[m])
+        scalar.ram[1] = int(y[m])
+        scalar_executed += scalar.run(10 ** 9)
+        if scalar.cycles != batch.cycles[m]:
+            raise Exception('Batch and scalar cycle counts differ')
+    scalar_rate = scalar_executed / (time.perf_counter() - start)
+    return batch_rate, scalar_rate
+
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--benchmark' in options:
+        machines = int(args[0]) if args else 10000
+        batch_rate, scalar_rate = benchmark(machines)
+        print('Batch:  %.0f instructions/s over %d machines' % (batch_rate, machines))
+        print('Scalar: %.0f instructions/s' % scalar_rate)
+        print('Speedup: %.1fx' % (batch_rate / scalar_rate))
+    elif len(args) < 3:
+        print("Usage: Python batch_emulator.py file-name.hack|file-name.asm machines cycles [halt-address ...]")
+        print("Runs machines copies of the program for up to cycles steps, or until they enter their final")
+        print("(END) @END 0;JMP loop or reach a halt-address, and prints how many halted")
+        print("Usage: Python batch_emulator.py --benchmark [machines]")
+        print("Compares the batch and scalar emulators on a multiplication loop")
+    else:
+        rom = emulator.load_program(args[0])
+        machines = int(args[1])
+        batch = BatchEmulator(rom, machines, halt_pcs=[int(arg) for arg in args[3:]])
+        start = time.perf_counter()
+        executed = batch.run(int(args[2]))
+        elapsed = time.perf_counter() - start
+        print('Executed %d instructions in %.3f s (%.0f instructions/s)' % (executed, elapsed, executed / elapsed if elapsed else 0))
+        print('Halted: %d of %d machines' % (machines - batch.window, machines))
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the Hack toolchain.
+
+Run from the top of the repository, for example: 
+    python -m benchmarks.ir_benchmark
+    python -m benchmarks.runner
+
+benchmarks.corpus generates the deterministic synthetic programs the benchmarks use, and
+benchmarks.runner times every stage of the toolchain against benchmarks/baseline.json.
+"""
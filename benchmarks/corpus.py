@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic inputs for the toolchain benchmarks.
+
+Every generator takes a size and a seed and returns the same program for the same
+arguments, so results from different runs and machines can be compared:
+
+    generate_asm            Hack assembly with many labels, variables and jumps
+    generate_vm_project     a multi-file VM project (sys.vm, main.vm and modules) with a
+                            deep call graph, for vm_translator_v2
+    generate_expression_program   a long compound statement of assignments, for
+                            code_generator_v2
+
+The VM projects only use commands that vm_translator_v2 translates into code the
+assembler accepts (no or/and, no pop to argument/this/that).
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import random
+
+"""C-instructions used in synthetic assembly, in the spellings found in real sources"""
+asm_c_instructions = ['D=M', 'D = M', 'M=D', 'M = D', 'A=M', 'A = M', 'D=D+A', 'D = D + A',
+                      'M=M+1', 'M = M + 1', 'AM=M-1', 'D=D-M', 'D=!D', 'MD=M-1', 'D=A',
+                      'M=0', 'M=-1', 'D=D|M', 'D=D&A', 'A=A+1']
+asm_jumps = ['0;JMP', 'D;JGT', 'D;JEQ', 'D;JLT', 'D;JNE', 'D;JGE', 'D;JLE']
+
+
+def generate_asm(instructions, labels=None, variables=None, seed=0):
+    """Return about instructions lines of Hack assembly, split into blocks that each
+    start with a label. Blocks jump to random labels, forward and backward, and use
+    variables named var0, var1, ... labels defaults to instructions / 20 and variables
+    to instructions / 200.
+    """
+    rng = random.Random(seed)
+    if labels is None:
+        labels = max(1, instructions // 20)
+    if variables is None:
+        variables = max(1, instructions // 200)
+    block = max(1, instructions // labels)
+
+    lines = ['// Synthetic program: %d instructions, %d labels, %d variables, seed %d' %
+             (instructions, labels, variables, seed)]
+    for i in range(instructions):
+        if i % block == 0 and i // block < labels:
+            lines.append('(L%d)' % (i // block))
+            continue
+        r = rng.random()
+        if r < 0.10:
+            lines.append('@L%d' % rng.randrange(labels))
+            lines.append(rng.choice(asm_jumps))
+        elif r < 0.25:
+            lines.append('@var%d' % rng.randrange(variables))
+        elif r < 0.40:
+            lines.append(rng.choice(['@SP', '@LCL', '@ARG', '@R13', '@R14', '@SCREEN', '@KBD']))
+        elif r < 0.50:
+            lines.append('@%d' % rng.randrange(32768))
+        elif r < 0.52:
+            lines.append('// comment %d' % i)
+        else:
+            lines.append(rng.choice(asm_c_instructions))
+    return lines
+
+
+def generate_function(name, calls, commands, rng):
+    """VM commands for one function that runs a loop of commands stack operations and
+    calls each function in calls once
+    """
+    nvars = rng.randrange(1, 5)
+    label = name.replace('.', '_') + '_LOOP'
+    vm = ['function %s %d' % (name, nvars)]
+    vm.append('push constant %d' % rng.randrange(1, 100))
+    vm.append('pop local 0')
+    vm.append('label ' + label)
+    depth = 0
+    for _ in range(commands):
+        if depth < 2 or rng.random() < 0.4:
+            if rng.random() < 0.5:
+                vm.append('push constant %d' % rng.randrange(32768))
+            else:
+                vm.append('push local %d' % rng.randrange(nvars))
+            depth += 1
+        else:
+            r = rng.random()
+            if r < 0.5:
+                vm.append(rng.choice(['add', 'sub']))
+                depth -= 1
+            elif r < 0.7:
+                vm.append(rng.choice(['eq', 'lt', 'gt']))
+                depth -= 1
+            elif r < 0.8:
+                vm.append(rng.choice(['neg', 'not']))
+            else:
+                vm.append('pop local %d' % rng.randrange(nvars))
+                depth -= 1
+    while depth > 0:
+        vm.append(rng.choice(['pop temp %d' % rng.randrange(8), 'pop static %d' % rng.randrange(16)]))
+        depth -= 1
+    vm.append('push local 0')
+    vm.append('push constant 1')
+    vm.append('sub')
+    vm.append('pop local 0')
+    vm.append('push local 0')
+    vm.append('if-goto ' + label)
+    for callee in calls:
+        vm.append('push local 0')
+        vm.append('call %s 1' % callee)
+        vm.append('pop temp 0')
+    vm.append('push constant 0')
+    vm.append('return')
+    return vm
+
+
+def generate_vm_project(path, modules=4, functions=8, depth=16, commands=40, seed=0):
+    """Write a VM project to directory path: sys.vm, main.vm and modules module files
+    of functions functions each. main calls a chain of depth functions, each calling the
+    next, spread over the modules; the remaining functions hang off the chain. Returns
+    the list of files written.
+    """
+    rng = random.Random(seed)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    names = ['m%d.f%d' % (m, f) for f in range(functions) for m in range(modules)]
+    chain = names[:depth]
+    callees = dict((name, []) for name in names)
+    for caller, callee in zip(chain, chain[1:]):
+        callees[caller].append(callee)
+    for i, name in enumerate(names[depth:]):
+        callees[names[rng.randrange(min(depth, len(names)) + i)]].append(name)
+
+    files = {'sys.vm': ['set sp 256', 'set local 300', 'set argument 400', 'set this 3000',
+                        'set that 3010', 'call main 0', 'end'],
+             'main.vm': generate_function('main', chain[:1], commands, rng)}
+    for m in range(modules):
+        vm = []
+        for name in names:
+            if name.startswith('m%d.' % m):
+                vm.extend(generate_function(name, callees[name], commands, rng))
+        files['m%d.vm' % m] = vm
+
+    written = []
+    for file_name in sorted(files):
+        full_name = os.path.join(path, file_name)
+        with open(full_name, 'w') as f:
+            for command in files[file_name]:
+                f.write('%s\n' % command)
+        written.append(full_name)
+    return written
+
+
+def generate_expression(rng, variables, depth):
+    """Random expression over variables and constants, nested up to depth"""
+    if depth == 0 or rng.random() < 0.3:
+        if rng.random() < 0.5:
+            return str(rng.randrange(1000))
+        return 'v%d' % rng.randrange(variables)
+    r = rng.random()
+    if r < 0.15:
+        return '(' + generate_expression(rng, variables, depth - 1) + ')'
+    op = rng.choice(['+', '-', '*', '/'])
+    return generate_expression(rng, variables, depth - 1) + ' ' + op + ' ' + generate_expression(rng, variables, depth - 1)
+
+
+def generate_expression_program(statements, variables=50, depth=6, seed=0):
+    """Return the text of a compound statement of statements assignments to v0, v1, ...
+    with right-hand sides nested up to depth, and one nested block every 10 statements
+    """
+    rng = random.Random(seed)
+    lines = ['{']
+    for i in range(statements):
+        if i % 10 == 9:
+            lines.append('    {')
+            lines.append('        v%d = %s;' % (rng.randrange(variables), generate_expression(rng, variables, depth)))
+            lines.append('    }')
+        else:
+            lines.append('    v%d = %s;' % (rng.randrange(variables), generate_expression(rng, variables, depth)))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
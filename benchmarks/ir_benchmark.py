@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Compares the list-of-dictionaries intermediate representation with the compact 
+IntermediateRepresentation used by the assembler, on translator-style assembly code.
+
+Usage: python -m benchmarks.ir_benchmark [number-of-vm-commands]
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+import time
+import tracemalloc
+
+import assembler
+import vm_translator_v2
+
+
+def generate_lines(count):
+    """Generate count VM commands' worth of assembly, in the translator's templates"""
+    lines = []
+    for i in range(count):
+        k = i % 4
+        if k == 0:
+            lines.extend(vm_translator_v2.generate_push_code('constant', str(i % 1000)))
+        elif k == 1:
+            lines.extend(vm_translator_v2.generate_push_code('local', str(i % 8)))
+        elif k == 2:
+            lines.extend(vm_translator_v2.generate_arithmetic_or_logic_code('add'))
+        else:
+            lines.extend(vm_translator_v2.generate_pop_code('local', str(i % 8)))
+        if i % 50 == 0:
+            lines.extend(vm_translator_v2.generate_function_call_code('f' + str(i % 7), '2', i))
+    return lines
+
+
+def build_dict_ir(lines):
+    """The original representation: one parse() dictionary per line"""
+    ir = []
+    for line in lines:
+        parsed_command = assembler.parse(line)
+        if parsed_command['status'] == 0:
+            ir.append(parsed_command)
+    return ir
+
+
+def generate_from_dicts(commands):
+    """The original two-pass translation over a list of parse() dictionaries"""
+    machine_code = []
+    table = dict(assembler.predefined_symbols)
+    next_free_ram_address = 16
+
+    rom_address = 0
+    for command in commands:
+        if command['instruction_type'] == 'PSEUDO_INSTRUCTION':
+            table[command['value']] = rom_address
+        else:
+            rom_address += 1
+
+    for command in commands:
+        if command['instruction_type'] == 'A_INSTRUCTION':
+            value = command['value']
+            if value.isdigit():
+                address = int(value)
+            elif value in table:
+                address = table[value]
+            else:
+                address = next_free_ram_address
+                table[value] = address
+                next_free_ram_address += 1
+            machine_code.append('0' + format(address, '015b'))
+
+        elif command['instruction_type'] == 'C_INSTRUCTION':
+            comp = assembler.valid_comp_patterns[command['comp']]
+            dest = assembler.valid_dest_patterns[command['dest']]
+            jmp = assembler.valid_jmp_patterns[command['jmp']]
+            machine_code.append('111' + comp + dest + jmp)
+    return machine_code
+
+
+def build_compact_ir(lines):
+    """The compact representation built through parse_packed()"""
+    ir = assembler.IntermediateRepresentation()
+    for line in lines:
+        packed_command = assembler.parse_packed(line)
+        if packed_command is not None:
+            ir.append_packed(packed_command)
+    return ir
+
+
+def measure(build, generate, lines):
+    """Return (build seconds, generate seconds, peak bytes while building)"""
+    tracemalloc.start()
+    build(lines)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    start = time.perf_counter()
+    ir = build(lines)
+    build_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    generate(ir)
+    generate_time = time.perf_counter() - start
+    return build_time, generate_time, peak
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = generate_lines(count)
+    print('Instructions:', len(lines))
+    print()
+    print('%-10s %12s %12s %12s' % ('IR', 'parse (s)', 'encode (s)', 'peak (MB)'))
+    results = {}
+    variants = (('dict', build_dict_ir, generate_from_dicts), 
+                ('compact', build_compact_ir, assembler.generate_machine_code))
+    for name, build, generate in variants:
+        results[name] = measure(build, generate, lines)
+        build_time, generate_time, peak = results[name]
+        print('%-10s %12.3f %12.3f %12.1f' % (name, build_time, generate_time, peak / 1e6))
+    print()
+    print('Memory saving: %.1fx' % (results['dict'][2] / results['compact'][2]))
+    print('Time saving: %.2fx' % (sum(results['dict'][:2]) / sum(results['compact'][:2])))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Times each stage of the toolchain on synthetic inputs from benchmarks.corpus and
+compares the throughput with stored baseline results.
+
+Stages:
+    compile      code_generator_v2 on a long expression program (statements/s)
+    translate    vm_translator_v2 on a multi-file VM project (VM commands/s)
+    assemble     the assembler on synthetic assembly (words/s), with per-phase times
+    pipeline     the assembler on the translated VM project (words/s)
+
+Each stage runs --repeat times and the fastest run counts. Without --save, a stage whose
+throughput falls more than --tolerance below the baseline is reported as a regression
+and the exit status is 1. Baselines are only compared at the same --scale.
+
+Usage: python -m benchmarks.runner [--scale N] [--repeat N] [--tolerance F]
+                                   [--baseline file] [--save] [--json]
+
+Student name(s): Zach Hammad
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import assembler
+import code_generator_v2
+import vm_translator_v2
+from benchmarks import corpus
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def time_compile(program):
+    """Run code_generator_v2 on program. Returns (seconds, statements compiled)."""
+    del code_generator_v2.vm_code[:]
+    code_generator_v2.symbols.clear()
+    start = time.perf_counter()
+    tree = code_generator_v2.Parser(code_generator_v2.Scanner(program)).parse()
+    code_generator_v2.CodeGenerator(tree).generate()
+    elapsed = time.perf_counter() - start
+    return elapsed, program.count(';')
+
+
+def time_translate(path):
+    """Translate the VM project in path to path/prog.asm. Returns (seconds, VM commands)."""
+    vm_translator_v2.clean_old_files(path)
+    vm_translator_v2.line_number = 1
+    commands = 0
+    for file_name in os.listdir(path):
+        if file_name.endswith('.vm'):
+            with open(os.path.join(path, file_name), 'r') as f:
+                commands += sum(1 for line in f if line.strip())
+
+    cwd = os.getcwd()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not vm_translator_v2.run_vm_to_asm_translator(path):
+                raise Exception('Error translating ' + path)
+            vm_translator_v2.assemble_final_file('prog.asm', path)
+    finally:
+        os.chdir(cwd)
+    elapsed = time.perf_counter() - start
+    return elapsed, commands
+
+
+def time_assemble(file_name):
+    """Assemble file_name. Returns (seconds, words, assembler statistics)."""
+    output_file = os.path.splitext(file_name)[0] + '.hack'
+    cache = assembler.ParseCache()
+    _, stats = assembler.run_assembler_with_stats(file_name, output_file, cache=cache)
+    return stats['total'], stats['words'], stats
+
+
+def best_of(repeat, run):
+    """Call run() repeat times and return the result with the smallest time"""
+    best = None
+    for _ in range(repeat):
+        result = run()
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def run_benchmarks(scale=1, repeat=3, directory=None):
+    """Generate the corpus at scale into directory (a temporary directory by default)
+    and time every stage. Returns a dictionary of results per stage.
+    """
+    remove = directory is None
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='hack-bench-')
+    results = {}
+    try:
+        program = corpus.generate_expression_program(2000 * scale)
+        seconds, count = best_of(repeat, lambda: time_compile(program))
+        results['compile'] = {'seconds': seconds, 'units': count, 'unit': 'statements'}
+
+        project = os.path.join(directory, 'project')
+        corpus.generate_vm_project(project, modules=8 * scale, functions=16, depth=32 * scale)
+        seconds, count = best_of(repeat, lambda: time_translate(project))
+        results['translate'] = {'seconds': seconds, 'units': count, 'unit': 'VM commands'}
+
+        asm_file = os.path.join(directory, 'synthetic.asm')
+        with open(asm_file, 'w') as f:
+            for line in corpus.generate_asm(100000 * scale):
+                f.write('%s\n' % line)
+        seconds, count, stats = best_of(repeat, lambda: time_assemble(asm_file))
+        results['assemble'] = {'seconds': seconds, 'units': count, 'unit': 'words',
+                               'phases': stats['phases']}
+
+        seconds, count, stats = best_of(repeat, lambda: time_assemble(os.path.join(project, 'prog.asm')))
+        results['pipeline'] = {'seconds': seconds, 'units': count, 'unit': 'words',
+                               'phases': stats['phases']}
+    finally:
+        if remove:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    for result in results.values():
+        result['throughput'] = result['units'] / result['seconds'] if result['seconds'] else 0.0
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of (stage, current throughput, baseline throughput, ratio, regressed)"""
+    rows = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        reference = baseline[stage]['throughput']
+        ratio = result['throughput'] / reference if reference else 0.0
+        rows.append((stage, result['throughput'], reference, ratio, ratio < 1.0 - tolerance))
+    return rows
+
+
+def load_baseline(file_name):
+    """Return the stored baseline, or None if file_name does not exist"""
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(file_name, results, scale):
+    """Store results as the baseline for scale"""
+    baseline = {'scale': scale,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'date': time.strftime('%Y-%m-%d'),
+                'stages': results}
+    with open(file_name, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def option_value(argv, name, default):
+    """Value following --name in argv, or default"""
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return default
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if '--help' in argv:
+        print(__doc__)
+        sys.exit(0)
+    scale = int(option_value(argv, '--scale', 1))
+    repeat = int(option_value(argv, '--repeat', 3))
+    tolerance = float(option_value(argv, '--tolerance', 0.2))
+    baseline_file = option_value(argv, '--baseline', default_baseline)
+
+    results = run_benchmarks(scale, repeat)
+    if '--json' in argv:
+        print(json.dumps(results, sort_keys=True))
+    else:
+        print('%-10s %12s %12s %18s' % ('stage', 'units', 'seconds', 'throughput'))
+        for stage, result in results.items():
+            print('%-10s %12d %12.3f %12.0f %s/s' % (stage, result['units'], result['seconds'],
+                                                   result['throughput'], result['unit']))
+
+    if '--save' in argv:
+        save_baseline(baseline_file, results, scale)
+        print('Baseline written to', baseline_file)
+        sys.exit(0)
+
+    baseline = load_baseline(baseline_file)
+    if baseline is None:
+        print('No baseline in', baseline_file, '(run with --save to create one)')
+    elif baseline['scale'] != scale:
+        print('Baseline was recorded at scale', baseline['scale'], '- not compared')
+    else:
+        print()
+        print('%-10s %14s %14s %8s' % ('stage', 'throughput', 'baseline', 'ratio'))
+        regressions = 0
+        for stage, current, reference, ratio, regressed in compare(results, baseline['stages'], tolerance):
+            print('%-10s %14.0f %14.0f %7.2fx%s' % (stage, current, reference, ratio,
+                                                    '  REGRESSION' if regressed else ''))
+            regressions += regressed
+        if regressions:
+            sys.exit(1)
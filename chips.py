@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""Behavioral models of the chips in this repository, for the test script runner.
+
+Each model behaves like the chip at its pins, clocked the way the hardware simulator
+clocks built-in chips:
+
+    eval    recompute combinational outputs (the models compute them on demand, so this
+            is a no-op)
+    tick    the rising edge: sequential parts latch their next state from the current
+            inputs and register outputs
+    tock    the falling edge: register outputs take the latched state
+
+Pins and internal parts are read and written by name with get() and set(). Values are
+unsigned and masked to the pin width. Internal state uses the simulator's names, for
+example DRegister[], PC[] or RAM16K[5]; for a single register, X[0] is X[].
+
+chip_models maps chip names to model classes.
+
+Student name(s): Zach Hammad
+"""
+
+import emulator
+from emulator import KBD, SCREEN
+
+
+def alu(x, y, control):
+    """The Hack ALU on 16-bit x and y under the six control bits zx nx zy ny f no packed
+    in control (zx is bit 5). Returns (out, zr, ng).
+    """
+    if control & 0x20:
+        x = 0
+    if control & 0x10:
+        x ^= 0xFFFF
+    if control & 0x08:
+        y = 0
+    if control & 0x04:
+        y ^= 0xFFFF
+    out = (x + y) & 0xFFFF if control & 0x02 else x & y
+    if control & 0x01:
+        out ^= 0xFFFF
+    return out, int(out == 0), out >> 15
+
+
+def split_name(name):
+    """'RAM16K[5]' -> ('RAM16K', 5), 'PC[]' -> ('PC', None), 'out' -> ('out', None)"""
+    if name.endswith(']'):
+        base, index = name[:-1].split('[', 1)
+        return base, int(index) if index else None
+    return name, None
+
+
+class Chip(object):
+    """Base class for chip models. pins maps every input and output pin to its width."""
+    pins = {}
+
+    def __init__(self):
+        self.values = dict((pin, 0) for pin in self.pins)
+
+    def width(self, name):
+        """Width in bits of pin or part name"""
+        return self.pins.get(name, 16)
+
+    def set(self, name, value):
+        """Set input pin or internal part name to value"""
+        if name not in self.pins:
+            raise Exception('%s has no pin %s' % (type(self).__name__, name))
+        self.values[name] = value & ((1 << self.pins[name]) - 1)
+
+    def get(self, name):
+        """Value of pin or internal part name"""
+        if name not in self.values:
+            raise Exception('%s has no pin %s' % (type(self).__name__, name))
+        return self.values[name]
+
+    def eval(self):
+        pass
+
+    def tick(self):
+        pass
+
+    def tock(self):
+        pass
+
+
+class ALU(Chip):
+    pins = {'x': 16, 'y': 16, 'zx': 1, 'nx': 1, 'zy': 1, 'ny': 1, 'f': 1, 'no': 1,
+            'out': 16, 'zr': 1, 'ng': 1}
+
+    def get(self, name):
+        if name in ('out', 'zr', 'ng'):
+            v = self.values
+            control = (v['zx'] << 5) | (v['nx'] << 4) | (v['zy'] << 3) | (v['ny'] << 2) | (v['f'] << 1) | v['no']
+            out, zr, ng = alu(v['x'], v['y'], control)
+            return {'out': out, 'zr': zr, 'ng': ng}[name]
+        return Chip.get(self, name)
+
+
+class Register(Chip):
+    """16-bit register: out(t+1) = in(t) if load(t) else out(t)"""
+    pins = {'in': 16, 'load': 1, 'out': 16}
+
+    def __init__(self):
+        Chip.__init__(self)
+        self.state = 0
+
+    def get(self, name):
+        if split_name(name)[0] == type(self).__name__:
+            return self.state
+        return Chip.get(self, name)
+
+    def tick(self):
+        if self.values['load']:
+            self.state = self.values['in']
+
+    def tock(self):
+        self.values['out'] = self.state
+
+
+class Bit(Register):
+    """1-bit register"""
+    pins = {'in': 1, 'load': 1, 'out': 1}
+
+
+class RAM(Chip):
+    """RAM of 2 ** address_bits registers; out is the register at address"""
+    address_bits = 3
+
+    def __init__(self):
+        self.pins = {'in': 16, 'load': 1, 'address': self.address_bits, 'out': 16}
+        Chip.__init__(self)
+        self.memory = [0] * (1 << self.address_bits)
+        self.pending = None
+
+    def get(self, name):
+        base, index = split_name(name)
+        if base == type(self).__name__:
+            return self.memory[index or 0]
+        if name == 'out':
+            return self.memory[self.values['address']]
+        return Chip.get(self, name)
+
+    def set(self, name, value):
+        base, index = split_name(name)
+        if base == type(self).__name__:
+            self.memory[index or 0] = value & 0xFFFF
+        else:
+            Chip.set(self, name, value)
+
+    def tick(self):
+        if self.values['load']:
+            self.pending = (self.values['address'], self.values['in'])
+
+    def tock(self):
+        if self.pending is not None:
+            address, value = self.pending
+            self.memory[address] = value
+            self.pending = None
+
+
+class RAM8(RAM):
+    address_bits = 3
+
+
+class RAM64(RAM):
+    address_bits = 6
+
+
+class RAM512(RAM):
+    address_bits = 9
+
+
+class RAM4K(RAM):
+    address_bits = 12
+
+
+class RAM16K(RAM):
+    address_bits = 14
+
+
+class PC(Chip):
+    """Program counter: reset, else load, else inc, else hold"""
+    pins = {'in': 16, 'load': 1, 'inc': 1, 'reset': 1, 'out': 16}
+
+    def __init__(self):
+        Chip.__init__(self)
+        self.state = 0
+
+    def get(self, name):
+        if split_name(name)[0] == 'PC':
+            return self.state
+        return Chip.get(self, name)
+
+    def tick(self):
+        v = self.values
+        if v['reset']:
+            self.state = 0
+        elif v['load']:
+            self.state = v['in']
+        elif v['inc']:
+            self.state = (v['out'] + 1) & 0xFFFF
+        else:
+            self.state = v['out']
+
+    def tock(self):
+        self.values['out'] = self.state
+
+
+class Memory(Chip):
+    """RAM16K, Screen and Keyboard as Memory.hdl maps them; see emulator.py"""
+    pins = {'in': 16, 'load': 1, 'address': 15, 'out': 16}
+
+    def __init__(self):
+        Chip.__init__(self)
+        self.computer = emulator.Emulator()
+        self.pending = None
+
+    def get(self, name):
+        base, index = split_name(name)
+        ram = self.computer.ram
+        if name == 'out':
+            return ram[self.values['address']]
+        if base == 'RAM16K':
+            return ram[index or 0]
+        if base == 'Screen':
+            return ram[SCREEN + (index or 0)]
+        if base == 'Keyboard':
+            return ram[KBD]
+        return Chip.get(self, name)
+
+    def set(self, name, value):
+        base, index = split_name(name)
+        if base == 'RAM16K':
+            self.computer.ram[index or 0] = value & 0xFFFF
+        elif base == 'Screen':
+            self.computer.ram[SCREEN + (index or 0)] = value & 0xFFFF
+        elif base == 'Keyboard':
+            self.computer.set_keyboard(value)
+        else:
+            Chip.set(self, name, value)
+
+    def press_key(self, value):
+        """Simulate a key held down, for scripts that wait on the keyboard"""
+        self.computer.set_keyboard(value)
+        return self.values['address'] >= KBD
+
+    def tick(self):
+        if self.values['load']:
+            self.pending = (self.values['address'], self.values['in'])
+
+    def tock(self):
+        if self.pending is not None:
+            self.computer.write(*self.pending)
+            self.pending = None
+
+
+class CPU(Chip):
+    """CPU.hdl: ARegister, DRegister and PC latch on tick and drive the pins after tock"""
+    pins = {'inM': 16, 'instruction': 16, 'reset': 1,
+            'outM': 16, 'writeM': 1, 'addressM': 15, 'pc': 15}
+
+    def __init__(self):
+        Chip.__init__(self)
+        self.a = self.d = self.pc = 0               # register contents
+        self.out_a = self.out_d = self.out_pc = 0   # register outputs
+
+    def compute(self):
+        """ALU output for the current instruction and register outputs"""
+        instruction = self.values['instruction']
+        y = self.values['inM'] if instruction & 0x1000 else self.out_a
+        return alu(self.out_d, y, (instruction >> 6) & 0x3F)
+
+    def get(self, name):
+        base, _ = split_name(name)
+        instruction = self.values['instruction']
+        if name == 'outM':
+            return self.compute()[0]
+        if name == 'writeM':
+            return int(instruction & 0x8008 == 0x8008)
+        if name == 'addressM':
+            return self.out_a & 0x7FFF
+        if name == 'pc':
+            return self.out_pc & 0x7FFF
+        if base == 'ARegister':
+            return self.a
+        if base == 'DRegister':
+            return self.d
+        if base == 'PC':
+            return self.pc
+        return Chip.get(self, name)
+
+    def tick(self):
+        instruction = self.values['instruction']
+        pc = (self.out_pc + 1) & 0xFFFF
+        if instruction & 0x8000:
+            out, zr, ng = self.compute()
+            if instruction & 0x20:
+                self.a = out
+            if instruction & 0x10:
+                self.d = out
+            jump = instruction & 7
+            if (jump & 4 and ng) or (jump & 2 and zr) or (jump & 1 and not zr and not ng):
+                pc = self.out_a
+        else:
+            self.a = instruction
+        self.pc = 0 if self.values['reset'] else pc
+
+    def tock(self):
+        self.out_a, self.out_d, self.out_pc = self.a, self.d, self.pc
+
+
+class Computer(Chip):
+    """Computer.hdl: ROM32K, CPU and Memory, running on the emulator. The instruction
+    executes on tick, so parts read after tock match the hardware simulator.
+    """
+    pins = {'reset': 1}
+
+    def __init__(self):
+        Chip.__init__(self)
+        self.computer = emulator.Emulator()
+
+    def load_rom(self, rom):
+        """ROM32K load"""
+        self.computer.load(rom)
+
+    def get(self, name):
+        base, index = split_name(name)
+        computer = self.computer
+        if base == 'ARegister':
+            return computer.a
+        if base == 'DRegister':
+            return computer.d
+        if base == 'PC':
+            return computer.pc
+        if base == 'RAM16K':
+            return computer.ram[index or 0]
+        if base == 'Screen':
+            return computer.ram[SCREEN + (index or 0)]
+        if base == 'Keyboard':
+            return computer.ram[KBD]
+        if base == 'ROM32K':
+            return computer.rom[index or 0]
+        return Chip.get(self, name)
+
+    def set(self, name, value):
+        base, index = split_name(name)
+        if base == 'RAM16K':
+            self.computer.ram[index or 0] = value & 0xFFFF
+        elif base == 'Keyboard':
+            self.computer.set_keyboard(value)
+        elif base == 'ARegister':
+            self.computer.a = value & 0xFFFF
+        elif base == 'DRegister':
+            self.computer.d = value & 0xFFFF
+        elif base == 'PC':
+            self.computer.pc = value & 0x7FFF
+        else:
+            Chip.set(self, name, value)
+
+    def press_key(self, value):
+        """Simulate a key held down, for scripts that wait on the keyboard"""
+        self.computer.set_keyboard(value)
+        return True
+
+    def tick(self):
+        self.computer.run(1)
+        if self.values['reset']:
+            self.computer.pc = 0
+
+    def tock(self):
+        pass
+
+
+"""Behavioral models by chip name"""
+chip_models = {'ALU': ALU, 'Bit': Bit, 'Register': Register, 'RAM8': RAM8, 'RAM64': RAM64,
+               'RAM512': RAM512, 'RAM4K': RAM4K, 'RAM16K': RAM16K, 'PC': PC,
+               'Memory': Memory, 'CPU': CPU, 'Computer': Computer}
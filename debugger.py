@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Breakpoints and watchpoints for Hack programs.
+
+A Debugger stops a machine (an emulator.Emulator or hack_jit.JitEmulator) when the PC
+reaches a ROM address, before the instruction there is executed, or after an
+instruction writes a watched RAM address. Addresses are numbers or symbols, with an
+optional offset (SCREEN+32); symbols come from the assembler's symbol table, so labels,
+variables and the predefined SP, LCL, ARG, THIS, THAT, R0-R15, SCREEN and KBD all work.
+
+The machine does the work: a breakpoint patches the dispatch array and a watchpoint
+switches the instructions that write M to versions that check the address, so a
+program runs at full speed while there are none.
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import sys
+
+import assembler
+import emulator
+
+MAX_STOPS = 100     # stops reported by the command line before it gives up
+
+
+class Debugger(object):
+    """Breakpoints and watchpoints on machine, by address or by a symbol in symbols
+    (the predefined symbols by default)
+    """
+    def __init__(self, machine, symbols=None):
+        self.machine = machine
+        self.symbols = dict(assembler.predefined_symbols) if symbols is None else symbols
+
+    def address(self, name):
+        """Address of a number, a symbol, or symbol+offset"""
+        name = str(name)
+        base, _, offset = name.partition('+')
+        if base.isdigit():
+            value = int(base)
+        elif base in self.symbols:
+            value = self.symbols[base]
+        else:
+            raise Exception('Unknown symbol: ' + base)
+        return value + (int(offset) if offset else 0)
+
+    def break_at(self, name):
+        self.machine.set_breakpoint(self.address(name))
+
+    def clear_break(self, name):
+        self.machine.clear_breakpoint(self.address(name))
+
+    def watch(self, name):
+        self.machine.set_watchpoint(self.address(name))
+
+    def unwatch(self, name):
+        self.machine.clear_watchpoint(self.address(name))
+
+    def run(self, cycles):
+        """Run, or continue after a stop, for up to cycles instructions. Returns the number
+        of instructions executed.
+        """
+        return self.machine.resume(cycles)
+
+    def symbol_at(self, address):
+        """Symbol with value address, or the address itself"""
+        for name, value in self.symbols.items():
+            if value == address and name not in assembler.predefined_symbols:
+                return '%s (%d)' % (name, address)
+        for name, value in assembler.predefined_symbols.items():
+            if value == address and not name.startswith('R'):
+                return '%s (%d)' % (name, address)
+        return str(address)
+
+    def stop_reason(self):
+        """Text describing why the machine last stopped"""
+        machine = self.machine
+        if machine.stopped == 'break':
+            return 'Breakpoint at %s' % self.symbol_at(machine.pc)
+        if machine.stopped == 'watch':
+            return 'RAM[%s] = %d written, next PC = %d' % (self.symbol_at(machine.watch_address),
+                                                          machine.ram[machine.watch_address], machine.pc)
+        if machine.stopped == 'halt':
+            return 'Halted in the loop at %d' % machine.pc
+        return 'Running'
+
+
+def load_debugger(file_name, machine_class=None, **options):
+    """Debugger on a new machine (an emulator.Emulator unless machine_class is given,
+    created with options) for an .asm file, assembled here for its symbol table, or for
+    a .hack or .hackb file, with the labels of its .map file if there is one
+    """
+    machine_class = machine_class or emulator.Emulator
+    if file_name.endswith('.asm'):
+        asm = assembler.Assembler()
+        machine_code = asm.assemble_file(file_name)
+        rom = [int(code, 2) for code in machine_code]
+        return Debugger(machine_class(rom, **options), asm.symbol_table)
+    symbols = dict(assembler.predefined_symbols)
+    map_file = os.path.splitext(file_name)[0] + '.map'
+    if os.path.exists(map_file):
+        import profiler
+        symbols.update(profiler.load_source_map(map_file)['labels'])
+    return Debugger(machine_class(emulator.load_program(file_name), **options), symbols)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    breakpoints = []
+    watchpoints = []
+    for name, targets in (('--break', breakpoints), ('--watch', watchpoints)):
+        while name in argv:
+            i = argv.index(name)
+            targets.append(argv[i + 1])
+            del argv[i:i + 2]
+    options = [arg for arg in argv if arg.startswith('--')]
+    args = [arg for arg in argv if not arg.startswith('--')]
+    if len(args) < 1:
+        print("Usage: Python debugger.py [--break address] [--watch address] [--jit] file-name.asm|file-name.hack [cycles]")
+        print("Runs the program for cycles instructions (default 1000000), reporting every stop at a")
+        print("breakpoint (before the instruction at a ROM address) or watchpoint (after a write to a")
+        print("RAM address). An address is a number, a label, a variable or a predefined symbol,")
+        print("with an optional +offset; both options may be repeated.")
+        print("--jit: run on the block compiler")
+        print("Example: Python debugger.py --break LOOP --watch SP prog.asm 100000")
+    else:
+        machine_class = None
+        if '--jit' in options:
+            import hack_jit
+            machine_class = hack_jit.JitEmulator
+        debugger = load_debugger(args[0], machine_class, detect_halts=True)
+        for name in breakpoints:
+            debugger.break_at(name)
+        for name in watchpoints:
+            debugger.watch(name)
+        cycles = int(args[1]) if len(args) > 1 else 1000000
+        machine = debugger.machine
+        stops = 0
+        while machine.cycles < cycles and stops < MAX_STOPS:
+            debugger.run(cycles - machine.cycles)
+            if not machine.halted:
+                break
+            stops += 1
+            print('cycle %d: %s (A = %d, D = %d)' % (machine.cycles, debugger.stop_reason(), machine.a, machine.d))
+            if machine.stopped == 'halt':
+                break
+        print('A = %d, D = %d, PC = %d, cycles = %d' % (machine.a, machine.d, machine.pc, machine.cycles))
@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+"""Software emulator for the Hack computer.
+
+Follows CPU.hdl and Memory.hdl exactly:
+
+    A-instruction   A = instruction, PC = PC + 1
+    C-instruction   the ALU computes comp from D and A (a = 0) or M (a = 1) under the six
+                    control bits c1..c6, so all 64 controls are supported and not only the
+                    28 the assembler emits; bits 14 and 13 are ignored. M is written to the
+                    address in the old A, and a jump goes to the old A.
+    addresses       addressM and the PC are the low 15 bits of A
+    memory map      0-16383 RAM16K, 16384-24575 Screen, reads at 24576 and above return the
+                    Keyboard, and writes at 24576 and above land in the Screen at
+                    address & 0x1FFF (Memory.hdl selects the Screen on address[14] alone)
+
+RAM is a single array('H') of 32768 words indexed by the 15-bit address. The Keyboard
+value is mirrored across 24576-32767, so a read is always ram[address]; writes are
+remapped to the Screen.
+
+The ROM is pre-decoded once into a dispatch array, program, with one entry per ROM
+address (32768, padded with @0 like an empty ROM32K) plus WRAP one past the end and
+WATCH at WATCH_PC:
+
+    entry < 32768           an A-instruction: load the entry into A
+    32768 <= entry < 65536  a C-instruction: call ops[entry](a, d, pc) -> (a, d, pc), a
+                            function generated and compiled for that instruction word
+    entry >= 65536          a special op (HALT, BREAK, WRAP, ...): the run loop stops and
+                            ops[entry] handles it; see Emulator.special
+
+so each cycle does no bit-string work. The ops table is a plain list that can be
+patched, and special entries can be placed in program over any instruction.
+
+Breakpoints and watchpoints cost nothing while there are none. A breakpoint replaces
+the dispatch entry at its address with BREAK. While any RAM address is watched, the
+ops of the C-instructions that write M are swapped for versions that check the
+address written against the watched set and, on a hit, return WATCH_PC as the next PC
+so that the run loop stops at the WATCH entry; see set_breakpoint and set_watchpoint.
+
+run_profiled also counts the instructions executed at each ROM address, for the profiler
+in profiler.py.
+
+Student name(s): Zach Hammad
+"""
+
+import copy
+import sys
+import time
+import types
+from array import array
+
+import hack_binary
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# Special dispatch entries
+HALT = 65536        # stop, the program is finished
+BREAK = 65537       # stop before the instruction at this address
+WRAP = 65538        # the PC ran off the end of the ROM and wraps to 0
+WATCH = 65539       # the instruction just executed wrote a watched address
+SPECIAL_OPS = 16    # entries reserved for special ops in the ops table
+
+WATCH_PC = ROM_SIZE + 1     # program index of the WATCH entry
+
+
+"""Jump conditions on the 16-bit ALU output, by j1 j2 j3"""
+jump_conditions = [None,
+                   '0 < out < 0x8000',
+                   'out == 0',
+                   'out < 0x8000',
+                   'out >= 0x8000',
+                   'out != 0',
+                   'out == 0 or out >= 0x8000',
+                   'True']
+
+
+def alu_expression(control, y):
+    """Python expression for the ALU output with x = d and y as given, for the six control
+    bits zx nx zy ny f no packed in control (zx is bit 5). Operands are 16-bit unsigned.
+    """
+    zx, nx, zy, ny, f, no = [(control >> (5 - i)) & 1 for i in range(6)]
+    x = '0' if zx else 'd'
+    if nx:
+        x = '0xFFFF' if x == '0' else '(d ^ 0xFFFF)'
+    if zy:
+        y = '0'
+    if ny:
+        y = '0xFFFF' if y == '0' else '(%s ^ 0xFFFF)' % y
+
+    if f:
+        if x == '0':
+            out = y
+        elif y == '0':
+            out = x
+        else:
+            out = '((%s + %s) & 0xFFFF)' % (x, y)
+    else:
+        if x == '0' or y == '0':
+            out = '0'
+        elif x == '0xFFFF':
+            out = y
+        elif y == '0xFFFF':
+            out = x
+        else:
+            out = '(%s & %s)' % (x, y)
+
+    if no:
+        out = '0xFFFF' if out == '0' else '(%s ^ 0xFFFF)' % out
+    return out
+
+
+def c_instruction_source(word, name='op', watch=False):
+    """Source of a function name(a, d, pc) -> (a, d, pc) executing C-instruction word, with
+    the RAM as the global ram. With watch set, a write to an address in the global set
+    watched stores the next PC and the address in the global list watch and returns
+    WATCH_PC as the next PC.
+    """
+    control = (word >> 6) & 0x3F
+    dest = (word >> 3) & 7
+    jump = word & 7
+    lines = ['def %s(a, d, pc):' % name]
+    if word & 0x1000:
+        lines.append('    m = ram[a & 0x7FFF]')
+        y = 'm'
+    else:
+        y = 'a'
+    lines.append('    out = ' + alu_expression(control, y))
+    if dest & 1:
+        lines.append('    address = a & 0x7FFF')
+        lines.append('    if address >= %d:' % KBD)
+        lines.append('        address = %d | (address & 0x1FFF)' % SCREEN)
+        lines.append('    ram[address] = out')
+    if jump == 7:
+        lines.append('    pc = a & 0x7FFF')
+    elif jump:
+        lines.append('    if %s:' % jump_conditions[jump])
+        lines.append('        pc = a & 0x7FFF')
+        lines.append('    else:')
+        lines.append('        pc += 1')
+    else:
+        lines.append('    pc += 1')
+    if dest & 2:
+        lines.append('    d = out')
+    if dest & 4:
+        lines.append('    a = out')
+    if watch and dest & 1:
+        lines.append('    if address in watched:')
+        lines.append('        watch[0] = pc')
+        lines.append('        watch[1] = address')
+        lines.append('        return a, d, %d' % WATCH_PC)
+    lines.append('    return a, d, pc')
+    return '\n'.join(lines) + '\n'
+
+
+def always_jumps(word):
+    """True if C-instruction word jumps whatever the values of A, D and M"""
+    jump = word & 7
+    control = (word >> 6) & 0x3F
+    if jump == 7:
+        return True
+    if not jump or control & 0x28 != 0x28:     # the output depends on x or y
+        return False
+    out = eval(alu_expression(control, '0'), {'d': 0})
+    return eval(jump_conditions[jump], {'out': out})
+
+
+def find_halt_loops(rom):
+    """ROM addresses k where a program ends in the idiom
+
+        (END)
+        @END        // at address k
+        0;JMP
+
+    an unconditional jump back to itself with no destination, so once the PC reaches k
+    the machine state never changes again
+    """
+    loops = []
+    for address in range(min(len(rom), ROM_SIZE) - 1):
+        if rom[address] == address:
+            word = rom[address + 1]
+            if word & 0x8000 and not word & 0x38 and always_jumps(word):
+                loops.append(address)
+    return loops
+
+
+"""Compiled code objects per C-instruction word (and (word, True) for the watching
+versions), shared by all emulators
+"""
+code_cache = {}
+
+
+def compile_c_instruction(word, namespace, watch=False):
+    """Return the function executing C-instruction word, bound to namespace['ram'] (and
+    namespace['watched'] and namespace['watch'] with watch set)
+    """
+    word |= 0x8000
+    key = (word, True) if watch else word
+    code = code_cache.get(key)
+    if code is None:
+        code = compile(c_instruction_source(word, watch=watch), '<hack %s>' % format(word, '016b'), 'exec')
+        code_cache[key] = code
+    scope = {}
+    exec(code, namespace, scope)
+    return scope['op']
+
+
+class Emulator(object):
+    """The Hack computer: ROM, RAM, and the A, D and PC registers.
+
+    rom is a sequence of instruction words (a list, an array, or the memoryview returned by
+    hack_binary.load_binary). cycles counts the instructions executed.
+
+    With detect_halts set, the halting loops found by find_halt_loops are replaced by
+    HALT in the dispatch array, so run stops as soon as the PC enters one, with pc at
+    the loop and cycles counting the instructions executed before it. halt_loops lists
+    the addresses.
+
+    run also stops, with halted set, at a breakpoint (before the instruction) or after
+    an instruction that wrote a watched address. stopped tells why the machine last
+    stopped: 'halt', 'break', 'watch' or None, and watch_address the address written.
+    resume continues after a breakpoint or watchpoint.
+    """
+    def __init__(self, rom=(), detect_halts=False):
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.namespace = {'ram': self.ram, 'watched': set(), 'watch': [0, 0, 0]}
+        self.ops = [None] * (65536 + SPECIAL_OPS)
+        self.ops[HALT] = self.halt
+        self.ops[BREAK] = self.break_hit
+        self.ops[WRAP] = self.wrap
+        self.ops[WATCH] = self.watch_hit
+        self.breakpoints = {}   # original dispatch entry by breakpoint address
+        self.stopped = None
+        self.watch_address = None
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        self.hits = None
+        self.detect_halts = detect_halts
+        self.halt_loops = []
+        self.compiled = []      # C-instruction words with a compiled op
+        self.program_shared = False
+        self.load(rom)
+
+    def load(self, rom):
+        """Load rom, pre-decode it into the dispatch array and reset the PC"""
+        if len(rom) > ROM_SIZE:
+            raise Exception('Program does not fit in ROM: %d words' % len(rom))
+        self.rom = array('H', rom)
+        self.rom.extend(array('H', bytes(2 * (ROM_SIZE - len(self.rom)))))
+        self.program = list(self.rom)
+        self.program.append(WRAP)
+        self.program.append(WATCH)
+        self.program_shared = False
+        if self.detect_halts:
+            self.halt_loops = find_halt_loops(self.rom)
+            for address in self.halt_loops:
+                self.program[address] = HALT
+        self.breakpoints = {}
+        watch = bool(self.namespace['watched'])
+        for word in set(self.rom):
+            if word & 0x8000 and self.ops[word] is None:
+                self.ops[word] = compile_c_instruction(word, self.namespace, watch and word & 0x08)
+                self.compiled.append(word)
+        self.reset()
+
+    def reset(self):
+        """Restart the program at ROM address 0, as the reset input does"""
+        self.pc = 0
+        self.halted = False
+        self.stopped = None
+
+    def read(self, address):
+        """Value of Memory[address] as the CPU sees it"""
+        return self.ram[address & 0x7FFF]
+
+    def write(self, address, value):
+        """Write value to Memory[address] as the CPU does"""
+        address &= 0x7FFF
+        if address >= KBD:
+            address = SCREEN | (address & 0x1FFF)
+        self.ram[address] = value & 0xFFFF
+
+    def set_keyboard(self, value):
+        """Set the key currently pressed (0 for none)"""
+        self.ram[KBD:] = array('H', [value & 0xFFFF]) * (RAM_SIZE - KBD)
+
+    def keyboard(self):
+        """Key currently pressed"""
+        return self.ram[KBD]
+
+    def screen(self):
+        """The 8K words of the screen memory map"""
+        return self.ram[SCREEN:KBD]
+
+    def halt(self):
+        """Special op for HALT: stop without executing the instruction"""
+        self.halted = True
+        self.stopped = 'halt'
+        return True
+
+    def break_hit(self):
+        """Special op for BREAK: stop before the instruction at the breakpoint"""
+        self.halted = True
+        self.stopped = 'break'
+        return True
+
+    def watch_hit(self):
+        """Special op for WATCH: stop after the instruction that wrote a watched address,
+        at the PC it went on to
+        """
+        self.pc, self.watch_address = self.namespace['watch'][:2]
+        self.halted = True
+        self.stopped = 'watch'
+        return True
+
+    def set_breakpoint(self, address):
+        """Stop before the instruction at ROM address is executed"""
+        if address not in self.breakpoints:
+            self.own_program()
+            self.breakpoints[address] = self.program[address]
+            self.program[address] = BREAK
+
+    def clear_breakpoint(self, address):
+        if address in self.breakpoints:
+            self.own_program()
+            self.program[address] = self.breakpoints.pop(address)
+
+    def own_program(self):
+        """Copy program before patching it if it is shared with a clone"""
+        if self.program_shared:
+            self.program = list(self.program)
+            self.program_shared = False
+
+    def set_watchpoint(self, address):
+        """Stop after an instruction writes RAM[address] (a write address, so a Screen
+        word and not its alias above the Keyboard)
+        """
+        watched = self.namespace['watched']
+        watched.add(address & 0x7FFF)
+        if len(watched) == 1:
+            self.specialize_writes()
+
+    def clear_watchpoint(self, address):
+        watched = self.namespace['watched']
+        watched.discard(address & 0x7FFF)
+        if not watched:
+            self.specialize_writes()
+
+    def specialize_writes(self):
+        """Compile the ops of the C-instructions that write M with or without the watch
+        check, as there are watchpoints or not
+        """
+        watch = bool(self.namespace['watched'])
+        for word in self.compiled:
+            if word & 0x08:
+                self.ops[word] = compile_c_instruction(word, self.namespace, watch)
+
+    def resume(self, cycles):
+        """Continue after a stop at a breakpoint or watchpoint for up to cycles
+        instructions; the instruction under a breakpoint is executed first. Returns the
+        number of instructions executed.
+        """
+        if self.stopped not in ('break', 'watch'):
+            return self.run(cycles)
+        self.halted = False
+        self.stopped = None
+        executed = 0
+        address = self.pc
+        if address in self.breakpoints and cycles:
+            self.own_program()
+            self.program[address] = self.breakpoints[address]
+            try:
+                executed = Emulator.run(self, 1)
+            finally:
+                self.program[address] = BREAK
+        if not self.halted:
+            executed += self.run(cycles - executed)
+        return executed
+
+    def wrap(self):
+        """Special op for WRAP: continue at ROM address 0"""
+        self.pc = 0
+        return False
+
+    def special(self, entry):
+        """Handle special dispatch entry at the current PC. Returns True to stop running."""
+        return self.ops[entry]()
+
+    def run(self, cycles):
+        """Execute up to cycles instructions, stopping early at a halting special op.
+        Returns the number of instructions executed.
+        """
+        program = self.program
+        ops = self.ops
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while executed < cycles and not self.halted:
+            n = 0
+            for n in range(cycles - executed):
+                entry = program[pc]
+                if entry < 32768:
+                    a = entry
+                    pc += 1
+                elif entry < 65536:
+                    a, d, pc = ops[entry](a, d, pc)
+                else:
+                    break
+            else:
+                n = cycles - executed
+                executed = cycles
+                break
+            executed += n
+            self.a, self.d, self.pc = a, d, pc
+            stop = self.special(entry)
+            a, d, pc = self.a, self.d, self.pc
+            if stop:
+                break
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        if pc == WATCH_PC:      # the last instruction wrote a watched address
+            self.special(WATCH)
+        return executed
+
+    def run_profiled(self, cycles):
+        """Same as run, but also counts the instructions executed at each ROM address in
+        hits, an array preallocated on the first call. Returns the number of instructions
+        executed.
+        """
+        if self.hits is None:
+            self.hits = array('Q', bytes(8 * (ROM_SIZE + 1)))
+        hits = self.hits
+        program = self.program
+        ops = self.ops
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while executed < cycles and not self.halted:
+            n = 0
+            for n in range(cycles - executed):
+                entry = program[pc]
+                if entry < 32768:
+                    hits[pc] += 1
+                    a = entry
+                    pc += 1
+                elif entry < 65536:
+                    hits[pc] += 1
+                    a, d, pc = ops[entry](a, d, pc)
+                else:
+                    break
+            else:
+                executed = cycles
+                break
+            executed += n
+            self.a, self.d, self.pc = a, d, pc
+            stop = self.special(entry)
+            a, d, pc = self.a, self.d, self.pc
+            if stop:
+                break
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        if pc == WATCH_PC:      # the last instruction wrote a watched address
+            self.special(WATCH)
+        return executed
+
+    def clone(self, ram=None):
+        """New machine with this machine's registers, running on ram (by default a copy
+        of this machine's RAM). The ROM and the dispatch array are shared, program until
+        either machine patches it; only the ops, which are bound to a machine's RAM or to
+        the machine, are rebound for the new one, not recompiled.
+        """
+        child = copy.copy(self)
+        child.ram = array('H', bytes(self.ram)) if ram is None else ram
+        child.namespace = dict(self.namespace)
+        child.namespace['ram'] = child.ram
+        child.namespace['watched'] = set(self.namespace['watched'])
+        child.namespace['watch'] = list(self.namespace['watch'])
+        self.program_shared = child.program_shared = True
+        child.breakpoints = dict(self.breakpoints)
+        child.ops = [None] * len(self.ops)
+        child.compiled = list(self.compiled)
+        child.hits = None
+        for word in self.compiled:
+            op = self.ops[word]
+            child.ops[word] = types.FunctionType(op.__code__, child.namespace, op.__name__)
+        for entry in range(65536, 65536 + SPECIAL_OPS):
+            op = self.ops[entry]
+            if getattr(op, '__self__', None) is self:   # a special op bound to this machine
+                op = getattr(child, op.__name__)
+            child.ops[entry] = op
+        return child
+
+    def fork(self):
+        """New machine in the current state whose RAM is copy-on-write. This writes the
+        state to a snapshot.Checkpoint first; keep a Checkpoint to fork many machines
+        from one state.
+        """
+        import snapshot
+        return snapshot.Checkpoint(self).fork()
+
+    def save_snapshot(self, file_name):
+        """Save the complete state to file_name; see snapshot.py"""
+        import snapshot
+        snapshot.save_snapshot(self, file_name)
+
+    def restore_snapshot(self, file_name):
+        """Restore the state saved in file_name by a machine with the same ROM. The file is
+        memory-mapped, so this takes the same time whatever the RAM holds.
+        """
+        import snapshot
+        snapshot.restore_snapshot(self, file_name)
+
+    def step(self):
+        """Execute one instruction (one tick/tock of the clock)"""
+        return self.run(1)
+
+    def state(self):
+        """Dictionary of the registers"""
+        return {'A': self.a, 'D': self.d, 'PC': self.pc, 'cycles': self.cycles}
+
+
+def load_program(file_name):
+    """Load a ROM image from a .hack, .hackb or .asm file"""
+    if file_name.endswith('.asm'):
+        import assembler
+        return hack_binary.words_from_machine_code(assembler.run_assembler(file_name))
+    return hack_binary.load_hack(file_name)
+
+
+"""A counting loop used by the benchmark: RAM[0] counts down from 32767 and RAM[1]
+accumulates, over and over
+"""
+benchmark_program = ['(OUTER)',
+                     '@32767', 'D=A', '@0', 'M=D',
+                     '(LOOP)',
+                     '@0', 'D=M', '@1', 'M=M+D', '@0', 'MD=M-1',
+                     '@LOOP', 'D;JGT',
+                     '@OUTER', '0;JMP']
+
+
+def benchmark(rom=None, cycles=5000000):
+    """Run rom (the benchmark loop by default) for cycles instructions and return
+    instructions per second
+    """
+    if rom is None:
+        import assembler
+        rom = hack_binary.words_from_machine_code(assembler.Assembler().assemble_lines(benchmark_program))
+    emulator = Emulator(rom)
+    start = time.perf_counter()
+    executed = emulator.run(cycles)
+    elapsed = time.perf_counter() - start
+    return executed / elapsed
+
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--benchmark' in options:
+        rom = load_program(args[0]) if args else None
+        cycles = int(args[1]) if len(args) > 1 else 5000000
+        print('%.0f instructions/s' % benchmark(rom, cycles))
+    elif len(args) < 1:
+        print("Usage: Python emulator.py [--benchmark] [--no-halt] file-name.hack|file-name.hackb|file-name.asm [cycles]")
+        print("Runs the program for cycles instructions (default 1000000), or until it enters its final")
+        print("(END) @END 0;JMP loop, and prints the registers and RAM[0..15]")
+        print("--benchmark: report instructions per second (on a built-in loop if no file is given)")
+        print("--no-halt: keep running through the final loop")
+        print("Example: Python emulator.py Max.hack 100")
+    else:
+        emulator = Emulator(load_program(args[0]), detect_halts='--no-halt' not in options)
+        cycles = int(args[1]) if len(args) > 1 else 1000000
+        start = time.perf_counter()
+        executed = emulator.run(cycles)
+        elapsed = time.perf_counter() - start
+        print('Executed %d instructions in %.3f s (%.0f instructions/s)' % (executed, elapsed, executed / elapsed if elapsed else 0))
+        if emulator.halted:
+            print('Halted in the loop at %d' % emulator.pc)
+        print('A = %d, D = %d, PC = %d' % (emulator.a, emulator.d, emulator.pc))
+        for address in range(16):
+            print('RAM[%d] = %d' % (address, emulator.ram[address]))
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""Equivalence checking of two chips with the same pins by bitsliced simulation.
+
+A Miter joins the flattened netlists of both chips (hdl.Netlist) over shared input
+nets and structurally hashes the result: gates are rebuilt one at a time, in level
+order, with constants folded and commutative inputs sorted, and a gate whose kind and
+inputs match an earlier one reuses it. Subcircuits the two chips have in common (the
+same full adder sum XORs, say) thus collapse into one, an output bit that collapses
+onto the same gate in both chips is proven equal without simulation, and the rest is
+simulated once for both.
+
+The remaining outputs are compared on batches of input vectors evaluated bitsliced,
+as hdl.BitslicedChip does, one vector per bit of a NumPy uint64 lane (Python ints
+without NumPy):
+
+    exhaustive  every input vector, when the inputs have at most EXHAUSTIVE_BITS bits
+    random      corner-case vectors (every combination of 0, 1, -1, the sign bit ... on
+                the pins), then random vectors until the requested count
+
+Progress and throughput are reported as batches complete, and the first vector on
+which the chips differ is returned as a counterexample.
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import random
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import hdl
+from hdl import FALSE, TRUE
+
+EXHAUSTIVE_BITS = 24    # input bits up to which every vector is checked
+BATCH = 65536           # vectors per evaluation
+PROGRESS_INTERVAL = 1.0 # seconds between progress reports
+
+"""Gate kinds whose inputs may be reordered"""
+commutative = set(['and', 'or', 'xor', 'nand'])
+
+
+def corner_values(width):
+    """Words of a pin of width bits that tend to find adder and sign bugs"""
+    top = (1 << width) - 1
+    values = [0, 1, top, top - 1, 1 << (width - 1), (1 << (width - 1)) - 1,
+              0x5555 & top, 0xAAAA & top]
+    return sorted(set(values))
+
+
+class Miter(object):
+    """The netlists a and b joined over their inputs and structurally hashed. nodes
+    holds (kind, input node ids) in evaluation order, after the constants (0 and 1)
+    and the input bits; pairs holds (pin, bit, node of a, node of b) for every output
+    bit.
+    """
+    def __init__(self, a, b):
+        for netlist in (a, b):
+            if netlist.dffs or netlist.macros:
+                raise Exception('%s is sequential; equivalence checking needs combinational logic' % netlist.name)
+        pins = lambda pins: sorted((pin, len(nets)) for pin, nets in pins.items())
+        if pins(a.inputs) != pins(b.inputs) or pins(a.outputs) != pins(b.outputs):
+            raise Exception('%s and %s have different pins' % (a.name, b.name))
+        self.names = (a.name, b.name)
+        self.inputs = pins(a.inputs)
+        self.nodes = [('const', ()), ('const', ())]
+        self.table = {}
+        first = {}
+        for pin, width in self.inputs:
+            first[pin] = len(self.nodes)
+            self.nodes.extend(('input', ()) for _ in range(width))
+        self.gate_count = len(a.gates) + len(b.gates)
+        outputs = []
+        for netlist in (a, b):
+            node_of = {FALSE: FALSE, TRUE: TRUE}
+            for pin, nets in netlist.inputs.items():
+                for bit, net in enumerate(nets):
+                    node_of.setdefault(net, first[pin] + bit)
+            for kind, inputs, output in netlist.gates:
+                node_of[output] = self.gate(kind, [node_of.get(net, FALSE) for net in inputs])
+            outputs.append(dict((pin, [node_of.get(net, FALSE) for net in nets]) for pin, nets in netlist.outputs.items()))
+        self.pairs = [(pin, bit, outputs[0][pin][bit], outputs[1][pin][bit])
+                      for pin, width in pins(a.outputs) for bit in range(width)]
+
+    def gate(self, kind, inputs):
+        """Node id of gate kind on the input nodes, folding constants and reusing an
+        identical earlier gate
+        """
+        if kind == 'not':
+            kind, inputs = 'nand', [inputs[0], inputs[0]]
+        if kind == 'andnot':
+            inputs = [inputs[0], self.gate('nand', [inputs[1], inputs[1]])]
+            kind = 'and'
+        if kind == 'mux':
+            a, b, sel = inputs
+            if sel <= TRUE:
+                return b if sel == TRUE else a
+            if a == b:
+                return a
+        elif kind in commutative:
+            inputs = sorted(inputs)
+            x, y = inputs
+            if kind == 'and':
+                if x == FALSE or x == y:
+                    return x if x == FALSE else y
+                if x == TRUE:
+                    return y
+            elif kind == 'or':
+                if x == TRUE or x == y:
+                    return x if x == TRUE else y
+                if x == FALSE:
+                    return y
+            elif kind == 'xor':
+                if x == y:
+                    return FALSE
+                if x == FALSE:
+                    return y
+            elif kind == 'nand':
+                if x == FALSE:
+                    return TRUE
+                if x == TRUE and y == TRUE:
+                    return FALSE
+                if x == TRUE:
+                    inputs = [y, y]
+        key = (kind, tuple(inputs))
+        if key not in self.table:
+            self.table[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.table[key]
+
+    def open_pairs(self):
+        """Output bits that structural hashing did not prove equal"""
+        return [pair for pair in self.pairs if pair[2] != pair[3]]
+
+    def source(self, pairs):
+        """Source of evaluate(v), which computes the gates from the input bit slices in
+        v and returns the slices of the output nodes of pairs, by node
+        """
+        def ref(node):
+            if node == FALSE:
+                return '0'
+            if node == TRUE:
+                return 'mask'
+            return 'n%d' % node
+
+        lines = ['def evaluate(v):']
+        for node, (kind, _) in enumerate(self.nodes):
+            if kind == 'input':
+                lines.append('    n%d = v[%d]' % (node, node))
+        for node, (kind, inputs) in enumerate(self.nodes):
+            if kind in ('const', 'input'):
+                continue
+            arguments = [ref(i) for i in inputs]
+            if kind == 'mux':
+                arguments = [arguments[0], arguments[0], arguments[1], arguments[2]]
+            lines.append('    n%d = %s' % (node, hdl.gate_expressions[kind] % tuple(arguments)))
+        outputs = sorted(set(node for _, _, x, y in pairs for node in (x, y)))
+        lines.append('    return {%s}' % ', '.join('%d: %s' % (node, ref(node)) for node in outputs))
+        return '\n'.join(lines) + '\n'
+
+    def compile(self, mask, pairs):
+        """evaluate(v) for the output bits pairs, on net values masked by mask"""
+        namespace = {'mask': mask}
+        scope = {}
+        exec(compile(self.source(pairs), '<miter %s %s>' % self.names, 'exec'), namespace, scope)
+        return scope['evaluate']
+
+
+class EquivalenceChecker(object):
+    """Simulates the miter of netlists a and b on batches of vectors. lanes is 'numpy' or
+    'int' (the default is NumPy when it is installed); report, if given, is called as
+    report(vectors done, vectors per second) every PROGRESS_INTERVAL seconds.
+    """
+    def __init__(self, a, b, lanes=None, report=None):
+        self.miter = Miter(a, b)
+        self.lanes = lanes or ('numpy' if np is not None else 'int')
+        if self.lanes == 'numpy' and np is None:
+            raise Exception('NumPy lanes require NumPy')
+        self.report = report
+        self.functions = {}
+        self.vectors = 0
+        self.start = None
+        self.last_report = 0
+
+    def input_bits(self):
+        return sum(width for _, width in self.miter.inputs)
+
+    def check_batch(self, words):
+        """Compare the chips on the vectors words, a list of input words by pin in
+        Miter.inputs order (each a sequence of equal length). Returns the index of the
+        first vector on which they differ, or None.
+        """
+        count = len(words[0])
+        if self.lanes == 'numpy':
+            mask = np.uint64(0xFFFFFFFFFFFFFFFF)
+            pack = hdl.pack_lanes
+        else:
+            mask = (1 << count) - 1
+            pack = lambda values, width: hdl.pack_vectors(list(values), width)
+        key = -1 if self.lanes == 'numpy' else mask
+        if key not in self.functions:
+            self.functions[key] = self.miter.compile(mask, self.miter.open_pairs())
+        v = [0] * len(self.miter.nodes)
+        node = 2
+        for (pin, width), values in zip(self.miter.inputs, words):
+            for bit_slice in pack(values, width):
+                v[node] = bit_slice
+                node += 1
+        values = self.functions[key](v)
+        wrong = 0
+        for _, _, x, y in self.miter.open_pairs():
+            wrong = wrong | (values[x] ^ values[y])
+        self.progress(count)
+        if self.lanes == 'numpy':
+            wrong = np.zeros(-(-count // 64), dtype=np.uint64) | wrong
+        failing = hdl.set_bits(wrong, count)
+        return failing[0] if failing else None
+
+    def progress(self, count):
+        """Count vectors done, reporting progress every PROGRESS_INTERVAL seconds"""
+        now = time.time()
+        self.vectors += count
+        if self.report and now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            self.report(self.vectors, self.vectors / max(now - self.start, 1e-9))
+
+    def exhaustive(self):
+        """Check every input vector; returns a counterexample or None"""
+        bits = self.input_bits()
+        for base in range(0, 1 << bits, BATCH):
+            vectors = range(base, min(base + BATCH, 1 << bits))
+            words = []
+            shift = 0
+            for _, width in self.miter.inputs:
+                words.append([(vector >> shift) & ((1 << width) - 1) for vector in vectors])
+                shift += width
+            failing = self.check_batch(words)
+            if failing is not None:
+                return self.counterexample(words, failing)
+        return None
+
+    def corner_cases(self):
+        """Every combination of the corner values of the pins, in batches"""
+        combinations = [[]]
+        for _, width in self.miter.inputs:
+            combinations = [c + [value] for c in combinations for value in corner_values(width)]
+        for base in range(0, len(combinations), BATCH):
+            batch = combinations[base:base + BATCH]
+            yield [[c[i] for c in batch] for i in range(len(self.miter.inputs))]
+
+    def random_vectors(self, count, seed=0):
+        """Check the corner cases and then count random vectors; returns a counterexample
+        or None
+        """
+        for words in self.corner_cases():
+            failing = self.check_batch(words)
+            if failing is not None:
+                return self.counterexample(words, failing)
+        generator = random.Random(seed)
+        for base in range(0, count, BATCH):
+            n = min(BATCH, count - base)
+            words = [[generator.getrandbits(width) for _ in range(n)] for _, width in self.miter.inputs]
+            failing = self.check_batch(words)
+            if failing is not None:
+                return self.counterexample(words, failing)
+        return None
+
+    def counterexample(self, words, index):
+        """(inputs, outputs of a, outputs of b) by pin for vector index of words"""
+        inputs = dict((pin, int(values[index])) for (pin, _), values in zip(self.miter.inputs, words))
+        evaluate = self.miter.compile(1, self.miter.pairs)
+        v = [0] * len(self.miter.nodes)
+        node = 2
+        for pin, width in self.miter.inputs:
+            for bit in range(width):
+                v[node] = (inputs[pin] >> bit) & 1
+                node += 1
+        values = evaluate(v)
+        outputs = ({}, {})
+        for pin, bit, x, y in self.miter.pairs:
+            for side, node in enumerate((x, y)):
+                value = values[node]
+                outputs[side][pin] = outputs[side].get(pin, 0) | (value << bit)
+        return inputs, outputs[0], outputs[1]
+
+    def check(self, count=1 << 24, seed=0):
+        """Check exhaustively if the inputs are small enough, else with corner cases and
+        count random vectors. Returns a counterexample or None.
+        """
+        self.start = self.last_report = time.time()
+        if not self.miter.open_pairs():
+            return None
+        if self.input_bits() <= EXHAUSTIVE_BITS:
+            return self.exhaustive()
+        return self.random_vectors(count, seed)
+
+
+def load_netlist(file_name):
+    """Netlist of the chip in an .hdl file"""
+    return hdl.Netlist(os.path.splitext(os.path.basename(file_name))[0], os.path.dirname(os.path.abspath(file_name)))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print("Usage: Python equivalence.py file-name.hdl file-name.hdl [vectors] [seed]")
+        print("Checks that two combinational chips with the same pins compute the same function:")
+        print("exhaustively for up to %d input bits, else on corner cases and vectors random vectors" % EXHAUSTIVE_BITS)
+        print("(default 16777216)")
+        print("Example: Python equivalence.py Adders/CLA16.hdl Adders/RippleCarryAdder16.hdl")
+    else:
+        report = lambda vectors, rate: print('  %d vectors, %.0f vectors/s' % (vectors, rate))
+        checker = EquivalenceChecker(load_netlist(args[0]), load_netlist(args[1]), report=report)
+        miter = checker.miter
+        print('%s, %s: %d gates hashed to %d, %d of %d output bits proven structurally' % (
+            miter.names + (miter.gate_count, len(miter.nodes) - 2 - checker.input_bits(),
+                           len(miter.pairs) - len(miter.open_pairs()), len(miter.pairs))))
+        start = time.time()
+        result = checker.check(int(args[2]) if len(args) > 2 else 1 << 24, int(args[3]) if len(args) > 3 else 0)
+        elapsed = time.time() - start
+        if not miter.open_pairs():
+            mode = 'structurally'
+        elif checker.input_bits() <= EXHAUSTIVE_BITS:
+            mode = 'exhaustively'
+        else:
+            mode = 'on corner-case and random vectors'
+        if result is None:
+            print('Equivalent %s: %d vectors in %.2f s' % (mode, checker.vectors, elapsed))
+        else:
+            inputs, a_outputs, b_outputs = result
+            print('Different: ' + ', '.join('%s = %d' % (pin, value) for pin, value in sorted(inputs.items())))
+            for name, outputs in zip(miter.names, (a_outputs, b_outputs)):
+                print('  %s: %s' % (name, ', '.join('%s = %d' % item for item in sorted(outputs.items()))))
+            sys.exit(1)
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""Superinstructions for the Hack emulator.
+
+vm_translator_v2 turns every VM command into a fixed template of Hack instructions, for
+example push constant k into
+
+    @k  D=A  @SP  A=M  M=D  @SP  M=M+1
+
+A FusedEmulator looks for these templates in the ROM when it is loaded and runs each
+occurrence, a site, as one fused operation: a function fused(a, d) -> (a, d, pc)
+written for the idiom with its operands (k above) filled in. A fused operation does
+exactly what its instructions do, in the same order, so RAM, A, D and PC end up
+bit-identical and the cycle count goes up by the template length. Sites are entered only
+at their first instruction; a jump into the middle of one runs the plain instructions,
+and so do the last few cycles of a run, so that no site runs past its end.
+
+Sites never cover a special dispatch entry, so halting loops and breakpoints work as
+usual, and there is no fusion while a RAM address is watched. fusion_stats() and
+report() give the sites found and the instructions run fused, per idiom.
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+import time
+import types
+
+import assembler
+import emulator
+from emulator import Emulator, KBD, SCREEN, ROM_SIZE, SPECIAL_OPS, WATCH_PC
+
+FUSED = 65536 + SPECIAL_OPS     # dispatch entry of the first fused site
+
+
+def store(address, value):
+    """Lines writing value to the RAM word at the run-time address expression address"""
+    return ['address = %s & 0x7FFF' % address,
+            'if address >= %d:' % KBD,
+            '    address = %d | (address & 0x1FFF)' % SCREEN,
+            'ram[address] = %s' % value]
+
+
+def push_d():
+    """Lines of @SP A=M M=D @SP M=M+1"""
+    return store('ram[0]', 'd') + ['ram[0] = (ram[0] + 1) & 0xFFFF']
+
+
+def decrement_sp():
+    """Lines of @SP M=M-1"""
+    return ['ram[0] = (ram[0] + 0xFFFF) & 0xFFFF']
+
+
+def alu(instruction, y):
+    """Expression of the ALU output of a C-instruction for x = d and y as given"""
+    return emulator.alu_expression((encode(instruction) >> 6) & 0x3F, y)
+
+
+def encode(line):
+    """Machine code word of one assembly instruction"""
+    return int(assembler.Assembler().assemble_lines([line])[0], 2)
+
+
+def remap(address):
+    """Address a write to address lands on"""
+    address &= 0x7FFF
+    if address >= KBD:
+        address = SCREEN | (address & 0x1FFF)
+    return address
+
+
+"""The templates of vm_translator_v2, without labels: (name, instructions, body). An
+instruction '@name' with a lower-case name is an operand, matching any A-instruction;
+body(operands) returns the lines of the fused operation, where operands also holds
+next, the address after the site. No template uses the A it is entered with. The
+assembler spells or and and as D|M and D&M.
+"""
+PUSH_D = ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+POP_TO_R13 = ['@R13', 'M=D', '@SP', 'A=M', 'D=M', '@R13', 'A=M', 'M=D', '@SP', 'M=M-1']
+
+idioms = [
+    ('call',
+     ['@r', 'D=A'] + PUSH_D + ['@LCL', 'D=M'] + PUSH_D + ['@ARG', 'D=M'] + PUSH_D +
+     ['@THIS', 'D=M'] + PUSH_D + ['@THAT', 'D=M'] + PUSH_D +
+     ['@n', 'D=A', '@SP', 'D=M-D', '@ARG', 'M=D', '@SP', 'D=M', '@LCL', 'M=D', '@f', '0;JMP'],
+     lambda p: (['d = %(r)d' % p] + push_d() +
+                ['d = ram[1]'] + push_d() + ['d = ram[2]'] + push_d() +
+                ['d = ram[3]'] + push_d() + ['d = ram[4]'] + push_d() +
+                ['d = (ram[0] - %(n)d) & 0xFFFF' % p, 'ram[2] = d', 'd = ram[0]', 'ram[1] = d',
+                 'return %(f)d, d, %(f)d' % p])),
+    ('return',
+     ['@LCL', 'D=M', '@R14', 'M=D', '@5', 'D=A', '@LCL', 'A=M', 'A=A-D', 'D=M', '@R15', 'M=D',
+      '@SP', 'M=M-1', 'A=M', 'D=M', '@ARG', 'M=D', 'D=A+1', '@SP', 'M=D',
+      '@R14', 'A=M-1', 'D=M', '@THAT', 'M=D',
+      '@2', 'D=A', '@R14', 'A=M-D', 'D=M', '@THIS', 'M=D',
+      '@3', 'D=A', '@R14', 'A=M-D', 'D=M', '@ARG', 'M=D',
+      '@4', 'D=A', '@R14', 'A=M-D', 'D=M', '@LCL', 'M=D',
+      '@R15', 'A=M', '0;JMP'],
+     lambda p: (['ram[14] = ram[1]', 'ram[15] = ram[(ram[1] - 5) & 0x7FFF]'] + decrement_sp() +
+                ['ram[2] = ram[ram[0] & 0x7FFF]', 'ram[0] = 3',
+                 'ram[4] = ram[(ram[14] - 1) & 0x7FFF]', 'ram[3] = ram[(ram[14] - 2) & 0x7FFF]',
+                 'ram[2] = ram[(ram[14] - 3) & 0x7FFF]', 'd = ram[(ram[14] - 4) & 0x7FFF]',
+                 'ram[1] = d', 'a = ram[15]', 'return a, d, a & 0x7FFF'])),
+]
+
+for name, operation in (('add', 'D=M+D'), ('sub', 'D=M-D'), ('or', 'D=D|M'), ('and', 'D=D&M')):
+    idioms.append((name,
+                   ['@SP', 'M=M-1', 'A=M', 'D=M', '@13', 'M=D', '@SP', 'M=M-1', 'A=M', 'D=M', '@14', 'M=D',
+                    '@13', 'D=M', '@14', operation] + PUSH_D,
+                   lambda p, operation=operation: (decrement_sp() + ['d = ram[ram[0] & 0x7FFF]', 'ram[13] = d'] +
+                                                   decrement_sp() + ['d = ram[ram[0] & 0x7FFF]', 'ram[14] = d',
+                                                                     'd = ram[13]', 'm = ram[14]',
+                                                                     'd = ' + alu(operation, 'm')] +
+                                                   push_d() + ['return 0, d, %(next)d' % p])))
+
+for name, operation in (('neg', 'D=-M'), ('not', 'D=!M')):
+    idioms.append((name,
+                   ['@SP', 'A=M', 'D=M', '@13', 'M=D', '@SP', 'M=M-1', '@13', operation] + PUSH_D,
+                   lambda p, operation=operation: (['d = ram[ram[0] & 0x7FFF]', 'ram[13] = d'] + decrement_sp() +
+                                                   ['m = ram[13]', 'd = ' + alu(operation, 'm')] +
+                                                   push_d() + ['return 0, d, %(next)d' % p])))
+
+for name, jump in (('lt', 'D;JLT'), ('gt', 'D;JGT')):
+    idioms.append((name,
+                   ['@SP', 'A=M', 'D=M', '@SP', 'M=M-1', 'A=M', 'D=M-D', '@t', jump],
+                   lambda p, jump=jump: (['d = ram[ram[0] & 0x7FFF]'] + decrement_sp() +
+                                         ['m = ram[ram[0] & 0x7FFF]', 'out = ' + alu('D=M-D', 'm'), 'd = out',
+                                          'if %s:' % emulator.jump_conditions[encode(jump) & 7],
+                                          '    return %(t)d, d, %(t)d' % p,
+                                          'return %(t)d, d, %(next)d' % p])))
+
+idioms.extend([
+    ('pop segment',
+     ['@s', 'D=M', '@i', 'D=D+A'] + POP_TO_R13,
+     lambda p: (['ram[13] = (ram[%(s)d] + %(i)d) & 0xFFFF' % p, 'd = ram[ram[0] & 0x7FFF]'] +
+                store('ram[13]', 'd') + decrement_sp() + ['return 0, d, %(next)d' % p])),
+    ('pop address',
+     ['@x', 'D=D+A'] + POP_TO_R13,
+     lambda p: (['ram[13] = (d + %(x)d) & 0xFFFF' % p, 'd = ram[ram[0] & 0x7FFF]'] +
+                store('ram[13]', 'd') + decrement_sp() + ['return 0, d, %(next)d' % p])),
+    ('push segment',
+     ['@i', 'D=A', '@s', 'A=M+D', 'D=M'] + PUSH_D,
+     lambda p: (['d = ram[(ram[%(s)d] + %(i)d) & 0x7FFF]' % p] + push_d() + ['return 0, d, %(next)d' % p])),
+    ('push constant',
+     ['@k', 'D=A'] + PUSH_D,
+     lambda p: (['d = %(k)d' % p] + push_d() + ['return 0, d, %(next)d' % p])),
+    ('push address',
+     ['@x', 'D=M'] + PUSH_D,
+     lambda p: (['d = ram[%(x)d]' % p] + push_d() + ['return 0, d, %(next)d' % p])),
+    ('push zero',
+     ['@SP', 'A=M', 'M=0', '@SP', 'M=M+1'],
+     lambda p: store('ram[0]', '0') + ['ram[0] = (ram[0] + 1) & 0xFFFF', 'return 0, d, %(next)d' % p]),
+    ('false',
+     ['@SP', 'A=M', 'M=0', '@e', '0;JMP'],
+     lambda p: store('ram[0]', '0') + ['return %(e)d, d, %(e)d' % p]),
+    ('if-goto',
+     ['@SP', 'M=M-1', 'A=M', 'D=M', '@l', 'D;JNE'],
+     lambda p: (decrement_sp() + ['d = ram[ram[0] & 0x7FFF]',
+                                  'return %(l)d, d, %(l)d if d else %(next)d' % p])),
+    ('set',
+     ['@v', 'D=A', '@r', 'M=D'],
+     lambda p: ['ram[%d] = %d' % (remap(p['r']), p['v']), 'return %(r)d, %(v)d, %(next)d' % p]),
+])
+
+
+
+def pattern_words(instructions):
+    """Machine code of a template, with the operand name in place of each operand"""
+    words = []
+    for line in instructions:
+        name = line[1:]
+        if line.startswith('@') and name.islower() and name.isalpha():
+            words.append(name)
+        else:
+            words.append(encode(line))
+    return words
+
+
+def match(pattern, program, start):
+    """Operands of pattern at program[start], or None if it does not match there"""
+    if start + len(pattern) > ROM_SIZE:
+        return None
+    operands = {}
+    for offset, item in enumerate(pattern):
+        word = program[start + offset]
+        if isinstance(item, str):
+            if word >= 32768 or operands.setdefault(item, word) != word:
+                return None
+        elif word != item:
+            return None
+    return operands
+
+
+"""(name, pattern) of every idiom, longest first"""
+patterns = sorted(((name, pattern_words(instructions)) for name, instructions, _ in idioms),
+                  key=lambda idiom: -len(idiom[1]))
+
+"""Body of every idiom by name"""
+bodies = dict((name, body) for name, _, body in idioms)
+
+"""Patterns that can match a word: by first word, and under None for the patterns
+starting with an operand
+"""
+first_words = {}
+for name, pattern in patterns:
+    first_words.setdefault(None if isinstance(pattern[0], str) else pattern[0], []).append((name, pattern))
+
+"""Compiled code objects per (idiom, operands), shared by all emulators"""
+code_cache = {}
+
+
+def fused_source(name, operands):
+    """Source of the fused operation for a site of idiom name"""
+    lines = ['def fused(a, d):']
+    lines.extend('    ' + line for line in bodies[name](operands))
+    return '\n'.join(lines) + '\n'
+
+
+def compile_fused(name, operands, namespace):
+    """Return the fused operation for a site of idiom name, bound to namespace['ram']"""
+    key = (name,) + tuple(sorted(operands.items()))
+    code = code_cache.get(key)
+    if code is None:
+        code = compile(fused_source(name, operands), '<fused %s>' % name, 'exec')
+        code_cache[key] = code
+    scope = {}
+    exec(code, namespace, scope)
+    return scope['fused']
+
+
+def find_sites(program):
+    """List of (address, idiom name, operands) for the templates in program, scanning from
+    address 0 and taking the longest template that matches at each address
+    """
+    end = ROM_SIZE
+    while end > 0 and program[end - 1] == 0:
+        end -= 1
+    candidates = {}         # patterns to try at a word, longest first
+    sites = []
+    address = 0
+    while address < end:
+        word = program[address]
+        if word not in candidates:
+            candidates[word] = sorted(first_words.get(word, []) + (first_words.get(None, []) if word < 32768 else []),
+                                      key=lambda idiom: -len(idiom[1]))
+        for name, pattern in candidates[word]:
+            operands = match(pattern, program, address)
+            if operands is not None:
+                operands['next'] = address + len(pattern)
+                sites.append((address, name, operands))
+                address += len(pattern)
+                break
+        else:
+            address += 1
+    return sites
+
+
+class FusedEmulator(Emulator):
+    """Emulator that runs the VM translator's templates as superinstructions.
+
+    fused_program is program with the first entry of every site replaced by FUSED plus
+    the site's index in sites; run dispatches on it, and everything else (run_profiled,
+    the tracer and profiler, breakpoints) keeps using program. Call fuse() after
+    patching program.
+    """
+    def __init__(self, rom=(), detect_halts=False):
+        self.sites = []
+        Emulator.__init__(self, rom, detect_halts)
+
+    def load(self, rom):
+        """Load rom and find its sites"""
+        Emulator.load(self, rom)
+        self.fuse()
+
+    def fuse(self):
+        """Find the sites in program and compile their fused operations"""
+        self.fused_program = list(self.program)
+        self.sites = [] if self.namespace['watched'] else find_sites(self.program)
+        self.fused_ops = []
+        self.fused_lengths = []
+        self.extra_lengths = []
+        self.fused_counts = [0] * len(self.sites)
+        for index, (address, name, operands) in enumerate(self.sites):
+            self.fused_program[address] = FUSED + index
+            self.fused_ops.append(compile_fused(name, operands, self.namespace))
+            self.fused_lengths.append(operands['next'] - address)
+            self.extra_lengths.append(operands['next'] - address - 1)
+
+    def clone(self, ram=None):
+        """As Emulator.clone; the new machine shares the sites and fused_program, and the
+        fused operations are rebound to its RAM
+        """
+        child = Emulator.clone(self, ram)
+        child.fused_ops = [types.FunctionType(op.__code__, child.namespace, op.__name__) for op in self.fused_ops]
+        child.fused_counts = [0] * len(self.sites)
+        return child
+
+    def set_breakpoint(self, address):
+        Emulator.set_breakpoint(self, address)
+        self.fuse()
+
+    def clear_breakpoint(self, address):
+        Emulator.clear_breakpoint(self, address)
+        self.fuse()
+
+    def set_watchpoint(self, address):
+        Emulator.set_watchpoint(self, address)
+        self.fuse()
+
+    def clear_watchpoint(self, address):
+        Emulator.clear_watchpoint(self, address)
+        self.fuse()
+
+    def run(self, cycles):
+        """Execute up to cycles instructions, stopping early at a halting special op.
+        Returns the number of instructions executed.
+
+        The dispatch loop counts entries, not instructions, so it runs for at most
+        (cycles left) // (longest site) entries at a time, which can never overrun;
+        the last few cycles are left to the interpreter.
+        """
+        program = self.fused_program
+        ops = self.ops
+        fused_ops = self.fused_ops
+        extra_lengths = self.extra_lengths
+        counts = self.fused_counts
+        longest = max(self.fused_lengths or [1])
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while not self.halted:
+            budget = (cycles - executed) // longest
+            if not budget:
+                break
+            extra = 0           # instructions run by fused sites beyond one each
+            n = 0
+            for n in range(budget):
+                entry = program[pc]
+                if entry < 32768:
+                    a = entry
+                    pc += 1
+                elif entry < 65536:
+                    a, d, pc = ops[entry](a, d, pc)
+                elif entry >= FUSED:
+                    entry -= FUSED
+                    a, d, pc = fused_ops[entry](a, d)
+                    extra += extra_lengths[entry]
+                    counts[entry] += 1
+                else:
+                    break
+            else:
+                executed += budget + extra
+                continue
+            executed += n + extra
+            self.a, self.d, self.pc = a, d, pc
+            stop = self.special(entry)
+            a, d, pc = self.a, self.d, self.pc
+            if stop:
+                break
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        if pc == WATCH_PC:      # the last instruction wrote a watched address
+            self.special(emulator.WATCH)
+        elif executed < cycles and not self.halted:
+            executed += Emulator.run(self, cycles - executed)
+        return executed
+
+    def fusion_stats(self):
+        """Dictionary of {'sites', 'executions', 'instructions'} by idiom name, with the
+        totals under 'total'; instructions counts the instructions run fused
+        """
+        stats = {}
+        total = {'sites': 0, 'executions': 0, 'instructions': 0}
+        for index, (address, name, operands) in enumerate(self.sites):
+            idiom = stats.setdefault(name, {'sites': 0, 'executions': 0, 'instructions': 0})
+            for counts in (idiom, total):
+                counts['sites'] += 1
+                counts['executions'] += self.fused_counts[index]
+                counts['instructions'] += self.fused_counts[index] * self.fused_lengths[index]
+        stats['total'] = total
+        return stats
+
+    def report(self):
+        """Text table of fusion_stats"""
+        stats = self.fusion_stats()
+        total = stats.pop('total')
+        percent = lambda count: 100.0 * count / self.cycles if self.cycles else 0.0
+        lines = ['%-14s %7s %12s %14s %7s' % ('idiom', 'sites', 'executions', 'instructions', '%')]
+        for name, counts in sorted(stats.items(), key=lambda item: -item[1]['instructions']):
+            lines.append('%-14s %7d %12d %14d %6.2f%%' % (name, counts['sites'], counts['executions'],
+                                                          counts['instructions'], percent(counts['instructions'])))
+        lines.append('%-14s %7d %12d %14d %6.2f%%' % ('total', total['sites'], total['executions'],
+                                                      total['instructions'], percent(total['instructions'])))
+        return '\n'.join(lines)
+
+
+def compare(rom, cycles=5000000):
+    """Run rom for cycles instructions on the interpreter and with superinstructions,
+    check that both end in the same state, and return (interpreter instructions/s,
+    fused instructions/s, speedup, fused machine)
+    """
+    interpreter = Emulator(rom)
+    start = time.perf_counter()
+    interpreter.run(cycles)
+    interpreter_time = time.perf_counter() - start
+
+    fused = FusedEmulator(rom)
+    start = time.perf_counter()
+    fused.run(cycles)
+    fused_time = time.perf_counter() - start
+
+    if interpreter.state() != fused.state() or interpreter.ram != fused.ram:
+        raise Exception('Superinstructions diverged from the interpreter')
+    return cycles / interpreter_time, cycles / fused_time, interpreter_time / fused_time, fused
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: Python fusion.py file-name.hack|file-name.hackb|file-name.asm [cycles]")
+        print("Runs the program on the interpreter and with superinstructions, reports the speedup")
+        print("and the instructions run fused per VM idiom")
+        print("Example: Python fusion.py prog.hack 1000000")
+    else:
+        rom = emulator.load_program(sys.argv[1])
+        cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 5000000
+        interpreter_rate, fused_rate, speedup, machine = compare(rom, cycles)
+        print('Interpreter: %.0f instructions/s' % interpreter_rate)
+        print('Fused:       %.0f instructions/s' % fused_rate)
+        print('Speedup:     %.2fx' % speedup)
+        print('')
+        print(machine.report())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Packed binary format for Hack machine code.
+
+A text .hack file spends 17 bytes on every 16-bit instruction. The packed format
+stores each instruction as a little-endian uint16 after a 12-byte header:
+
+    magic        4 bytes   b'HACK'
+    word count   uint32
+    entry point  uint16    ROM address where execution starts
+    reserved     uint16    always 0
+
+so a ROM image can be memory-mapped and used as an array of words without
+parsing or copying it.
+
+Student name(s): Zach Hammad
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'HACK'
+HEADER = struct.Struct('<4sIHH')
+
+
+def words_from_machine_code(machine_code):
+    """Convert machine code strings, as generated by the assembler, to an array of words"""
+    return array('H', [int(code, 2) for code in machine_code])
+
+
+def machine_code_from_words(words):
+    """Convert words back to the 16-character strings of a text .hack file"""
+    return [format(word, '016b') for word in words]
+
+
+def write_binary(file_name, words, entry_point=0):
+    """Write words to file_name in the packed binary format"""
+    if not isinstance(words, array) or words.typecode != 'H':
+        words = array('H', words)
+    if sys.byteorder == 'big':
+        words = array('H', words)
+        words.byteswap()
+
+    with open(file_name, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(words), entry_point, 0))
+        f.write(words.tobytes())
+
+
+def is_binary(file_name):
+    """Return True if file_name starts with the packed binary magic"""
+    with open(file_name, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_binary(file_name):
+    """Memory-map a packed binary file and return (words, entry_point).
+
+    On little-endian hosts words is a read-only memoryview of unsigned 16-bit
+    integers straight over the mapping, so nothing is copied however large the
+    image is. On big-endian hosts the words are copied and byte-swapped into an array.
+    """
+    with open(file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise Exception('Truncated header in ' + file_name)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, count, entry_point, _ = HEADER.unpack_from(mapping)
+    if magic != MAGIC:
+        mapping.close()
+        raise Exception('Not a packed Hack binary: ' + file_name)
+    end = HEADER.size + 2 * count
+    if len(mapping) < end:
+        mapping.close()
+        raise Exception('Truncated word data in ' + file_name)
+
+    words = memoryview(mapping)[HEADER.size:end].cast('H')
+    if sys.byteorder == 'big':
+        words = array('H', words)
+        words.byteswap()
+    return words, entry_point
+
+
+def load_text(file_name):
+    """Read a text .hack file into an array of words"""
+    words = array('H')
+    with open(file_name, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                words.append(int(line, 2))
+    return words
+
+
+def load_hack(file_name):
+    """Load a ROM image in either format and return its words"""
+    if is_binary(file_name):
+        return load_binary(file_name)[0]
+    return load_text(file_name)
+
+
+def text_to_binary(input_file, output_file, entry_point=0):
+    """Convert a text .hack file to the packed binary format"""
+    words = load_text(input_file)
+    write_binary(output_file, words, entry_point)
+    return len(words)
+
+
+def binary_to_text(input_file, output_file):
+    """Convert a packed binary file to a text .hack file"""
+    words, _ = load_binary(input_file)
+    with open(output_file, 'w') as f:
+        for code in machine_code_from_words(words):
+            f.write('%s\n' % code)
+    return len(words)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: Python hack_binary.py file-name.hack|file-name.hackb [output-file]")
+        print("Converts a text .hack file to the packed binary format, or back")
+        print("Example: Python hack_binary.py Max.hack")
+    else:
+        input_file = sys.argv[1]
+        file_name_minus_extension, _ = os.path.splitext(input_file)
+        if is_binary(input_file):
+            output_file = sys.argv[2] if len(sys.argv) > 2 else file_name_minus_extension + '.hack'
+            count = binary_to_text(input_file, output_file)
+        else:
+            output_file = sys.argv[2] if len(sys.argv) > 2 else file_name_minus_extension + '.hackb'
+            count = text_to_binary(input_file, output_file)
+        print('Wrote', count, 'words to', output_file)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Basic-block compiler for the Hack emulator.
+
+The ROM is cut into basic blocks: a block starts at the address execution enters it at
+and runs up to and including the first jump instruction, or up to the next leader (an
+address that is the target of a static @target / jump pair, or follows a jump). Each
+block is compiled once into a Python function block(a, d) -> (a, d, pc) that executes
+the whole block as straight-line code:
+
+    - A and D are locals; an A loaded by an A-instruction is a known constant, so
+      @5 / M=D compiles to ram[5] = d, and the Screen remap of constant addresses is
+      done at compile time
+    - the final jump goes to the constant A when it is known and to the run-time A
+      otherwise, so computed returns such as @R15 / A=M / 0;JMP work unchanged
+
+Blocks are keyed by entry address and compiled lazily, so a computed jump into the
+middle of a block simply starts a new block there. A block runs a fixed number of
+instructions whichever way its final jump goes, which keeps the cycle count exact:
+when fewer cycles remain than a block's length, or a block has not been entered
+threshold times yet, the interpreter in emulator.Emulator runs it instead. Special
+dispatch entries (HALT, BREAK, WRAP, WATCH) end blocks and are handled by the
+interpreter, so a breakpoint ends the block before it. While RAM addresses are watched,
+a write to a constant watched address ends its block with a jump to WATCH_PC, and a
+write to a run-time address is checked against the watched set; blocks compiled with
+no watchpoints have no checks at all.
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+import time
+
+import emulator
+from emulator import Emulator, KBD, SCREEN, ROM_SIZE, WATCH_PC
+
+MAX_BLOCK = 256     # longest block compiled, in instructions
+
+
+def is_jump(entry):
+    """True if dispatch entry is a C-instruction with a jump"""
+    return 32768 <= entry < 65536 and entry & 7 != 0
+
+
+def find_leaders(program):
+    """Addresses that start a basic block: 0, static jump targets and the instruction
+    after every jump
+    """
+    leaders = set([0])
+    for address in range(ROM_SIZE):
+        entry = program[address]
+        if is_jump(entry):
+            leaders.add(address + 1)
+            if address > 0 and program[address - 1] < 32768:
+                leaders.add(program[address - 1])
+    return leaders
+
+
+def remap(address):
+    """Address a write to address lands on"""
+    address &= 0x7FFF
+    if address >= KBD:
+        address = SCREEN | (address & 0x1FFF)
+    return address
+
+
+def block_source(program, entry, leaders, name='block', watched=()):
+    """Source of the function for the block starting at entry. Returns (source, length),
+    or (None, 0) if entry holds a special dispatch entry. Writes to the addresses in
+    watched return WATCH_PC, with the next PC, the address and the number of
+    instructions executed in the global list watch.
+    """
+    lines = ['def %s(a, d):' % name]
+    known = None                    # value of A if it is a compile-time constant
+    address = entry
+    while address - entry < MAX_BLOCK:
+        word = program[address]
+        if word >= 65536:
+            break
+        address += 1
+
+        if word < 32768:            # A-instruction
+            known = word
+        else:
+            if known is None:
+                y = 'a'
+                target = 'a & 0x7FFF'
+                m = 'ram[a & 0x7FFF]'
+            else:
+                y = str(known)
+                target = str(known & 0x7FFF)
+                m = 'ram[%d]' % (known & 0x7FFF)
+            if word & 0x1000:
+                y = m
+            out = emulator.alu_expression((word >> 6) & 0x3F, y)
+            dest = (word >> 3) & 7
+            jump = word & 7
+
+            if dest or jump:
+                lines.append('    out = ' + out)
+            watch = None            # address of a watched write: a constant or 'address'
+            if dest & 1:
+                if known is None:
+                    lines.append('    address = a & 0x7FFF')
+                    lines.append('    if address >= %d:' % KBD)
+                    lines.append('        address = %d | (address & 0x1FFF)' % SCREEN)
+                    lines.append('    ram[address] = out')
+                    if watched:
+                        watch = 'address'
+                else:
+                    lines.append('    ram[%d] = out' % remap(known))
+                    if remap(known) in watched:
+                        watch = remap(known)
+            if jump and known is None and dest & 4:
+                lines.append('    target = a & 0x7FFF')
+                target = 'target'
+            if dest & 2:
+                lines.append('    d = out')
+            if dest & 4:
+                lines.append('    a = out')
+                known = None
+
+            if watch is not None:
+                indent = '    '
+                if watch == 'address':
+                    lines.append('    if address in watched:')
+                    indent = '        '
+                if jump == 7:
+                    next_pc = target
+                elif jump:
+                    next_pc = '%s if %s else %d' % (target, emulator.jump_conditions[jump], address)
+                else:
+                    next_pc = str(address)
+                lines.append(indent + 'watch[0] = ' + next_pc)
+                lines.append(indent + 'watch[1] = %s' % watch)
+                lines.append(indent + 'watch[2] = %d' % (address - entry))
+                lines.append(indent + 'return %s, d, %d' % ('a' if known is None else str(known), WATCH_PC))
+                if watch != 'address':
+                    return '\n'.join(lines) + '\n', address - entry
+
+            if jump:
+                a = 'a' if known is None else str(known)
+                if jump == 7:
+                    lines.append('    return %s, d, %s' % (a, target))
+                else:
+                    lines.append('    if %s:' % emulator.jump_conditions[jump])
+                    lines.append('        return %s, d, %s' % (a, target))
+                    lines.append('    return %s, d, %d' % (a, address))
+                return '\n'.join(lines) + '\n', address - entry
+
+        if address in leaders:
+            break
+
+    if address == entry:
+        return None, 0
+    lines.append('    return %s, d, %d' % ('a' if known is None else str(known), address))
+    return '\n'.join(lines) + '\n', address - entry
+
+
+class JitEmulator(Emulator):
+    """Emulator that runs hot basic blocks as compiled Python functions.
+
+    A block is compiled the threshold-th time execution enters it. blocks_compiled and
+    compile_time report the compiler's work. Call invalidate() after patching program.
+    detect_halts is as for Emulator; a halting loop ends the block that runs into it.
+    Setting or clearing a breakpoint or watchpoint drops the compiled blocks.
+    """
+    def __init__(self, rom=(), threshold=2, detect_halts=False):
+        self.threshold = threshold
+        self.blocks_compiled = 0
+        self.compile_time = 0.0
+        Emulator.__init__(self, rom, detect_halts)
+
+    def load(self, rom):
+        """Load rom and drop all compiled blocks"""
+        Emulator.load(self, rom)
+        self.invalidate()
+
+    def clone(self, ram=None):
+        """As Emulator.clone; the new machine shares the leaders and compiles its own
+        blocks
+        """
+        child = Emulator.clone(self, ram)
+        child.blocks_compiled = 0
+        child.compile_time = 0.0
+        child.blocks = [None] * len(self.program)
+        child.lengths = [0] * len(self.program)
+        child.entry_counts = [0] * len(self.program)
+        return child
+
+    def invalidate(self):
+        """Forget all compiled blocks, after program or leaders have changed"""
+        self.leaders = find_leaders(self.program)
+        self.blocks = [None] * len(self.program)
+        self.lengths = [0] * len(self.program)
+        self.entry_counts = [0] * len(self.program)
+
+    def set_breakpoint(self, address):
+        Emulator.set_breakpoint(self, address)
+        self.invalidate()
+
+    def clear_breakpoint(self, address):
+        Emulator.clear_breakpoint(self, address)
+        self.invalidate()
+
+    def set_watchpoint(self, address):
+        Emulator.set_watchpoint(self, address)
+        self.invalidate()
+
+    def clear_watchpoint(self, address):
+        Emulator.clear_watchpoint(self, address)
+        self.invalidate()
+
+    def compile_block(self, entry):
+        """Compile the block at entry. Returns False if entry cannot start a block."""
+        start = time.perf_counter()
+        source, length = block_source(self.program, entry, self.leaders, watched=self.namespace['watched'])
+        if source is None:
+            return False
+        scope = {}
+        exec(compile(source, '<hack block %d>' % entry, 'exec'), self.namespace, scope)
+        self.blocks[entry] = scope['block']
+        self.lengths[entry] = length
+        self.blocks_compiled += 1
+        self.compile_time += time.perf_counter() - start
+        return True
+
+    def run(self, cycles):
+        """Execute up to cycles instructions, stopping early at a halting special op.
+        Returns the number of instructions executed.
+        """
+        blocks = self.blocks
+        lengths = self.lengths
+        entry_counts = self.entry_counts
+        threshold = self.threshold
+        program = self.program
+        interpret = Emulator.run
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        interpreted = 0
+        length = 0
+        while executed < cycles and not self.halted:
+            block = blocks[pc]
+            if block is not None:
+                length = lengths[pc]
+                if length <= cycles - executed:
+                    a, d, pc = block(a, d)
+                    executed += length
+                    continue
+            elif program[pc] < 65536:
+                entry_counts[pc] += 1
+                if entry_counts[pc] >= threshold and self.compile_block(pc):
+                    continue
+                if not lengths[pc]:
+                    lengths[pc] = block_source(program, pc, self.leaders)[1]
+
+            # Cold block, special entry, or fewer cycles left than the block needs
+            if pc == WATCH_PC:      # the block stopped early at a watched write
+                executed -= length - self.namespace['watch'][2]
+            self.a, self.d, self.pc = a, d, pc
+            n = interpret(self, min(lengths[pc] or 1, cycles - executed))
+            executed += n
+            interpreted += n
+            a, d, pc = self.a, self.d, self.pc
+        if pc == WATCH_PC:      # the last block stopped early at a watched write
+            executed -= length - self.namespace['watch'][2]
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed - interpreted
+        if pc == WATCH_PC:
+            self.special(emulator.WATCH)
+        return executed
+
+
+def compare(rom, cycles=5000000):
+    """Run rom for cycles instructions on the interpreter and on the block compiler,
+    check that both end in the same state, and return (interpreter instructions/s,
+    compiled instructions/s, speedup)
+    """
+    interpreter = Emulator(rom)
+    start = time.perf_counter()
+    interpreter.run(cycles)
+    interpreter_time = time.perf_counter() - start
+
+    jit = JitEmulator(rom)
+    start = time.perf_counter()
+    jit.run(cycles)
+    jit_time = time.perf_counter() - start
+
+    if (interpreter.state() != jit.state() or interpreter.ram != jit.ram):
+        raise Exception('Compiled blocks diverged from the interpreter')
+    return cycles / interpreter_time, cycles / jit_time, interpreter_time / jit_time
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: Python hack_jit.py file-name.hack|file-name.hackb|file-name.asm [cycles]")
+        print("Runs the program on the interpreter and on the block compiler and reports the speedup")
+        print("Example: Python hack_jit.py mult.hack 1000000")
+    else:
+        rom = emulator.load_program(sys.argv[1])
+        cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 5000000
+        interpreter_rate, jit_rate, speedup = compare(rom, cycles)
+        print('Interpreter: %.0f instructions/s' % interpreter_rate)
+        print('Compiled:    %.0f instructions/s' % jit_rate)
+        print('Speedup:     %.2fx' % speedup)
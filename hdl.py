@@ -0,0 +1,927 @@
+# -*- coding: utf-8 -*-
+"""HDL front end and gate-level simulator for the chips in this repository.
+
+parse_hdl reads the hardware simulator's HDL:
+
+    CHIP Name {
+        IN a, b[16];
+        OUT out[16];
+        PARTS:
+        Part(pin=signal, pin[0..7]=signal, sub[2]=bus[0], pin=true, ...);
+    }
+
+A Netlist flattens a chip into gates. Parts are looked up the way the hardware simulator
+looks them up: Name.hdl in the chip's directory first, then the built-in chips. Built-in
+chips are either
+
+    gates       Nand, Not, And, Or, Xor, Mux, DMux (two gates) and DFF
+    HDL         the 16-bit and multi-way gates, adders, Inc16 and ALU, written in HDL
+                below and flattened like any other chip
+    macros      Register, ARegister, DRegister, PC, RAM8 ... RAM16K, Screen, Keyboard and
+                ROM32K, simulated a word at a time as the hardware simulator does
+
+Every pin bit becomes a net; connecting two pins merges their nets. Output pins tied
+to true or false are left unconnected. The combinational gates and memory reads are
+levelized once into evaluation order and compiled into one straight-line Python
+function, evaluate(v), over the list v of net values, so a simulation step costs one
+statement per gate. Net values are masked by the global mask (1 here), which lets the
+same code evaluate many input vectors at once on wider integers.
+
+A GateChip simulates a netlist behind the interface of chips.Chip, and load_chip is the
+'gate' engine of tst_runner.py.
+
+A BitslicedChip evaluates a combinational netlist for many input vectors at once: bit j
+of every net value belongs to vector j, so each gate is one bitwise operation over all
+of them. Net values are Python ints of any length, or NumPy uint64 arrays (64 vectors
+per element) when lanes='numpy'. check_adder uses it for exhaustive shards of a 16-bit
+adder's inputs: one x against all 65536 y in a single evaluation.
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import re
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chips import split_name
+
+FALSE = 0       # net that is always 0
+TRUE = 1        # net that is always 1 (mask)
+
+token_pattern = re.compile(r'//[^\n]*|/\*.*?\*/|\.\.|[A-Za-z_]\w*|\d+|[{}()\[\],;=:]', re.S)
+
+
+class ChipDefinition(object):
+    """A parsed CHIP: inputs and outputs are lists of (name, width) and parts a list of
+    (chip name, connections), a connection being (pin, first bit, last bit, signal,
+    first bit, last bit) with None for a whole pin or signal
+    """
+    def __init__(self, name, inputs, outputs, parts):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parts = parts
+
+
+def tokenize(text):
+    """Words, numbers and punctuation of HDL source, without comments"""
+    return [token for token in token_pattern.findall(text) if not token.startswith(('//', '/*'))]
+
+
+def parse_hdl(text):
+    """Parse the CHIP in HDL source text into a ChipDefinition"""
+    tokens = tokenize(text)
+    position = [0]
+
+    def peek():
+        return tokens[position[0]] if position[0] < len(tokens) else None
+
+    def take(expected=None):
+        token = peek()
+        if token is None or (expected is not None and token != expected):
+            raise Exception('HDL: expected %s, found %s' % (expected or 'more input', token))
+        position[0] += 1
+        return token
+
+    def sub_bus():
+        """[i] or [i..j] after a name, as (i, j), or (None, None)"""
+        if peek() != '[':
+            return None, None
+        take('[')
+        first = int(take())
+        last = first
+        if peek() == '..':
+            take('..')
+            last = int(take())
+        take(']')
+        return first, last
+
+    def declarations():
+        pins = []
+        while True:
+            name = take()
+            width = 1
+            if peek() == '[':
+                take('[')
+                width = int(take())
+                take(']')
+            pins.append((name, width))
+            if take() == ';':
+                return pins
+
+    take('CHIP')
+    name = take()
+    take('{')
+    inputs = declarations() if peek() == 'IN' and take() else []
+    outputs = declarations() if peek() == 'OUT' and take() else []
+    take('PARTS')
+    take(':')
+    parts = []
+    while peek() != '}':
+        part = take()
+        take('(')
+        connections = []
+        while True:
+            pin = take()
+            pin_first, pin_last = sub_bus()
+            take('=')
+            signal = take()
+            signal_first, signal_last = sub_bus()
+            connections.append((pin, pin_first, pin_last, signal, signal_first, signal_last))
+            if take() == ')':
+                break
+        take(';')
+        parts.append((part, connections))
+    take('}')
+    return ChipDefinition(name, inputs, outputs, parts)
+
+
+"""Gates by chip name: (input pins, output pins, gates), a gate being (kind, input pins,
+output pin); every pin is one bit
+"""
+gate_chips = {'Nand': (['a', 'b'], ['out'], [('nand', ('a', 'b'), 'out')]),
+              'Not': (['in'], ['out'], [('not', ('in',), 'out')]),
+              'And': (['a', 'b'], ['out'], [('and', ('a', 'b'), 'out')]),
+              'Or': (['a', 'b'], ['out'], [('or', ('a', 'b'), 'out')]),
+              'Xor': (['a', 'b'], ['out'], [('xor', ('a', 'b'), 'out')]),
+              'Mux': (['a', 'b', 'sel'], ['out'], [('mux', ('a', 'b', 'sel'), 'out')]),
+              'DMux': (['in', 'sel'], ['a', 'b'], [('andnot', ('in', 'sel'), 'a'), ('and', ('in', 'sel'), 'b')]),
+              'DFF': (['in'], ['out'], [('dff', ('in',), 'out')])}
+
+"""Python expression of each gate kind over its inputs"""
+gate_expressions = {'nand': 'mask ^ (%s & %s)',
+                    'not': 'mask ^ %s',
+                    'and': '%s & %s',
+                    'or': '%s | %s',
+                    'xor': '%s ^ %s',
+                    'andnot': '%s & (mask ^ %s)',
+                    'mux': '%s ^ ((%s ^ %s) & %s)'}
+
+
+def bitwise_hdl(name, gate, inputs):
+    """HDL of a 16-bit chip applying a one-bit gate to every bit"""
+    parts = ['%s(%s, out=out[%d]);' % (gate, ', '.join('%s=%s[%d]' % (pin, pin, i) for pin in inputs), i)
+             for i in range(16)]
+    return 'CHIP %s { IN %s; OUT out[16]; PARTS: %s }' % (
+        name, ', '.join(pin + '[16]' for pin in inputs), ' '.join(parts))
+
+
+"""Built-in chips written in HDL, by name"""
+builtin_hdl = {
+    'Not16': bitwise_hdl('Not16', 'Not', ['in']),
+    'And16': bitwise_hdl('And16', 'And', ['a', 'b']),
+    'Or16': bitwise_hdl('Or16', 'Or', ['a', 'b']),
+    'Mux16': ('CHIP Mux16 { IN a[16], b[16], sel; OUT out[16]; PARTS: %s }' %
+              ' '.join('Mux(a=a[%d], b=b[%d], sel=sel, out=out[%d]);' % (i, i, i) for i in range(16))),
+    'Or8Way': ('CHIP Or8Way { IN in[8]; OUT out; PARTS: Or(a=in[0], b=in[1], out=o1); %s Or(a=o6, b=in[7], out=out); }' %
+               ' '.join('Or(a=o%d, b=in[%d], out=o%d);' % (i - 1, i, i) for i in range(2, 7))),
+    'Mux4Way16': '''CHIP Mux4Way16 {
+        IN a[16], b[16], c[16], d[16], sel[2];
+        OUT out[16];
+        PARTS:
+        Mux16(a=a, b=b, sel=sel[0], out=ab);
+        Mux16(a=c, b=d, sel=sel[0], out=cd);
+        Mux16(a=ab, b=cd, sel=sel[1], out=out);
+    }''',
+    'Mux8Way16': '''CHIP Mux8Way16 {
+        IN a[16], b[16], c[16], d[16], e[16], f[16], g[16], h[16], sel[3];
+        OUT out[16];
+        PARTS:
+        Mux4Way16(a=a, b=b, c=c, d=d, sel=sel[0..1], out=abcd);
+        Mux4Way16(a=e, b=f, c=g, d=h, sel=sel[0..1], out=efgh);
+        Mux16(a=abcd, b=efgh, sel=sel[2], out=out);
+    }''',
+    'DMux4Way': '''CHIP DMux4Way {
+        IN in, sel[2];
+        OUT a, b, c, d;
+        PARTS:
+        DMux(in=in, sel=sel[1], a=ab, b=cd);
+        DMux(in=ab, sel=sel[0], a=a, b=b);
+        DMux(in=cd, sel=sel[0], a=c, b=d);
+    }''',
+    'DMux8Way': '''CHIP DMux8Way {
+        IN in, sel[3];
+        OUT a, b, c, d, e, f, g, h;
+        PARTS:
+        DMux(in=in, sel=sel[2], a=abcd, b=efgh);
+        DMux4Way(in=abcd, sel=sel[0..1], a=a, b=b, c=c, d=d);
+        DMux4Way(in=efgh, sel=sel[0..1], a=e, b=f, c=g, d=h);
+    }''',
+    'HalfAdder': '''CHIP HalfAdder {
+        IN a, b;
+        OUT sum, carry;
+        PARTS:
+        Xor(a=a, b=b, out=sum);
+        And(a=a, b=b, out=carry);
+    }''',
+    'FullAdder': '''CHIP FullAdder {
+        IN a, b, c;
+        OUT sum, carry;
+        PARTS:
+        Xor(a=a, b=b, out=ab);
+        Xor(a=ab, b=c, out=sum);
+        And(a=a, b=b, out=g);
+        And(a=ab, b=c, out=p);
+        Or(a=g, b=p, out=carry);
+    }''',
+    'Add16': ('CHIP Add16 { IN a[16], b[16]; OUT out[16]; PARTS: '
+              'HalfAdder(a=a[0], b=b[0], sum=out[0], carry=c0); %s }' %
+              ' '.join('FullAdder(a=a[%d], b=b[%d], c=c%d, sum=out[%d], carry=c%d);' % (i, i, i - 1, i, i)
+                       for i in range(1, 16))),
+    'Inc16': 'CHIP Inc16 { IN in[16]; OUT out[16]; PARTS: Add16(a=in, b[0]=true, out=out); }',
+    'ALU': '''CHIP ALU {
+        IN x[16], y[16], zx, nx, zy, ny, f, no;
+        OUT out[16], zr, ng;
+        PARTS:
+        Mux16(a=x, b=false, sel=zx, out=x1);
+        Not16(in=x1, out=notx1);
+        Mux16(a=x1, b=notx1, sel=nx, out=x2);
+        Mux16(a=y, b=false, sel=zy, out=y1);
+        Not16(in=y1, out=noty1);
+        Mux16(a=y1, b=noty1, sel=ny, out=y2);
+        And16(a=x2, b=y2, out=xandy);
+        Add16(a=x2, b=y2, out=xplusy);
+        Mux16(a=xandy, b=xplusy, sel=f, out=out1);
+        Not16(in=out1, out=notout1);
+        Mux16(a=out1, b=notout1, sel=no, out=out, out[0..7]=low, out[8..15]=high, out[15]=ng);
+        Or8Way(in=low, out=orlow);
+        Or8Way(in=high, out=orhigh);
+        Or(a=orlow, b=orhigh, out=nonzero);
+        Not(in=nonzero, out=zr);
+    }''',
+}
+
+
+class Macro(object):
+    """A built-in chip simulated a word at a time. pins maps its pins to nets once the
+    netlist is built, path names the part; memory holds its registers.
+    """
+    inputs = {}
+    outputs = {'out': 16}
+    size = 1
+
+    def __init__(self, name):
+        self.name = name
+        self.path = name
+        self.pins = {}
+        self.memory = [0] * self.size
+        self.pending = None
+
+    def word(self, v, pin):
+        """Value of pin from the net values v"""
+        value = 0
+        for bit, net in enumerate(self.pins[pin]):
+            value |= (v[net] & 1) << bit
+        return value
+
+    def drive(self, v, pin, value):
+        """Set the nets of pin to value"""
+        for bit, net in enumerate(self.pins[pin]):
+            if net > TRUE:
+                v[net] = (value >> bit) & 1
+
+    def reads(self):
+        """Address pin of a combinational read of memory to out, or None"""
+        return None
+
+    def get(self, index):
+        return self.memory[index or 0]
+
+    def set(self, index, value):
+        self.memory[index or 0] = value & 0xFFFF
+
+    def tick(self, v):
+        pass
+
+    def tock(self, v):
+        pass
+
+
+class RegisterMacro(Macro):
+    """Register, ARegister, DRegister: out(t+1) = in(t) if load(t) else out(t)"""
+    inputs = {'in': 16, 'load': 1}
+
+    def tick(self, v):
+        if self.word(v, 'load'):
+            self.memory[0] = self.word(v, 'in')
+
+    def tock(self, v):
+        self.drive(v, 'out', self.memory[0])
+
+
+class PCMacro(Macro):
+    """PC: reset, else load, else inc, else hold"""
+    inputs = {'in': 16, 'load': 1, 'inc': 1, 'reset': 1}
+
+    def tick(self, v):
+        if self.word(v, 'reset'):
+            self.memory[0] = 0
+        elif self.word(v, 'load'):
+            self.memory[0] = self.word(v, 'in')
+        elif self.word(v, 'inc'):
+            self.memory[0] = (self.word(v, 'out') + 1) & 0xFFFF
+        else:
+            self.memory[0] = self.word(v, 'out')
+
+    def tock(self, v):
+        self.drive(v, 'out', self.memory[0])
+
+
+class RAMMacro(Macro):
+    """RAM of 2 ** address_bits registers, also Screen; out is the register at address"""
+    address_bits = 3
+
+    def __init__(self, name):
+        self.inputs = {'in': 16, 'load': 1, 'address': self.address_bits}
+        self.size = 1 << self.address_bits
+        Macro.__init__(self, name)
+
+    def reads(self):
+        return 'address'
+
+    def tick(self, v):
+        if self.word(v, 'load'):
+            self.pending = (self.word(v, 'address'), self.word(v, 'in'))
+
+    def tock(self, v):
+        if self.pending is not None:
+            address, value = self.pending
+            self.memory[address] = value
+            self.pending = None
+
+
+class ROMMacro(Macro):
+    """ROM32K: out is the instruction at address"""
+    inputs = {'address': 15}
+    size = 32768
+
+    def reads(self):
+        return 'address'
+
+
+class KeyboardMacro(Macro):
+    """Keyboard: out is the key held down"""
+    inputs = {}
+
+    def set(self, index, value):
+        self.memory[0] = value & 0xFFFF
+        self.pending = self.memory[0]
+
+    def tock(self, v):
+        self.drive(v, 'out', self.memory[0])
+
+
+def ram_macro(address_bits):
+    return type('RAMMacro%d' % address_bits, (RAMMacro,), {'address_bits': address_bits})
+
+
+"""Macro classes by chip name"""
+macro_chips = {'Register': RegisterMacro, 'ARegister': RegisterMacro, 'DRegister': RegisterMacro,
+               'PC': PCMacro, 'RAM8': ram_macro(3), 'RAM64': ram_macro(6), 'RAM512': ram_macro(9),
+               'RAM4K': ram_macro(12), 'RAM16K': ram_macro(14), 'Screen': ram_macro(13),
+               'Keyboard': KeyboardMacro, 'ROM32K': ROMMacro}
+
+"""Parsed chip definitions by HDL file path"""
+definition_cache = {}
+
+
+def load_definition(path):
+    """ChipDefinition of the HDL file path, parsed once"""
+    definition = definition_cache.get(path)
+    if definition is None:
+        with open(path, 'r') as f:
+            definition = parse_hdl(f.read())
+        definition_cache[path] = definition
+    return definition
+
+
+def find_chip(name, directory):
+    """How to build chip name for a chip in directory (None inside built-in chips):
+    ('hdl', definition, directory of its parts), ('gate', None, None) or
+    ('macro', None, None)
+    """
+    if directory is not None and os.path.exists(os.path.join(directory, name + '.hdl')):
+        return 'hdl', load_definition(os.path.join(directory, name + '.hdl')), directory
+    if name in gate_chips:
+        return 'gate', None, None
+    if name in macro_chips:
+        return 'macro', None, None
+    if name in builtin_hdl:
+        key = '<builtin %s>' % name
+        if key not in definition_cache:
+            definition_cache[key] = parse_hdl(builtin_hdl[name])
+        return 'hdl', definition_cache[key], None
+    raise Exception('Chip %s not found' % name)
+
+
+class Netlist(object):
+    """Gate-level netlist of chip name, built from the HDL in directory.
+
+    inputs and outputs map the chip's pins to their nets, bit 0 first. gates holds
+    (kind, input nets, output net) in evaluation order, and levels the level of each of
+    them: 1 for a gate fed only by inputs, constants and register outputs. dffs holds
+    (input net, output net) pairs and macros the built-in sequential chips. part_names
+    maps the output net of every gate to the part it came from, such as
+    CLA4[1]/FullAdder[2]/Xor[0].
+    """
+    def __init__(self, name, directory='.'):
+        self.name = name
+        self.parent = [FALSE, TRUE]     # union-find over nets
+        self.raw_gates = []
+        self.dffs = []
+        self.macros = []
+        self.part_names = {}
+        kind, definition, directory = find_chip(name, directory)
+        if kind != 'hdl':
+            raise Exception('%s is a built-in chip without HDL' % name)
+        self.inputs = dict((pin, self.new_nets(width)) for pin, width in definition.inputs)
+        self.outputs = dict((pin, self.new_nets(width)) for pin, width in definition.outputs)
+        pins = dict(self.inputs)
+        pins.update(self.outputs)
+        self.instantiate(definition, directory, pins, [])
+        self.canonicalize()
+        self.levelize()
+
+    def new_nets(self, width):
+        first = len(self.parent)
+        self.parent.extend(range(first, first + width))
+        return list(range(first, first + width))
+
+    def find(self, net):
+        parent = self.parent
+        while parent[net] != net:
+            parent[net] = parent[parent[net]]
+            net = parent[net]
+        return net
+
+    def union(self, a, b):
+        """Merge the nets of a and b; the constants stay their own representatives"""
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if a <= TRUE:
+                a, b = b, a
+            self.parent[a] = b
+
+    def instantiate(self, definition, directory, pins, path):
+        """Add the parts of definition, whose pins are connected to the nets in pins. path
+        lists the parts that contain it.
+        """
+        if len(path) > 64:
+            raise Exception('Chip %s contains itself' % definition.name)
+        signals = dict(pins)
+        counts = {}
+        for chip, connections in definition.parts:
+            counts[chip] = counts.get(chip, 0) + 1
+            part_path = path + ['%s[%d]' % (chip, counts[chip] - 1)]
+            kind, part, part_directory = find_chip(chip, directory)
+            if kind == 'hdl':
+                inputs = dict(part.inputs)
+                outputs = dict(part.outputs)
+            elif kind == 'gate':
+                inputs = dict((pin, 1) for pin in gate_chips[chip][0])
+                outputs = dict((pin, 1) for pin in gate_chips[chip][1])
+            else:
+                macro = macro_chips[chip](chip)
+                inputs = dict(macro.inputs)
+                outputs = dict(macro.outputs)
+            part_pins = dict((pin, self.new_nets(width)) for pin, width in list(inputs.items()) + list(outputs.items()))
+
+            for pin, pin_first, pin_last, signal, signal_first, signal_last in connections:
+                if pin not in part_pins:
+                    raise Exception('%s has no pin %s (in %s)' % (chip, pin, definition.name))
+                if pin_first is None:
+                    nets = part_pins[pin]
+                else:
+                    nets = part_pins[pin][pin_first:pin_last + 1]
+                if signal in ('true', 'false'):
+                    if pin in inputs:
+                        for net in nets:
+                            self.union(net, TRUE if signal == 'true' else FALSE)
+                    continue
+                for net, signal_net in zip(nets, self.signal_nets(signals, signal, signal_first, signal_last, len(nets))):
+                    self.union(net, signal_net)
+
+            if kind == 'hdl':
+                self.instantiate(part, part_directory, part_pins, part_path)
+            elif kind == 'gate':
+                for gate, gate_inputs, output in gate_chips[chip][2]:
+                    if gate == 'dff':
+                        self.dffs.append((part_pins[gate_inputs[0]][0], part_pins[output][0]))
+                    else:
+                        self.raw_gates.append((gate, [part_pins[pin][0] for pin in gate_inputs], part_pins[output][0]))
+                    self.part_names[part_pins[output][0]] = '/'.join(part_path)
+            else:
+                macro.pins = part_pins
+                macro.path = '/'.join(part_path)
+                self.macros.append(macro)
+
+    def signal_nets(self, signals, name, first, last, width):
+        """Nets of signal name, or of its bits first..last, as width nets"""
+        if name not in signals:
+            signals[name] = self.new_nets(width if first is None else last + 1)
+        nets = signals[name]
+        if first is not None:
+            if last >= len(nets):
+                nets.extend(self.new_nets(last + 1 - len(nets)))
+            nets = nets[first:last + 1]
+        if len(nets) != width:
+            raise Exception('Width mismatch: %s has %d bits, connected to %d' % (name, len(nets), width))
+        return nets
+
+    def canonicalize(self):
+        """Replace every net by its representative"""
+        find = self.find
+        self.inputs = dict((pin, [find(net) for net in nets]) for pin, nets in self.inputs.items())
+        self.outputs = dict((pin, [find(net) for net in nets]) for pin, nets in self.outputs.items())
+        self.raw_gates = [(kind, [find(net) for net in inputs], find(output)) for kind, inputs, output in self.raw_gates]
+        self.dffs = [(find(d), find(q)) for d, q in self.dffs]
+        self.part_names = dict((find(net), name) for net, name in self.part_names.items())
+        for macro in self.macros:
+            macro.pins = dict((pin, [find(net) for net in nets]) for pin, nets in macro.pins.items())
+        self.net_count = len(self.parent)
+
+    def levelize(self):
+        """Order the gates and memory reads so that every net is computed before it is
+        used, and record the level of each. Raises an exception on a combinational loop.
+        """
+        nodes = [('gate', gate) for gate in self.raw_gates]
+        nodes.extend(('read', macro) for macro in self.macros if macro.reads())
+        drivers = {}
+        node_inputs = []
+        for index, (kind, node) in enumerate(nodes):
+            if kind == 'gate':
+                outputs, inputs = [node[2]], node[1]
+            else:
+                outputs, inputs = node.pins['out'], node.pins[node.reads()]
+            for net in outputs:
+                if net > TRUE:
+                    drivers[net] = index
+            node_inputs.append(inputs)
+        users = [[] for _ in nodes]
+        waiting = [0] * len(nodes)
+        for index, inputs in enumerate(node_inputs):
+            for driver in set(drivers[net] for net in inputs if net in drivers):
+                users[driver].append(index)
+                waiting[index] += 1
+        level = [1] * len(nodes)
+        ready = [index for index in range(len(nodes)) if not waiting[index]]
+        order = []
+        while ready:
+            index = ready.pop()
+            order.append(index)
+            for user in users[index]:
+                level[user] = max(level[user], level[index] + 1)
+                waiting[user] -= 1
+                if not waiting[user]:
+                    ready.append(user)
+        if len(order) != len(nodes):
+            raise Exception('Combinational loop in chip %s' % self.name)
+        order.sort(key=lambda index: level[index])
+        self.nodes = [nodes[index] for index in order]
+        self.node_levels = [level[index] for index in order]
+        self.drivers = set(drivers)
+        self.gates = [node for kind, node in self.nodes if kind == 'gate']
+        self.levels = [node_level for (kind, _), node_level in zip(self.nodes, self.node_levels) if kind == 'gate']
+
+    def depth(self):
+        """Number of levels of the combinational logic"""
+        return max(self.node_levels or [0])
+
+    def evaluate_source(self, name='evaluate'):
+        """Source of name(v), which computes every gate and memory read from the net
+        values v and stores the nets used outside it back into v. Memory macro i is
+        the global list memory_i, the macros' indices in macros.
+        """
+        def ref(net):
+            if net == FALSE:
+                return '0'
+            if net == TRUE:
+                return 'mask'
+            return 'n%d' % net
+
+        observed = set()
+        for nets in self.outputs.values():
+            observed.update(nets)
+        observed.update(d for d, _ in self.dffs)
+        for macro in self.macros:
+            for pin in macro.inputs:
+                observed.update(macro.pins[pin])
+
+        lines = ['def %s(v):' % name]
+        used = set()
+        for kind, node in self.nodes:
+            used.update(node[1] if kind == 'gate' else node.pins[node.reads()])
+        for net in sorted(used):
+            if net > TRUE and net not in self.drivers:
+                lines.append('    n%d = v[%d]' % (net, net))
+        for kind, node in self.nodes:
+            if kind == 'gate':
+                gate, inputs, output = node
+                arguments = [ref(net) for net in inputs]
+                if gate == 'mux':
+                    arguments = [arguments[0], arguments[0], arguments[1], arguments[2]]
+                lines.append('    n%d = %s' % (output, gate_expressions[gate] % tuple(arguments)))
+            else:
+                address = ' | '.join('(%s << %d)' % (ref(net), bit) for bit, net in enumerate(node.pins[node.reads()]))
+                lines.append('    word = memory_%d[%s]' % (self.macros.index(node), address or '0'))
+                for bit, net in enumerate(node.pins['out']):
+                    if net > TRUE:
+                        lines.append('    n%d = (word >> %d) & 1' % (net, bit))
+        for net in sorted(observed & self.drivers):
+            lines.append('    v[%d] = n%d' % (net, net))
+        lines.append('    return v')
+        return '\n'.join(lines) + '\n'
+
+    def clock_source(self):
+        """Source of tick(v, state), latching every DFF input into state, and tock(v,
+        state), driving every DFF output from state
+        """
+        lines = ['def tick(v, state):']
+        lines.extend('    state[%d] = v[%d]' % (i, d) for i, (d, _) in enumerate(self.dffs))
+        lines.append('    return state')
+        lines.append('def tock(v, state):')
+        lines.extend('    v[%d] = state[%d]' % (q, i) for i, (_, q) in enumerate(self.dffs) if q > TRUE)
+        lines.append('    return v')
+        return '\n'.join(lines) + '\n'
+
+    def compile(self, mask=1):
+        """Return (evaluate, tick, tock) compiled for net values masked by mask"""
+        namespace = {'mask': mask}
+        for index, macro in enumerate(self.macros):
+            namespace['memory_%d' % index] = macro.memory
+        scope = {}
+        exec(compile(self.evaluate_source(), '<hdl %s>' % self.name, 'exec'), namespace, scope)
+        exec(compile(self.clock_source(), '<hdl %s clock>' % self.name, 'exec'), namespace, scope)
+        return scope['evaluate'], scope['tick'], scope['tock']
+
+
+class GateChip(object):
+    """Simulation of a Netlist with the interface of chips.Chip. Parts are named as in
+    the hardware simulator: RAM16K[5], DRegister[], PC[] ... refer to the first macro of
+    that chip.
+    """
+    def __init__(self, netlist):
+        self.netlist = netlist
+        self.pins = dict((pin, len(nets)) for pin, nets in list(netlist.inputs.items()) + list(netlist.outputs.items()))
+        self.nets = dict(netlist.inputs)
+        self.nets.update(netlist.outputs)
+        self.v = [0] * netlist.net_count
+        self.v[TRUE] = 1
+        self.state = [0] * len(netlist.dffs)
+        self.evaluate, self.tick_dffs, self.tock_dffs = netlist.compile()
+        self.parts = {}
+        for macro in netlist.macros:
+            self.parts.setdefault(macro.name, macro)
+        self.evaluate(self.v)
+
+    def width(self, name):
+        return self.pins.get(name, 16)
+
+    def set(self, name, value):
+        base, index = split_name(name)
+        if base in self.parts and name.endswith(']'):
+            macro = self.parts[base]
+            macro.set(index, value)
+            if macro.pending is not None and isinstance(macro, KeyboardMacro):
+                macro.tock(self.v)
+            return
+        if name not in self.netlist.inputs:
+            raise Exception('%s has no input pin %s' % (self.netlist.name, name))
+        for bit, net in enumerate(self.nets[name]):
+            if net > TRUE:
+                self.v[net] = (value >> bit) & 1
+
+    def get(self, name):
+        base, index = split_name(name)
+        if base in self.parts and name.endswith(']'):
+            return self.parts[base].get(index)
+        if name not in self.nets:
+            raise Exception('%s has no pin %s' % (self.netlist.name, name))
+        value = 0
+        for bit, net in enumerate(self.nets[name]):
+            value |= self.v[net] << bit
+        return value
+
+    def eval(self):
+        self.evaluate(self.v)
+
+    def tick(self):
+        self.tick_dffs(self.v, self.state)
+        for macro in self.netlist.macros:
+            macro.tick(self.v)
+
+    def tock(self):
+        self.tock_dffs(self.v, self.state)
+        for macro in self.netlist.macros:
+            macro.tock(self.v)
+
+    def press_key(self, value):
+        """Simulate a key held down, for scripts that wait on the keyboard"""
+        if 'Keyboard' not in self.parts:
+            return False
+        self.set('Keyboard[]', value)
+        self.eval()
+        return True
+
+    def load_rom(self, rom):
+        """ROM32K load"""
+        memory = self.parts['ROM32K'].memory
+        memory[:] = list(rom) + [0] * (len(memory) - len(rom))
+
+
+def pack_vectors(values, width):
+    """Bit slices of the words values: slice i is an int whose bit j is bit i of values[j]"""
+    slices = []
+    for bit in range(width):
+        digits = ''.join('1' if (value >> bit) & 1 else '0' for value in reversed(values))
+        slices.append(int(digits or '0', 2))
+    return slices
+
+
+def unpack_vectors(slices, count):
+    """The count words of the bit slices slices, the reverse of pack_vectors"""
+    values = [0] * count
+    for bit, bit_slice in enumerate(slices):
+        digits = bin(int(bit_slice))[2:].zfill(count)[::-1]
+        for j in range(count):
+            if digits[j] == '1':
+                values[j] |= 1 << bit
+    return values
+
+
+def pack_lanes(values, width):
+    """Bit slices of the words values as uint64 arrays, vector j in bit j % 64 of
+    element j // 64
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    padded = np.zeros(-(-len(values) // 64) * 64, dtype=np.uint64)
+    padded[:len(values)] = values
+    return [np.packbits(((padded >> np.uint64(bit)) & np.uint64(1)).astype(np.uint8),
+                        bitorder='little').view('<u8') for bit in range(width)]
+
+
+def unpack_lanes(slices, count):
+    """The count words of the uint64 bit slices slices, the reverse of pack_lanes"""
+    values = np.zeros(count, dtype=np.uint64)
+    for bit, bit_slice in enumerate(slices):
+        bits = np.unpackbits(np.asarray(bit_slice, dtype='<u8').view(np.uint8), bitorder='little')[:count]
+        values |= bits.astype(np.uint64) << np.uint64(bit)
+    return values
+
+
+class BitslicedChip(object):
+    """Evaluation of a combinational Netlist for many input vectors at once, one vector
+    per bit of the net values: Python ints (lanes='int') or NumPy uint64 arrays
+    (lanes='numpy')
+    """
+    def __init__(self, netlist, lanes='int'):
+        if netlist.dffs or netlist.macros:
+            raise Exception('%s is sequential; bitsliced evaluation needs combinational logic' % netlist.name)
+        if lanes == 'numpy' and np is None:
+            raise Exception('NumPy lanes require NumPy')
+        if lanes not in ('int', 'numpy'):
+            raise Exception('Unknown lanes: ' + lanes)
+        self.netlist = netlist
+        self.lanes = lanes
+        self.functions = {}     # evaluate functions by mask
+
+    def evaluate_function(self, mask):
+        key = -1 if self.lanes == 'numpy' else mask
+        if key not in self.functions:
+            self.functions[key] = self.netlist.compile(mask)[0]
+        return self.functions[key]
+
+    def evaluate_slices(self, slices, count):
+        """Output bit slices, by pin, for count vectors given the input bit slices, by pin
+        (missing pins are 0)
+        """
+        if self.lanes == 'numpy':
+            mask = np.uint64(0xFFFFFFFFFFFFFFFF)
+            zero = np.zeros(-(-count // 64), dtype=np.uint64)
+        else:
+            mask = (1 << count) - 1
+            zero = 0
+        v = [zero] * self.netlist.net_count
+        v[TRUE] = mask if self.lanes == 'int' else zero | mask
+        for pin, nets in self.netlist.inputs.items():
+            for net, bit_slice in zip(nets, slices.get(pin, ())):
+                if net > TRUE:
+                    v[net] = bit_slice
+        self.evaluate_function(mask)(v)
+        return dict((pin, [v[net] | zero for net in nets]) for pin, nets in self.netlist.outputs.items())
+
+    def evaluate(self, inputs):
+        """Output words, by pin, for the input vectors given as equally long sequences of
+        words, by pin
+        """
+        count = max(len(values) for values in inputs.values())
+        pack, unpack = (pack_lanes, unpack_lanes) if self.lanes == 'numpy' else (pack_vectors, unpack_vectors)
+        slices = dict((pin, pack(values, len(self.netlist.inputs[pin]))) for pin, values in inputs.items())
+        outputs = self.evaluate_slices(slices, count)
+        return dict((pin, unpack(pin_slices, count)) for pin, pin_slices in outputs.items())
+
+
+def adder_pins(netlist):
+    """The two 16-bit inputs, the 16-bit sum and the one-bit carry input (or None) of an
+    adder
+    """
+    operands = sorted(pin for pin, nets in netlist.inputs.items() if len(nets) == 16)
+    sums = [pin for pin, nets in netlist.outputs.items() if len(nets) == 16]
+    carries = [pin for pin, nets in netlist.inputs.items() if len(nets) == 1]
+    if len(operands) != 2 or len(sums) != 1 or len(carries) > 1:
+        raise Exception('%s is not a 16-bit adder' % netlist.name)
+    return operands[0], operands[1], sums[0], carries[0] if carries else None
+
+
+def vector_at(slices, j):
+    """Word j of the bit slices slices (Python ints or uint64 arrays)"""
+    value = 0
+    for bit, bit_slice in enumerate(slices):
+        if np is not None and isinstance(bit_slice, np.ndarray):
+            value |= ((int(bit_slice[j // 64]) >> (j % 64)) & 1) << bit
+        else:
+            value |= ((bit_slice >> j) & 1) << bit
+    return value
+
+
+def set_bits(bit_slice, count):
+    """Indices of the bits set in the bit slice bit_slice, below count"""
+    if np is not None and isinstance(bit_slice, np.ndarray):
+        return [int(j) for j in np.flatnonzero(np.unpackbits(bit_slice.view(np.uint8), bitorder='little')[:count])]
+    digits = bin(bit_slice)[2:][::-1]
+    return [j for j in range(min(len(digits), count)) if digits[j] == '1']
+
+
+def check_adder(netlist, xs, lanes='int'):
+    """Check the 16-bit adder netlist for every x in xs against all 65536 y, with the carry
+    input 0 and 1 if there is one. The expected sums are computed bitsliced too, by a
+    ripple of Python bitwise operations. Returns the (x, y, carry in, sum) that fail.
+    """
+    chip = BitslicedChip(netlist, lanes)
+    x_pin, y_pin, sum_pin, carry_pin = adder_pins(netlist)
+    if lanes == 'numpy':
+        y_slices = pack_lanes(range(65536), 16)
+        ones = np.full(1024, 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+        zeros = np.zeros(1024, dtype=np.uint64)
+    else:
+        y_slices = pack_vectors(list(range(65536)), 16)
+        ones, zeros = (1 << 65536) - 1, 0
+    failures = []
+    for x in xs:
+        for carry in ([0, 1] if carry_pin else [0]):
+            x_slices = [ones if (x >> bit) & 1 else zeros for bit in range(16)]
+            slices = {x_pin: x_slices, y_pin: y_slices}
+            if carry_pin:
+                slices[carry_pin] = [ones if carry else zeros]
+            sums = chip.evaluate_slices(slices, 65536)[sum_pin]
+            c = ones if carry else zeros
+            wrong = zeros
+            for bit in range(16):
+                a, b = x_slices[bit], y_slices[bit]
+                wrong = wrong | (sums[bit] ^ a ^ b ^ c)
+                c = (a & b) | (c & (a ^ b))
+            failures.extend((x, y, carry, vector_at(sums, y)) for y in set_bits(wrong, 65536))
+    return failures
+
+
+def load_chip(chip_name, directory='.'):
+    """GateChip for chip_name built from the HDL in directory; the 'gate' engine of
+    tst_runner.py
+    """
+    return GateChip(Netlist(chip_name, directory))
+
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 1:
+        print("Usage: Python hdl.py file-name.hdl")
+        print("Flattens the chip into gates and prints its size and logic depth")
+        print("Usage: Python hdl.py --adder [--numpy] file-name.hdl first-x count")
+        print("Checks a 16-bit adder exhaustively for count values of x from first-x, each against every y")
+        print("Example: Python hdl.py ALU/ALU.hdl")
+        print("Example: Python hdl.py --adder Adders/CLA16.hdl 0 256")
+    elif '--adder' in options:
+        path = args[0]
+        netlist = Netlist(os.path.splitext(os.path.basename(path))[0], os.path.dirname(os.path.abspath(path)))
+        first = int(args[1]) if len(args) > 1 else 0
+        count = int(args[2]) if len(args) > 2 else 1
+        failures = check_adder(netlist, range(first, min(first + count, 65536)), 'numpy' if '--numpy' in options else 'int')
+        for x, y, carry, total in failures[:20]:
+            print('x = %d, y = %d, carry in = %d: sum %d' % (x, y, carry, total))
+        print('%s: %d failures for x = %d..%d' % (netlist.name, len(failures), first, min(first + count, 65536) - 1))
+    else:
+        path = args[0]
+        netlist = Netlist(os.path.splitext(os.path.basename(path))[0], os.path.dirname(os.path.abspath(path)))
+        kinds = {}
+        for kind, _, _ in netlist.gates:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        print('%s: %d nets, %d gates, %d DFFs, %d built-in sequential chips, depth %d' % (
+            netlist.name, netlist.net_count, len(netlist.gates), len(netlist.dffs), len(netlist.macros), netlist.depth()))
+        for kind in sorted(kinds):
+            print('    %-8s %d' % (kind, kinds[kind]))
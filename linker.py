@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Relocatable object files and a linker for Hack assembly modules.
+
+Each .asm module (for example one of the .i files written by vm_translator_v2) is
+assembled on its own into a .hobj object file that holds:
+
+    words        the encoded instructions, with 0 in place of every symbolic operand
+    labels       the labels the module defines, as offsets from the start of the module
+    references   every symbol the module uses, with the offsets of the words that use it,
+                 in order of first use
+    variables    the symbols used but not defined in the module; the linker allocates
+                 RAM for the ones no other module defines
+
+The linker places the modules one after the other in ROM, merges their labels,
+allocates variables from RAM 16 upward in order of first use and patches every
+reference. The result is the same machine code as assembling the concatenated modules
+with run_assembler. Predefined symbols (SP, R0-R15, SCREEN, ...) are resolved when the
+module is assembled, so they cannot be redefined as labels.
+
+A build only reassembles modules whose object file is missing or older than the
+source, so a one-module edit costs one module's assembly plus a relink.
+
+Student name(s): Zach Hammad
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+
+import assembler
+import hack_binary
+
+MAGIC = b'HOBJ'
+HEADER = struct.Struct('<4sII')     # magic, word count, metadata length
+
+
+class ObjectFile(object):
+    """A relocatable module"""
+    def __init__(self, module, words, labels, references):
+        self.module = module
+        self.words = words
+        self.labels = labels
+        self.references = references
+
+    def variables(self):
+        """Symbols this module uses without defining them, in order of first use"""
+        return [symbol for symbol in self.references if symbol not in self.labels]
+
+
+def assemble_object(file_name, cache=None):
+    """Assemble one module into an ObjectFile"""
+    if cache is None:
+        cache = assembler.parse_cache
+    lookup = cache.lookup
+
+    words = array('H')
+    labels = {}
+    references = {}
+    with open(file_name, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[:2] == "//":
+                continue
+
+            packed_command, code = lookup(line)
+            if packed_command is None:
+                continue
+            kind, value, _ = packed_command
+            if kind == assembler.KIND_PSEUDO:
+                labels[value] = len(words)
+                continue
+
+            if code is None:
+                if value in assembler.predefined_symbols:
+                    code = '0' + format(assembler.predefined_symbols[value], '015b')
+                else:
+                    references.setdefault(value, []).append(len(words))
+                    code = '0000000000000000'
+            words.append(int(code, 2))
+
+    return ObjectFile(file_name, words, labels, references)
+
+
+def write_object(file_name, obj):
+    """Write obj to file_name"""
+    metadata = {'module': obj.module,
+                'labels': obj.labels,
+                'references': list(obj.references.items()),
+                'variables': obj.variables()}
+    metadata = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+
+    words = obj.words
+    if sys.byteorder == 'big':
+        words = array('H', words)
+        words.byteswap()
+
+    with open(file_name, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(words), len(metadata)))
+        f.write(metadata)
+        f.write(words.tobytes())
+
+
+def read_object(file_name):
+    """Read an ObjectFile written by write_object()"""
+    with open(file_name, 'rb') as f:
+        magic, count, length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise Exception('Not a Hack object file: ' + file_name)
+        metadata = json.loads(f.read(length).decode('utf-8'))
+        words = array('H')
+        words.frombytes(f.read(2 * count))
+
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return ObjectFile(metadata['module'], words, metadata['labels'], dict(metadata['references']))
+
+
+def link(objects):
+    """Combine objects, in order, into a ROM image. Returns (words, symbol table)."""
+    table = {}
+    base = 0
+    bases = []
+    for obj in objects:
+        bases.append(base)
+        for label, offset in obj.labels.items():
+            table[label] = base + offset
+        base += len(obj.words)
+
+    next_free_ram_address = 16
+    for obj in objects:
+        for symbol in obj.references:
+            if symbol not in table:
+                table[symbol] = next_free_ram_address
+                next_free_ram_address += 1
+
+    rom = array('H')
+    for obj, base in zip(objects, bases):
+        rom.extend(obj.words)
+        for symbol, offsets in obj.references.items():
+            address = table[symbol]
+            if address > 32767:
+                raise Exception('Address out of range for symbol: ' + symbol)
+            for offset in offsets:
+                rom[base + offset] = address
+    return rom, table
+
+
+def object_file_name(file_name):
+    """Object file that goes with a source module"""
+    file_name_minus_extension, _ = os.path.splitext(file_name)
+    return file_name_minus_extension + '.hobj'
+
+
+def load_module(file_name):
+    """Return (ObjectFile, reassembled) for a source or object file, reassembling the source
+    only if its object file is missing or out of date.
+    """
+    if file_name.endswith('.hobj'):
+        return read_object(file_name), False
+
+    object_file = object_file_name(file_name)
+    if os.path.exists(object_file) and os.path.getmtime(object_file) >= os.path.getmtime(file_name):
+        return read_object(object_file), False
+
+    obj = assemble_object(file_name)
+    write_object(object_file, obj)
+    return obj, True
+
+
+def build(modules, output_file):
+    """Assemble out-of-date modules, link everything and write output_file.
+    Writes the packed binary format if output_file ends in .hackb, text otherwise.
+    Returns the list of modules that were reassembled.
+    """
+    reassembled = []
+    objects = []
+    for file_name in modules:
+        obj, fresh = load_module(file_name)
+        objects.append(obj)
+        if fresh:
+            reassembled.append(file_name)
+
+    rom, _ = link(objects)
+    if output_file.endswith('.hackb'):
+        hack_binary.write_binary(output_file, rom)
+    else:
+        with open(output_file, 'w') as f:
+            f.write(''.join([format(word, '016b') + '\n' for word in rom]))
+    return reassembled
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: Python linker.py output-file module.asm|module.hobj ...")
+        print("Modules are placed in ROM in the order given; output-file ending in .hackb is written in the packed binary format")
+        print("Example: Python linker.py program.hack sys.i main.i mult.i")
+    else:
+        start = time.perf_counter()
+        reassembled = build(sys.argv[2:], sys.argv[1])
+        elapsed = time.perf_counter() - start
+        for file_name in reassembled:
+            print('Assembled:', file_name)
+        print('Linked', len(sys.argv) - 2, 'modules into', sys.argv[1], 'in %.1f ms' % (1000 * elapsed))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Peephole optimizer for Hack assembly.
+
+Runs between parsing and code generation. Instructions are streamed into an output
+list and, after each one, the rules are tried on a window at the tail of the list until
+none applies. Every rule removes instructions without changing what the program
+computes:
+
+    dead_a_load         @x followed by @y: the first load is overwritten unused
+    redundant_a_reload  @x, C-instructions that do not write A, @x: A already holds x
+    inc_dec_cancel      M=M+1 followed by M=M-1 (or the reverse, or the same on D or A)
+    store_reload        M=D followed by D=M, or D=M followed by M=D: the second is a no-op
+
+Labels are part of the intermediate representation, so a window never spans a jump
+target, and label addresses are recomputed by generate_machine_code from the optimized
+code. Jumps to numeric ROM addresses (e.g. @5 / 0;JMP) are not tracked and must not be
+used in code given to the optimizer.
+
+Variables are allocated before the rules run, in order of first use in the unoptimized
+code, and their A-instructions become numeric: dead_a_load may delete the first mention
+of a variable, which would otherwise move it and every later variable in RAM.
+check_program runs a program assembled with and without the optimizer and compares
+the RAM.
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+
+import assembler
+from assembler import KIND_A_NUMERIC, KIND_A_SYMBOL, KIND_C, KIND_PSEUDO
+
+
+class Rule(object):
+    """A rewrite of the last size instructions of the output.
+    rewrite(window) returns the replacement list, or None if the rule does not match.
+    """
+    def __init__(self, name, size, rewrite):
+        self.name = name
+        self.size = size
+        self.rewrite = rewrite
+
+
+def a_address(instruction):
+    """Value an A-instruction loads, with predefined symbols resolved; None for other instructions"""
+    kind, value, _ = instruction
+    if kind == KIND_A_NUMERIC:
+        return value
+    if kind == KIND_A_SYMBOL:
+        return assembler.predefined_symbols.get(value, value)
+    return None
+
+
+def c_fields(instruction):
+    """(comp, dest, jmp) of a C-instruction; None for other instructions"""
+    if instruction[0] != KIND_C:
+        return None
+    return assembler.unpack_fields(instruction[2])
+
+
+def dead_a_load(window):
+    """@x @y -> @y"""
+    if window[0][0] in (KIND_A_NUMERIC, KIND_A_SYMBOL) and window[1][0] in (KIND_A_NUMERIC, KIND_A_SYMBOL):
+        return [window[1]]
+    return None
+
+
+def redundant_a_reload(window):
+    """@x C... @x -> @x C..., when none of the C-instructions writes A"""
+    first = a_address(window[0])
+    if first is None or first != a_address(window[-1]):
+        return None
+    for instruction in window[1:-1]:
+        fields = c_fields(instruction)
+        if fields is None or 'A' in fields[1]:
+            return None
+    return window[:-1]
+
+
+"""Increments paired with the decrement that undoes them, per destination register"""
+inverse_updates = {('M', 'M+1'): 'M-1', ('M', 'M-1'): 'M+1',
+                   ('D', 'D+1'): 'D-1', ('D', 'D-1'): 'D+1',
+                   ('A', 'A+1'): 'A-1', ('A', 'A-1'): 'A+1'}
+
+
+def inc_dec_cancel(window):
+    """M=M+1 M=M-1 -> nothing (likewise for D and A, in either order)"""
+    first = c_fields(window[0])
+    second = c_fields(window[1])
+    if first is None or second is None or first[2] != 'null' or second[2] != 'null':
+        return None
+    if first[1] == second[1] and inverse_updates.get((first[1], first[0])) == second[0]:
+        return []
+    return None
+
+
+def store_reload(window):
+    """M=D D=M -> M=D, and D=M M=D -> D=M"""
+    first = c_fields(window[0])
+    second = c_fields(window[1])
+    if first is None or second is None or first[2] != 'null' or second[2] != 'null':
+        return None
+    if (first[:2], second[:2]) in ((('D', 'M'), ('M', 'D')), (('M', 'D'), ('D', 'M'))):
+        return [window[0]]
+    return None
+
+
+"""The rule set, tried in order; redundant_a_reload looks across up to three C-instructions"""
+rules = [Rule('dead_a_load', 2, dead_a_load),
+         Rule('redundant_a_reload', 3, redundant_a_reload),
+         Rule('redundant_a_reload', 4, redundant_a_reload),
+         Rule('redundant_a_reload', 5, redundant_a_reload),
+         Rule('inc_dec_cancel', 2, inc_dec_cancel),
+         Rule('store_reload', 2, store_reload)]
+
+
+def optimize_instructions(instructions, rules=rules):
+    """Optimize a sequence of packed (kind, value, code) instructions, with symbol names
+    as values. Returns (optimized list, per-rule counts).
+    """
+    counts = {}
+    for rule in rules:
+        counts[rule.name] = 0
+
+    out = []
+    for instruction in instructions:
+        out.append(instruction)
+        if instruction[0] == KIND_PSEUDO:
+            continue
+
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                if len(out) < rule.size:
+                    continue
+                window = out[-rule.size:]
+                if any(i[0] == KIND_PSEUDO for i in window):
+                    continue
+                replacement = rule.rewrite(window)
+                if replacement is not None:
+                    out[-rule.size:] = replacement
+                    counts[rule.name] += 1
+                    changed = True
+                    break
+    return out, counts
+
+
+def allocate_variables(ir):
+    """RAM address of every variable of an IntermediateRepresentation, allocated from 16
+    in order of first use as the assembler does
+    """
+    operands = ir.operands
+    labels = set(operands[value] for kind, value in zip(ir.kinds, ir.values) if kind == KIND_PSEUDO)
+    variables = {}
+    for kind, value in zip(ir.kinds, ir.values):
+        if kind == KIND_A_SYMBOL:
+            name = operands[value]
+            if name not in assembler.predefined_symbols and name not in labels and name not in variables:
+                variables[name] = 16 + len(variables)
+    return variables
+
+
+def optimize(ir, rules=rules):
+    """Optimize an IntermediateRepresentation. Returns (optimized IR, statistics), where
+    statistics holds the per-rule counts, the instruction counts before and after, and
+    the variables, by name, with the RAM addresses they were given.
+    """
+    operands = ir.operands
+    kinds = ir.kinds
+    values = ir.values
+    codes = ir.codes
+    variables = allocate_variables(ir)
+
+    def instructions():
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if kind == KIND_A_SYMBOL and operands[values[i]] in variables:
+                yield (KIND_A_NUMERIC, variables[operands[values[i]]], codes[i])
+            elif kind == KIND_A_SYMBOL or kind == KIND_PSEUDO:
+                yield (kind, operands[values[i]], codes[i])
+            else:
+                yield (kind, values[i], codes[i])
+
+    optimized, counts = optimize_instructions(instructions(), rules)
+    result = assembler.IntermediateRepresentation()
+    for instruction in optimized:
+        result.append_packed(instruction)
+
+    before = sum(1 for kind in kinds if kind != KIND_PSEUDO)
+    after = sum(1 for kind in result.kinds if kind != KIND_PSEUDO)
+    return result, {'rules': counts, 'instructions_before': before, 'instructions_after': after,
+                    'variables': variables}
+
+
+def check_program(lines, cycles=100000):
+    """Run the assembly source lines, assembled with and without the optimizer, until
+    they enter their final halting loop. Returns the RAM addresses whose final values
+    differ; raises an exception if a run has not halted within cycles instructions.
+    """
+    import emulator
+    rams = []
+    for optimize_code in (False, True):
+        machine_code = assembler.Assembler(optimize=optimize_code).assemble_lines(lines)
+        machine = emulator.Emulator([int(code, 2) for code in machine_code], detect_halts=True)
+        machine.run(cycles)
+        if not machine.halted:
+            raise Exception('The program did not halt within %d instructions' % cycles)
+        rams.append(machine.ram)
+    return [address for address in range(emulator.RAM_SIZE) if rams[0][address] != rams[1][address]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: Python peephole.py file-name.asm [cycles]")
+        print("Runs the program assembled with and without the optimizer until it halts (within cycles")
+        print("instructions, default 100000) and reports the RAM words that differ")
+        print("Example: Python peephole.py Max.asm")
+    else:
+        with open(sys.argv[1], 'r') as f:
+            source = f.read().splitlines()
+        differences = check_program(source, int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+        for address in differences[:20]:
+            print('RAM[%d] differs' % address)
+        print('%d RAM words differ' % len(differences))
+        sys.exit(1 if differences else 0)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Execution profiler for Hack programs.
+
+Runs a program on the emulator with a count of the instructions executed at each ROM
+address (Emulator.run_profiled) and maps the counts back to the source:
+
+    ROM     ROM address, through the assembler's source map (Assembler(source_map=True),
+            or assembler.py --map) to the assembly line at that address
+    asm     the assembly grouped by the label each instruction follows
+    VM      the VM command each assembly line was translated from
+
+The VM level works on the output of vm_translator_v2: every translated file starts with
+a '// file.vm' marker line, so the VM file is read again and each command is passed
+through translate_vm_commands to count the assembly lines it produced. A file that no
+longer matches its translation is left out.
+
+With VM information the profiler can also follow calls and returns, taken at the final
+jump of each VM call and return command, and
+write the cycles spent in each call stack in the collapsed format of flamegraph.pl:
+
+    prog.asm;Sys.init;Main.main;Math.multiply 12345
+
+Student name(s): Zach Hammad
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+from array import array
+
+import assembler
+import emulator
+import vm_translator_v2
+
+
+def load_source_map(map_file):
+    """Source map written by Assembler.write_source_map"""
+    with open(map_file, 'r') as f:
+        return json.load(f)
+
+
+def vm_file_commands(vm_file):
+    """List of (line number, command, assembly lines) for the commands in vm_file, in
+    the order translate_file translates them, or None if one does not translate
+    """
+    commands = []
+    with open(vm_file, 'r') as f:
+        for number, line in enumerate(f, 1):
+            tokens = line.split()
+            if not tokens or tokens[0] == '//':
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                s = vm_translator_v2.translate_vm_commands(tokens, 0)
+            if not s:
+                return None
+            commands.append((number, line.strip(), len(s)))
+    return commands
+
+
+def vm_source_map(asm_file):
+    """Map the lines of translator output asm_file to VM commands. Returns (owners,
+    commands): owners[n] is the index in commands of the VM command that produced
+    assembly line n (from 1) or None, and commands holds (VM file, line, command).
+    """
+    directory = os.path.dirname(os.path.abspath(asm_file))
+    with open(asm_file, 'r') as f:
+        lines = f.read().splitlines()
+    owners = [None] * (len(lines) + 1)
+    commands = []
+    markers = [number for number, line in enumerate(lines, 1)
+               if line.startswith('// ') and line.endswith('.vm')]
+    for i, marker in enumerate(markers):
+        end = markers[i + 1] - 1 if i + 1 < len(markers) else len(lines)
+        vm_file = lines[marker - 1][3:]
+        path = os.path.join(directory, vm_file)
+        if not os.path.exists(path):
+            continue
+        block = vm_file_commands(path)
+        if block is None or sum(count for _, _, count in block) != end - marker:
+            continue
+        number = marker + 1
+        for vm_line, command, count in block:
+            index = len(commands)
+            commands.append((vm_file, vm_line, command))
+            for _ in range(count):
+                owners[number] = index
+                number += 1
+    return owners, commands
+
+
+class Profiler(object):
+    """Maps instruction counts by ROM address back to assembly and VM source.
+
+    source is the assembly file, rom_lines the source line of each ROM address and
+    labels the ROM address of each label, as in the source map.
+    """
+    def __init__(self, source, rom_lines, labels):
+        self.source = source
+        self.rom_lines = rom_lines
+        self.labels = labels
+        with open(source, 'r') as f:
+            self.lines = f.read().splitlines()
+        self.owners, self.commands = vm_source_map(source)
+
+        # Index in commands of the VM command at each ROM address
+        self.rom_commands = [self.owners[line] for line in rom_lines]
+
+        # Calls and returns end in the last instruction of a VM call or return
+        self.call_sites = {}
+        self.return_sites = set()
+        for address, index in enumerate(self.rom_commands):
+            if index is None:
+                continue
+            if address + 1 == len(self.rom_commands) or self.rom_commands[address + 1] != index:
+                tokens = self.commands[index][2].split()
+                if tokens[0] == 'call':
+                    self.call_sites[address] = tokens[1]
+                elif tokens[0] == 'return':
+                    self.return_sites.add(address)
+
+        # Label each ROM address belongs to, for the assembly level
+        definitions = dict((line.strip()[1:-1], number) for number, line in enumerate(self.lines, 1)
+                           if line.strip().startswith('('))
+        starts = sorted((address, definitions.get(label, 0), label) for label, address in labels.items())
+        names = dict((address, label) for address, _, label in starts)
+        self.blocks = [None] * len(rom_lines)
+        current = None
+        for address in range(len(rom_lines)):
+            current = names.get(address, current)
+            self.blocks[address] = current
+
+    def rom_report(self, hits, top=20):
+        """List of (address, cycles, source line, source text), most executed first"""
+        rows = [(address, hits[address]) for address in range(len(self.rom_lines)) if hits[address]]
+        rows.sort(key=lambda row: -row[1])
+        return [(address, count, self.rom_lines[address], self.lines[self.rom_lines[address] - 1].strip())
+                for address, count in rows[:top]]
+
+    def asm_report(self, hits, top=20):
+        """List of (label, cycles, first address, last address), most executed first"""
+        totals = {}
+        for address in range(len(self.rom_lines)):
+            if hits[address]:
+                label = self.blocks[address] or '<start>'
+                count, first, last = totals.get(label, (0, address, address))
+                totals[label] = (count + hits[address], min(first, address), max(last, address))
+        rows = sorted(totals.items(), key=lambda item: -item[1][0])
+        return [(label, count, first, last) for label, (count, first, last) in rows[:top]]
+
+    def vm_report(self, hits, top=20):
+        """List of (VM file, line, command, cycles), most executed first"""
+        totals = {}
+        for address, index in enumerate(self.rom_commands):
+            if index is not None and hits[address]:
+                totals[index] = totals.get(index, 0) + hits[address]
+        rows = sorted(totals.items(), key=lambda item: -item[1])
+        return [self.commands[index] + (count,) for index, count in rows[:top]]
+
+    def run_stacks(self, machine, cycles):
+        """Run machine (an emulator.Emulator) for up to cycles instructions, counting hits
+        like run_profiled and following calls and returns. Returns a dictionary of cycles
+        by collapsed call stack.
+        """
+        if machine.hits is None:
+            machine.hits = array('Q', bytes(8 * (emulator.ROM_SIZE + 1)))
+        hits = machine.hits
+        program = machine.program
+        ops = machine.ops
+        calls = self.call_sites
+        returns = self.return_sites
+        stacks = [os.path.basename(self.source)]
+        counts = {}
+        a, d, pc = machine.a, machine.d, machine.pc
+        executed = 0
+        since = 0
+        while executed < cycles and not machine.halted:
+            entry = program[pc]
+            if entry >= 65536:
+                machine.a, machine.d, machine.pc = a, d, pc
+                stop = machine.special(entry)
+                a, d, pc = machine.a, machine.d, machine.pc
+                if stop:
+                    break
+                continue
+            hits[pc] += 1
+            address = pc
+            if entry < 32768:
+                a = entry
+                pc += 1
+            else:
+                a, d, pc = ops[entry](a, d, pc)
+            executed += 1
+            if pc != address + 1:
+                if address in calls:
+                    counts[stacks[-1]] = counts.get(stacks[-1], 0) + executed - since
+                    since = executed
+                    stacks.append(stacks[-1] + ';' + calls[address])
+                elif address in returns:
+                    counts[stacks[-1]] = counts.get(stacks[-1], 0) + executed - since
+                    since = executed
+                    if len(stacks) > 1:
+                        stacks.pop()
+        counts[stacks[-1]] = counts.get(stacks[-1], 0) + executed - since
+        machine.a, machine.d, machine.pc = a, d, pc
+        machine.cycles += executed
+        if pc == emulator.WATCH_PC:     # the last instruction wrote a watched address
+            machine.special(emulator.WATCH)
+        return dict((stack, count) for stack, count in counts.items() if count)
+
+    def report(self, hits, top=20):
+        """Text hot-spot report at ROM, asm and VM level"""
+        total = sum(hits)
+        percent = lambda count: 100.0 * count / total if total else 0.0
+        lines = ['%d cycles' % total, '', 'ROM hot spots:',
+                 '    %7s %12s %7s %7s  %s' % ('address', 'cycles', '%', 'line', 'source')]
+        for address, count, line, text in self.rom_report(hits, top):
+            lines.append('    %7d %12d %6.2f%% %7d  %s' % (address, count, percent(count), line, text))
+        lines.extend(['', 'asm hot spots (by label):',
+                      '    %-30s %12s %7s  %s' % ('label', 'cycles', '%', 'ROM')])
+        for label, count, first, last in self.asm_report(hits, top):
+            lines.append('    %-30s %12d %6.2f%%  %d-%d' % (label, count, percent(count), first, last))
+        if self.commands:
+            lines.extend(['', 'VM hot spots:',
+                          '    %-24s %12s %7s  %s' % ('file:line', 'cycles', '%', 'command')])
+            for vm_file, vm_line, command, count in self.vm_report(hits, top):
+                lines.append('    %-24s %12d %6.2f%%  %s' % ('%s:%d' % (vm_file, vm_line), count, percent(count), command))
+        return '\n'.join(lines)
+
+
+def load_profiler(file_name):
+    """Return (ROM, Profiler) for an .asm file, assembled here with a source map, or for
+    a .hack or .hackb file with its .map file next to it
+    """
+    if file_name.endswith('.asm'):
+        asm = assembler.Assembler(source_map=True)
+        machine_code = asm.assemble_file(file_name)
+        rom = [int(code, 2) for code in machine_code]
+        return rom, Profiler(file_name, asm.rom_lines, asm.labels)
+    source_map = load_source_map(os.path.splitext(file_name)[0] + '.map')
+    return emulator.load_program(file_name), Profiler(source_map['source'], source_map['lines'], source_map['labels'])
+
+
+def write_collapsed_stacks(counts, output_file):
+    """Write cycles by call stack in the collapsed format of flamegraph.pl"""
+    with open(output_file, 'w') as f:
+        for stack, count in sorted(counts.items()):
+            f.write('%s %d\n' % (stack, count))
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    top = 20
+    stacks_file = None
+    for name in ('--top', '--stacks'):
+        if name in argv:
+            i = argv.index(name)
+            if name == '--top':
+                top = int(argv[i + 1])
+            else:
+                stacks_file = argv[i + 1]
+            del argv[i:i + 2]
+    if len(argv) < 1:
+        print("Usage: Python profiler.py [--top N] [--stacks file] file-name.asm|file-name.hack [cycles]")
+        print("Runs the program for cycles instructions (default 1000000) and reports the hot spots")
+        print("by ROM address, assembly label and VM command. A .hack file needs the .map file")
+        print("written by assembler.py --map.")
+        print("--stacks: also follow calls and returns and write collapsed stacks for flamegraph.pl")
+        print("Example: Python profiler.py --stacks prog.folded prog.asm 5000000")
+    else:
+        rom, profiler = load_profiler(argv[0])
+        cycles = int(argv[1]) if len(argv) > 1 else 1000000
+        machine = emulator.Emulator(rom)
+        if stacks_file is not None:
+            write_collapsed_stacks(profiler.run_stacks(machine, cycles), stacks_file)
+            print('Collapsed stacks written to', stacks_file)
+        else:
+            machine.run_profiled(cycles)
+        print(profiler.report(machine.hits, top))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Snapshots of the complete state of an emulator.Emulator.
+
+A snapshot file stores, little-endian, after a 32-byte header:
+
+    magic        4 bytes   b'HSNP'
+    version      uint16    1
+    flags        uint16    bit 0: the machine has halted
+    A, D, PC     uint16 each
+    reserved     uint16    always 0
+    cycles       uint64
+    ROM words    uint32    length of the ROM with trailing @0 words dropped
+    ROM CRC      uint32    zlib.crc32 of those ROM words
+
+followed by the 32768 words of RAM (including the Screen and Keyboard maps) and the
+ROM words. Restoring memory-maps the file copy-on-write (mmap.ACCESS_COPY) and runs the
+machine directly on the mapped RAM, so no RAM is read or copied until it is used, and
+the file itself is never written.
+
+A Checkpoint keeps one snapshot in an anonymous memory file; every machine forked from
+it maps the same pages copy-on-write, so many continuations can start from one state
+and only the pages each of them writes are copied.
+
+Student name(s): Zach Hammad
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+import emulator
+from emulator import RAM_SIZE
+
+MAGIC = b'HSNP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHHHQII')
+HALTED = 1
+
+RAM_OFFSET = HEADER.size
+ROM_OFFSET = RAM_OFFSET + 2 * RAM_SIZE
+
+
+def little_endian(words):
+    """Bytes of an array('H') in little-endian order"""
+    if sys.byteorder == 'big':
+        words = array('H', words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def rom_image(machine):
+    """Little-endian bytes of machine's ROM without trailing zero words"""
+    data = little_endian(machine.rom)
+    return data[:2 * ((len(data.rstrip(b'\0')) + 1) // 2)]
+
+
+def write_snapshot(machine, f):
+    """Write the state of machine to the open binary file f"""
+    rom = rom_image(machine)
+    f.write(HEADER.pack(MAGIC, VERSION, HALTED if machine.halted else 0,
+                        machine.a, machine.d, machine.pc, 0, machine.cycles,
+                        len(rom) // 2, zlib.crc32(rom)))
+    f.write(little_endian(array('H', machine.ram)) if sys.byteorder == 'big' else machine.ram)
+    f.write(rom)
+
+
+def save_snapshot(machine, file_name):
+    """Write the state of machine to file_name"""
+    with open(file_name, 'wb') as f:
+        write_snapshot(machine, f)
+
+
+def map_snapshot(f):
+    """Map the snapshot in the open file f copy-on-write. Returns (header fields, mapping)."""
+    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mapping) < ROM_OFFSET:
+        raise Exception('Truncated snapshot')
+    fields = HEADER.unpack_from(mapping)
+    if fields[0] != MAGIC:
+        raise Exception('Not a Hack snapshot')
+    if fields[1] != VERSION:
+        raise Exception('Unsupported snapshot version %d' % fields[1])
+    if len(mapping) < ROM_OFFSET + 2 * fields[8]:
+        raise Exception('Truncated snapshot')
+    return fields, mapping
+
+
+def mapped_words(mapping, start, count):
+    """count words of mapping from byte start: a writable view on little-endian hosts,
+    a byte-swapped copy on big-endian ones
+    """
+    words = memoryview(mapping)[start:start + 2 * count].cast('H')
+    if sys.byteorder == 'big':
+        words = array('H', words)
+        words.byteswap()
+    return words
+
+
+def check_rom(machine, fields):
+    """Raise an exception unless machine holds the ROM of the snapshot header fields"""
+    rom = rom_image(machine)
+    if len(rom) // 2 != fields[8] or zlib.crc32(rom) != fields[9]:
+        raise Exception('Snapshot was taken with a different ROM')
+
+
+def set_state(machine, fields, ram):
+    """Put machine in the registers of the snapshot header fields, running on ram"""
+    _, _, flags, a, d, pc, _, cycles, _, _ = fields
+    machine.ram = ram
+    machine.namespace['ram'] = ram
+    machine.a, machine.d, machine.pc = a, d, pc
+    machine.cycles = cycles
+    machine.halted = bool(flags & HALTED)
+    return machine
+
+
+def restore(machine, fields, mapping):
+    """Put machine in the state of a mapped snapshot. machine must hold the same ROM."""
+    check_rom(machine, fields)
+    return set_state(machine, fields, mapped_words(mapping, RAM_OFFSET, RAM_SIZE))
+
+
+def restore_snapshot(machine, file_name):
+    """Put machine, which must hold the same ROM, in the state saved in file_name"""
+    with open(file_name, 'rb') as f:
+        fields, mapping = map_snapshot(f)
+    return restore(machine, fields, mapping)
+
+
+def load_snapshot(file_name, machine_class=None, **options):
+    """New machine (an emulator.Emulator unless machine_class is given, created with
+    options) with the ROM and state saved in file_name
+    """
+    with open(file_name, 'rb') as f:
+        fields, mapping = map_snapshot(f)
+    machine = (machine_class or emulator.Emulator)(mapped_words(mapping, ROM_OFFSET, fields[8]), **options)
+    return restore(machine, fields, mapping)
+
+
+def anonymous_file():
+    """A binary file that lives in memory only, where the platform allows it"""
+    if hasattr(os, 'memfd_create'):
+        return os.fdopen(os.memfd_create('hack-checkpoint'), 'w+b')
+    return tempfile.TemporaryFile()
+
+
+class Checkpoint(object):
+    """The state of a machine at one moment, held in an anonymous memory file.
+
+    fork() returns a new machine in that state. A fork is a clone of the machine the
+    checkpoint was taken from: it shares the ROM and dispatch array, gets a table of the
+    same compiled ops rebound to its RAM, and runs directly on a copy-on-write mapping
+    of the RAM pages, so no RAM is copied until it is written and a fork costs the
+    same however much RAM is in use. The ROM is checked once, here; the machine must
+    not load another ROM while it is forked.
+    """
+    def __init__(self, machine):
+        self.machine = machine
+        self.rom = machine.rom
+        self.file = anonymous_file()
+        write_snapshot(machine, self.file)
+        self.file.flush()
+        self.fields, _ = map_snapshot(self.file)
+        check_rom(machine, self.fields)
+
+    def fork(self):
+        """New machine in the checkpointed state"""
+        if self.machine.rom is not self.rom:
+            raise Exception('The machine has loaded another ROM since the checkpoint')
+        mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_COPY)
+        ram = mapped_words(mapping, RAM_OFFSET, RAM_SIZE)
+        return set_state(self.machine.clone(ram), self.fields, ram)
+
+    def save(self, file_name):
+        """Write the checkpoint to a snapshot file"""
+        self.file.seek(0)
+        with open(file_name, 'wb') as f:
+            f.write(self.file.read())
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: Python snapshot.py file-name.hack|file-name.hackb|file-name.asm cycles [snapshot-file]")
+        print("Runs the program for cycles instructions and saves its state to snapshot-file")
+        print("(file-name.snap by default)")
+        print("Usage: Python snapshot.py file-name.snap cycles")
+        print("Resumes a saved snapshot for cycles more instructions and prints the registers")
+        print("Example: Python snapshot.py mult.hack 1000000")
+    elif sys.argv[1].endswith('.snap'):
+        machine = load_snapshot(sys.argv[1])
+        machine.run(int(sys.argv[2]))
+        print('A = %d, D = %d, PC = %d, cycles = %d' % (machine.a, machine.d, machine.pc, machine.cycles))
+    else:
+        machine = emulator.Emulator(emulator.load_program(sys.argv[1]))
+        machine.run(int(sys.argv[2]))
+        output_file = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(sys.argv[1])[0] + '.snap'
+        save_snapshot(machine, output_file)
+        print('Saved state after %d cycles to %s' % (machine.cycles, output_file))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Static timing and gate-depth analysis of the chips' HDL.
+
+Every primitive gate (Nand, Not, And, Or, Xor, Mux, and each half of a DMux) counts as
+one unit of delay. A net's arrival depth is 0 for chip inputs, constants and the outputs
+of DFFs and registers, and one more than the latest of its inputs for a gate output;
+a memory read counts as one level after its address. The critical path is the chain of
+latest-arriving inputs back from the deepest output or register input.
+
+analyze() reports for the flattened netlist of a chip:
+
+    gates       counts by primitive
+    depth       the critical path length in gate levels, and the path itself, as parts
+    outputs     the arrival depth of every output bit
+    fan-out     the nets that drive the most gate inputs
+
+compare() puts several chips side by side, by default the repo's ripple-carry and
+carry-lookahead adders at 4 and 16 bits.
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import sys
+
+import hdl
+from hdl import TRUE
+
+HOT_SPOTS = 8       # fan-out hot spots reported
+
+"""Chips of the side-by-side adder comparison, in the Adders directory"""
+adder_designs = ['RippleCarryAdder4', 'CLA4', 'RippleCarryAdder16', 'CLA16']
+
+
+def arrival_depths(netlist):
+    """Arrival depth of every net computed by the netlist, and the input net that
+    arrives last at each of them
+    """
+    depth = {}
+    latest = {}
+    for kind, node in netlist.nodes:
+        if kind == 'gate':
+            inputs, outputs = node[1], [node[2]]
+        else:
+            inputs, outputs = node.pins[node.reads()], node.pins['out']
+        last = max(inputs, key=lambda net: depth.get(net, 0)) if inputs else None
+        arrival = (depth.get(last, 0) if last is not None else 0) + 1
+        for net in outputs:
+            if net > TRUE:
+                depth[net] = arrival
+                latest[net] = last
+    return depth, latest
+
+
+def observed_nets(netlist):
+    """(name, net) for every output bit and every input bit of a DFF or built-in chip"""
+    nets = []
+    for pin, pin_nets in sorted(netlist.outputs.items()):
+        nets.extend(('%s[%d]' % (pin, bit) if len(pin_nets) > 1 else pin, net) for bit, net in enumerate(pin_nets))
+    for i, (d, _) in enumerate(netlist.dffs):
+        nets.append(('DFF %d in' % i, d))
+    for macro in netlist.macros:
+        for pin in sorted(macro.inputs):
+            nets.extend(('%s %s[%d]' % (macro.path, pin, bit), net) for bit, net in enumerate(macro.pins[pin]))
+    return nets
+
+
+def net_name(netlist, net):
+    """Where net comes from: the part that drives it, or a chip input"""
+    if net in netlist.part_names:
+        return netlist.part_names[net]
+    for pin, nets in netlist.inputs.items():
+        if net in nets:
+            return '%s[%d]' % (pin, nets.index(net)) if len(nets) > 1 else pin
+    for macro in netlist.macros:
+        if net in macro.pins.get('out', ()):
+            return macro.path
+    return 'net %d' % net
+
+
+def analyze(netlist):
+    """Timing report of netlist as a dict: gates (count by primitive), gate_count,
+    depth, critical_path (part names from an input to the deepest net), outputs
+    ((name, arrival depth) of every observed bit) and fan_out ((net name, fan-out) of
+    the HOT_SPOTS most loaded nets)
+    """
+    gates = {}
+    fan_out = {}
+    for kind, inputs, _ in netlist.gates:
+        gates[kind] = gates.get(kind, 0) + 1
+        for net in inputs:
+            if net > TRUE:
+                fan_out[net] = fan_out.get(net, 0) + 1
+    depth, latest = arrival_depths(netlist)
+    outputs = [(name, depth.get(net, 0)) for name, net in observed_nets(netlist)]
+    critical = max(observed_nets(netlist), key=lambda item: depth.get(item[1], 0))[1] if outputs else None
+    path = []
+    net = critical
+    while net is not None and net > TRUE:
+        path.append(net_name(netlist, net))
+        net = latest.get(net)
+    hot = sorted(fan_out.items(), key=lambda item: (-item[1], item[0]))[:HOT_SPOTS]
+    return {'name': netlist.name,
+            'gates': gates,
+            'gate_count': len(netlist.gates),
+            'depth': max([arrival for _, arrival in outputs] or [0]),
+            'critical_path': path[::-1],
+            'outputs': outputs,
+            'fan_out': [(net_name(netlist, net), count) for net, count in hot]}
+
+
+def format_report(report):
+    """Text of an analyze() report"""
+    lines = ['%s: %d gates, critical path %d gate levels' % (report['name'], report['gate_count'], report['depth'])]
+    lines.append('  gates: ' + ', '.join('%s %d' % (kind, report['gates'][kind]) for kind in sorted(report['gates'])))
+    lines.append('  critical path:')
+    lines.extend('    %3d  %s' % (i, name) for i, name in enumerate(report['critical_path']))
+    lines.append('  arrival depth:')
+    lines.extend('    %-24s %d' % (name, arrival) for name, arrival in report['outputs'])
+    lines.append('  fan-out hot spots:')
+    lines.extend('    %-40s %d' % (name, count) for name, count in report['fan_out'])
+    return '\n'.join(lines)
+
+
+def compare(reports):
+    """Side-by-side text table of analyze() reports"""
+    def carry_depth(report):
+        """Depth of the carry out, or of the top sum bit when there is no carry output"""
+        arrivals = dict(report['outputs'])
+        for name in ('cout', 'carry'):
+            if name in arrivals:
+                return arrivals[name]
+        sums = [arrival for name, arrival in report['outputs'] if name.endswith(']')]
+        return sums[-1] if sums else report['depth']
+
+    rows = [('gates', lambda r: r['gate_count']),
+            ('critical path (levels)', lambda r: r['depth']),
+            ('carry out / top bit', carry_depth),
+            ('mean output depth', lambda r: '%.1f' % (float(sum(a for _, a in r['outputs'])) / max(1, len(r['outputs'])))),
+            ('max fan-out', lambda r: r['fan_out'][0][1] if r['fan_out'] else 0)]
+    width = max(12, max(len(r['name']) for r in reports) + 2)
+    lines = ['%-24s' % '' + ''.join('%*s' % (width, r['name']) for r in reports)]
+    for label, value in rows:
+        lines.append('%-24s' % label + ''.join('%*s' % (width, value(r)) for r in reports))
+    return '\n'.join(lines)
+
+
+def load_netlist(file_name):
+    """Netlist of the chip in an .hdl file"""
+    return hdl.Netlist(os.path.splitext(os.path.basename(file_name))[0], os.path.dirname(os.path.abspath(file_name)))
+
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--compare' in options:
+        if args and all(arg.endswith('.hdl') for arg in args):
+            reports = [analyze(load_netlist(arg)) for arg in args]
+        else:
+            directory = args[0] if args else 'Adders'
+            reports = [analyze(hdl.Netlist(name, directory)) for name in adder_designs]
+        print(compare(reports))
+    elif len(args) < 1:
+        print("Usage: Python timing.py file-name.hdl ...")
+        print("Prints gate counts, the critical path, output arrival depths and fan-out hot spots")
+        print("Usage: Python timing.py --compare [directory | file-name.hdl ...]")
+        print("Compares chips side by side, by default the ripple-carry and carry-lookahead adders in Adders")
+        print("Example: Python timing.py Adders/CLA16.hdl")
+    else:
+        for arg in args:
+            print(format_report(analyze(load_netlist(arg))))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Execution trace recorder for the Hack emulator.
+
+A Tracer keeps the last depth instructions a machine executed in a preallocated NumPy
+structured array used as a ring buffer, one packed 18-byte record per instruction:
+
+    cycle       uint64  instruction count before the instruction (emulator cycles)
+    pc          uint16  ROM address of the instruction
+    a, d        uint16  A and D after the instruction
+    address     uint16  RAM address written (after the Screen remap), NO_WRITE if none
+    value       uint16  value written
+
+Tracing is a run loop of its own, Tracer.run(machine, cycles), so Emulator.run pays
+nothing for it. Records are gathered in plain lists and copied into the ring buffer a
+chunk at a time.
+
+dump() writes the records in order to a .npy file, which load_trace() maps back
+without reading it; writes_to() and before_pc() answer the usual questions, such as
+every write to RAM[2] or the 1000 instructions that led up to PC = X.
+
+Requires NumPy.
+
+Student name(s): Zach Hammad
+"""
+
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import emulator
+from emulator import KBD, SCREEN
+
+NO_WRITE = 0xFFFF   # address of a record without a memory write
+CHUNK = 4096        # records gathered before they are copied into the ring buffer
+
+"""Fields of a trace record"""
+record_fields = [('cycle', '<u8'), ('pc', '<u2'), ('a', '<u2'), ('d', '<u2'),
+                 ('address', '<u2'), ('value', '<u2')]
+
+
+class Tracer(object):
+    """Ring buffer of the last depth instructions executed. count is the number of
+    instructions recorded in all, of which the last min(count, depth) are kept.
+    """
+    def __init__(self, depth=65536):
+        if np is None:
+            raise Exception('Tracer requires NumPy')
+        self.depth = depth
+        self.buffer = np.zeros(depth, np.dtype(record_fields))
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+
+    def store(self, first_cycle, pcs, a_values, d_values, addresses, values):
+        """Copy one chunk of records into the ring buffer"""
+        n = len(pcs)
+        columns = [('pc', pcs), ('a', a_values), ('d', d_values), ('address', addresses), ('value', values)]
+        cycles = np.arange(first_cycle, first_cycle + n, dtype=np.uint64)
+        skip = max(0, n - self.depth)   # records that would be overwritten in this chunk
+        start = (self.count + skip) % self.depth
+        kept = n - skip
+        first = min(kept, self.depth - start)
+        for name, column in [('cycle', cycles)] + columns:
+            column = np.asarray(column)[skip:]
+            self.buffer[name][start:start + first] = column[:first]
+            self.buffer[name][:kept - first] = column[first:]
+        self.count += n
+
+    def run(self, machine, cycles):
+        """Run machine (an emulator.Emulator) for up to cycles instructions like
+        machine.run, recording every instruction. Returns the number executed.
+        """
+        program = machine.program
+        ops = machine.ops
+        ram = machine.ram
+        a, d, pc = machine.a, machine.d, machine.pc
+        first_cycle = machine.cycles
+        pcs, a_values, d_values, addresses, values = [], [], [], [], []
+        executed = 0
+        while executed < cycles and not machine.halted:
+            entry = program[pc]
+            if entry >= 65536:
+                machine.a, machine.d, machine.pc = a, d, pc
+                stop = machine.special(entry)
+                a, d, pc = machine.a, machine.d, machine.pc
+                if stop:
+                    break
+                ram = machine.ram
+                continue
+            pcs.append(pc)
+            if entry < 32768:
+                a = entry
+                pc += 1
+                addresses.append(NO_WRITE)
+                values.append(0)
+            elif entry & 0x08:
+                address = a & 0x7FFF
+                if address >= KBD:
+                    address = SCREEN | (address & 0x1FFF)
+                a, d, pc = ops[entry](a, d, pc)
+                addresses.append(address)
+                values.append(ram[address])
+            else:
+                a, d, pc = ops[entry](a, d, pc)
+                addresses.append(NO_WRITE)
+                values.append(0)
+            a_values.append(a)
+            d_values.append(d)
+            executed += 1
+            if len(pcs) == CHUNK:
+                self.store(first_cycle + executed - CHUNK, pcs, a_values, d_values, addresses, values)
+                pcs, a_values, d_values, addresses, values = [], [], [], [], []
+        if pcs:
+            self.store(first_cycle + executed - len(pcs), pcs, a_values, d_values, addresses, values)
+        machine.a, machine.d, machine.pc = a, d, pc
+        machine.cycles += executed
+        if pc == emulator.WATCH_PC:     # the last instruction wrote a watched address
+            machine.special(emulator.WATCH)
+        return executed
+
+    def records(self):
+        """The kept records, oldest first"""
+        if self.count <= self.depth:
+            return self.buffer[:self.count].copy()
+        start = self.count % self.depth
+        return np.concatenate((self.buffer[start:], self.buffer[:start]))
+
+    def dump(self, file_name):
+        """Write the kept records, oldest first, to a .npy file"""
+        np.save(file_name, self.records())
+
+
+def load_trace(file_name):
+    """Records written by Tracer.dump, memory-mapped read-only"""
+    if np is None:
+        raise Exception('load_trace requires NumPy')
+    return np.load(file_name, mmap_mode='r')
+
+
+def writes_to(records, address):
+    """Records of the instructions that wrote RAM[address]"""
+    return records[records['address'] == address]
+
+
+def before_pc(records, pc, count=1000, occurrence=0):
+    """The count records before the instruction at ROM address pc was executed for the
+    occurrence-th time (from 0; -1 for the last time), followed by that record. Empty if
+    pc was not reached that many times.
+    """
+    hits = np.flatnonzero(records['pc'] == pc)
+    if not -len(hits) <= occurrence < len(hits):
+        return records[:0]
+    end = hits[occurrence]
+    return records[max(0, end - count):end + 1]
+
+
+def format_records(records):
+    """Text lines for records"""
+    lines = ['%12s %6s %6s %6s  %s' % ('cycle', 'pc', 'A', 'D', 'write')]
+    for record in records:
+        write = '' if record['address'] == NO_WRITE else 'RAM[%d] = %d' % (record['address'], record['value'])
+        lines.append('%12d %6d %6d %6d  %s' % (record['cycle'], record['pc'], record['a'], record['d'], write))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--writes' in options and len(args) >= 2:
+        print(format_records(writes_to(load_trace(args[0]), int(args[1]))))
+    elif '--before' in options and len(args) >= 2:
+        count = int(args[2]) if len(args) > 2 else 1000
+        print(format_records(before_pc(load_trace(args[0]), int(args[1]), count)))
+    elif len(args) < 3:
+        print("Usage: Python tracer.py file-name.hack|file-name.hackb|file-name.asm cycles trace-file.npy [depth]")
+        print("Runs the program for cycles instructions and saves the trace of the last depth (default 65536)")
+        print("Usage: Python tracer.py --writes trace-file.npy address")
+        print("Prints the instructions that wrote RAM[address]")
+        print("Usage: Python tracer.py --before trace-file.npy pc [count]")
+        print("Prints the count (default 1000) instructions before PC = pc was first reached")
+        print("Example: Python tracer.py prog.hack 1000000 prog.npy")
+    else:
+        tracer = Tracer(int(args[3]) if len(args) > 3 else 65536)
+        machine = emulator.Emulator(emulator.load_program(args[0]), detect_halts=True)
+        executed = tracer.run(machine, int(args[1]))
+        tracer.dump(args[2])
+        print('Traced %d instructions, kept the last %d in %s' % (executed, min(executed, tracer.depth), args[2]))
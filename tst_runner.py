@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Runs the hardware simulator's test scripts (.tst) without the simulator.
+
+A script is interpreted against an engine, an object that models the chip named by
+its load command, and its output lines are compared with the .cmp file named by
+compare-to. Engines are made by the factories in engine_factories:
+
+    behavioral  the Python models in chips.py
+    gate        the chip's HDL flattened into gates by hdl.py
+
+The supported script language:
+
+    load Chip.hdl                   choose the chip; the engine builds it
+    output-file X.out               written only when asked to (--write)
+    compare-to X.cmp                expected output; '*' in it matches any character
+    output-list pin%F<l>.<w>.<r>    columns; F is B, D, X or S, with l and r spaces of
+                                    padding around w characters
+    set pin value                   value is decimal (may be negative), %B, %X or %D
+    eval, tick, tock, output
+    repeat N { ... }
+    while pin <> value { ... }      a wait on the keyboard: the awaited key is pressed
+    ROM32K load X.hack              Computer only
+    echo "...", clear-echo          ignored
+
+Commands end with ',' or ';' and // and /* */ comments are allowed. time is a column
+showing the clock: N+ after tick, N after tock.
+
+Usage: Python tst_runner.py [--engine name] [--workers N] [--write] file.tst|directory ...
+
+Student name(s): Zach Hammad
+"""
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chips
+import emulator
+
+MAX_WAIT = 1000000      # iterations of a while loop before the script is abandoned
+
+token_pattern = re.compile(r'//[^\n]*|/\*.*?\*/|"[^"]*"|[,;{}]|[^\s,;{}"]+', re.S)
+format_pattern = re.compile(r'^(.+)%([BDXS])(\d+)\.(\d+)\.(\d+)$')
+
+
+def behavioral_engine(chip_name, directory):
+    """The chips.py model of chip_name"""
+    if chip_name not in chips.chip_models:
+        raise Exception('No behavioral model for chip ' + chip_name)
+    return chips.chip_models[chip_name]()
+
+
+def gate_engine(chip_name, directory):
+    """Gate-level simulation of Chip.hdl in directory"""
+    import hdl
+    return hdl.load_chip(chip_name, directory)
+
+
+"""Engine factories by name: factory(chip name, script directory) -> engine"""
+engine_factories = {'behavioral': behavioral_engine, 'gate': gate_engine}
+
+
+def tokenize(text):
+    """Words, strings and punctuation of a script, without comments"""
+    return [token for token in token_pattern.findall(text) if not token.startswith(('//', '/*'))]
+
+
+def parse_script(tokens, position=0):
+    """Parse tokens into a list of commands, stopping at a closing brace. Returns
+    (commands, position after the brace). A command is ('command', words),
+    ('repeat', count, body) or ('while', (pin, operator, value), body).
+    """
+    commands = []
+    words = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token in (',', ';'):
+            if words:
+                commands.append(('command', words))
+            words = []
+        elif token == '{':
+            body, position = parse_script(tokens, position)
+            if words[0] == 'repeat':
+                commands.append(('repeat', int(words[1]), body))
+            elif words[0] == 'while' and len(words) == 4:
+                commands.append(('while', tuple(words[1:]), body))
+            else:
+                raise Exception('Unknown block: ' + ' '.join(words))
+            words = []
+        elif token == '}':
+            if words:
+                commands.append(('command', words))
+            return commands, position
+        else:
+            words.append(token)
+    if words:
+        commands.append(('command', words))
+    return commands, position
+
+
+def parse_value(text):
+    """Integer value of a script literal: 5, -1, %B101, %X1F or %D12"""
+    if text.startswith('%B'):
+        return int(text[2:], 2)
+    if text.startswith('%X'):
+        return int(text[2:], 16)
+    if text.startswith('%D'):
+        return int(text[2:])
+    return int(text)
+
+
+def parse_output_list(words):
+    """List of (name, format, left, width, right) for the words of an output-list"""
+    columns = []
+    for word in words:
+        match = format_pattern.match(word)
+        if match is None:
+            raise Exception('Bad output-list entry: ' + word)
+        name, format_type, left, width, right = match.groups()
+        columns.append((name, format_type, int(left), int(width), int(right)))
+    return columns
+
+
+def format_value(value, format_type, width, bits):
+    """value formatted as format_type in width characters, for a pin of bits bits"""
+    if format_type == 'S':
+        return str(value)[:width].ljust(width)
+    if format_type == 'B':
+        return format(value, '0%db' % width)[-width:]
+    if format_type == 'X':
+        return format(value, '0%dX' % width)[-width:]
+    if bits == 16 and value & 0x8000:
+        value -= 0x10000
+    return str(value).rjust(width)
+
+
+def header_line(columns):
+    """First line of the output: the column names, centered"""
+    cells = []
+    for name, _, left, width, right in columns:
+        total = left + width + right
+        name = name[:total]
+        pad = (total - len(name)) // 2
+        cells.append(' ' * pad + name + ' ' * (total - len(name) - pad))
+    return '|' + '|'.join(cells) + '|'
+
+
+def lines_match(expected, actual):
+    """True if output line actual matches .cmp line expected, where '*' matches anything"""
+    if len(expected) != len(actual):
+        return False
+    for e, a in zip(expected, actual):
+        if e != a and e != '*':
+            return False
+    return True
+
+
+class ScriptRunner(object):
+    """Interprets one test script against an engine from engine_factories"""
+    def __init__(self, path, engine='behavioral'):
+        if engine not in engine_factories:
+            raise Exception('Unknown engine: ' + engine)
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.factory = engine_factories[engine]
+        self.chip = None
+        self.columns = []
+        self.output_lines = []
+        self.output_file = None
+        self.compare_file = None
+        self.time = '0'
+        self.clock = 0
+
+    def run(self):
+        """Execute the whole script"""
+        with open(self.path, 'r') as f:
+            commands, _ = parse_script(tokenize(f.read()))
+        self.execute(commands)
+
+    def execute(self, commands):
+        for command in commands:
+            if command[0] == 'repeat':
+                for _ in range(command[1]):
+                    self.execute(command[2])
+            elif command[0] == 'while':
+                self.wait(command[1], command[2])
+            else:
+                self.command(command[1])
+
+    def condition(self, pin, operator, value):
+        current = self.get(pin)
+        value = parse_value(value) & 0xFFFF
+        return {'=': current == value, '<>': current != value,
+                '<': current < value, '>': current > value,
+                '<=': current <= value, '>=': current >= value}[operator]
+
+    def wait(self, condition, body):
+        """A while loop. A script waiting for out to become a key code is waiting for
+        someone at the keyboard, so the key is pressed on the chip.
+        """
+        pin, operator, value = condition
+        if operator == '<>' and hasattr(self.chip, 'press_key'):
+            if self.condition(*condition):
+                self.chip.press_key(parse_value(value))
+        for _ in range(MAX_WAIT):
+            if not self.condition(*condition):
+                return
+            self.execute(body)
+        raise Exception('while %s %s %s never ended' % condition)
+
+    def get(self, name):
+        if name == 'time':
+            return self.time
+        return self.chip.get(name)
+
+    def command(self, words):
+        name = words[0]
+        if name == 'load':
+            self.chip = self.factory(os.path.splitext(words[1])[0], self.directory)
+        elif name == 'output-file':
+            self.output_file = os.path.join(self.directory, words[1])
+        elif name == 'compare-to':
+            self.compare_file = os.path.join(self.directory, words[1])
+        elif name == 'output-list':
+            self.columns = parse_output_list(words[1:])
+            self.output_lines.append(header_line(self.columns))
+        elif name == 'set':
+            self.chip.set(words[1], parse_value(words[2]))
+        elif name == 'eval':
+            self.chip.eval()
+        elif name == 'tick':
+            self.chip.eval()
+            self.chip.tick()
+            self.time = '%d+' % self.clock
+        elif name == 'tock':
+            self.chip.tock()
+            self.chip.eval()
+            self.clock += 1
+            self.time = '%d' % self.clock
+        elif name == 'output':
+            self.output()
+        elif name == 'ROM32K' and words[1] == 'load':
+            self.chip.load_rom(emulator.load_program(os.path.join(self.directory, words[2])))
+        elif name in ('echo', 'clear-echo'):
+            pass
+        else:
+            raise Exception('Unknown command: ' + ' '.join(words))
+
+    def output(self):
+        cells = []
+        for name, format_type, left, width, right in self.columns:
+            if name == 'time':
+                value, bits = self.time, 0
+            else:
+                value, bits = self.chip.get(name), self.chip.width(name)
+            cells.append(' ' * left + format_value(value, format_type, width, bits) + ' ' * right)
+        self.output_lines.append('|' + '|'.join(cells) + '|')
+
+    def compare(self):
+        """Compare the output with the .cmp file. Returns None if the script has no
+        compare-to, otherwise (passed, first mismatching line number, expected, actual).
+        """
+        if self.compare_file is None:
+            return None
+        with open(self.compare_file, 'r') as f:
+            expected = [line.rstrip('\r\n') for line in f if line.strip()]
+        for number, (e, a) in enumerate(zip(expected, self.output_lines), 1):
+            if not lines_match(e, a):
+                return False, number, e, a
+        if len(expected) != len(self.output_lines):
+            number = min(len(expected), len(self.output_lines)) + 1
+            e = expected[number - 1] if number <= len(expected) else ''
+            a = self.output_lines[number - 1] if number <= len(self.output_lines) else ''
+            return False, number, e, a
+        return True, None, None, None
+
+    def write_output(self):
+        if self.output_file is not None:
+            with open(self.output_file, 'w') as f:
+                for line in self.output_lines:
+                    f.write(line + '\n')
+
+
+def run_script(path, engine='behavioral', write=False):
+    """Run the script in path and return a dictionary with its result. passed is None for
+    a script with no compare-to; error holds the message if the script failed to run.
+    """
+    result = {'script': path, 'engine': engine, 'passed': None, 'lines': 0,
+              'mismatch': None, 'error': None, 'seconds': 0.0}
+    start = time.perf_counter()
+    try:
+        runner = ScriptRunner(path, engine)
+        runner.run()
+        result['lines'] = len(runner.output_lines)
+        comparison = runner.compare()
+        if comparison is not None:
+            result['passed'] = comparison[0]
+            if not comparison[0]:
+                result['mismatch'] = comparison[1:]
+        if write:
+            runner.write_output()
+    except Exception as e:
+        result['passed'] = False
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def find_scripts(paths):
+    """The .tst files in paths, searching directories recursively"""
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in sorted(os.walk(path)):
+                scripts.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith('.tst'))
+        else:
+            scripts.append(path)
+    return scripts
+
+
+def run_scripts(paths, engine='behavioral', workers=None, write=False):
+    """Run every script in paths across a pool of workers processes (one per CPU by
+    default; 1 runs them in this process). Returns the results in script order.
+    """
+    scripts = find_scripts(paths)
+    if workers == 1 or len(scripts) < 2:
+        return [run_script(script, engine, write) for script in scripts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_script, scripts, [engine] * len(scripts), [write] * len(scripts)))
+
+
+def option_value(argv, name, default):
+    """Value following --name in argv, or default"""
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return default
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    engine = option_value(argv, '--engine', 'behavioral')
+    workers = option_value(argv, '--workers', None)
+    values = [option_value(argv, name, None) for name in ('--engine', '--workers')]
+    args = [arg for arg in argv if not arg.startswith('--') and arg not in values]
+    if len(args) < 1:
+        print("Usage: Python tst_runner.py [--engine name] [--workers N] [--write] file.tst|directory ...")
+        print("Runs test scripts and compares their output with the .cmp files")
+        print("--engine: %s (default behavioral)" % ', '.join(sorted(engine_factories)))
+        print("--write: also write the output-file of each script")
+        print("Example: Python tst_runner.py --workers 4 CPU Memory ALU")
+    else:
+        start = time.perf_counter()
+        results = run_scripts(args, engine, int(workers) if workers else None, '--write' in argv)
+        failures = 0
+        for result in results:
+            if result['error']:
+                status = 'ERROR'
+            elif result['passed'] is None:
+                status = 'RAN'
+            else:
+                status = 'PASS' if result['passed'] else 'FAIL'
+            print('%-5s %s (%d lines, %.3f s)' % (status, result['script'], result['lines'], result['seconds']))
+            if result['error']:
+                print('      ' + result['error'])
+            elif result['mismatch']:
+                number, expected, actual = result['mismatch']
+                print('      line %d: expected %s' % (number, expected))
+                print('      line %d:      got %s' % (number, actual))
+            failures += result['passed'] is False
+        print('%d scripts, %d failed, %.3f s' % (len(results), failures, time.perf_counter() - start))
+        if failures:
+            sys.exit(1)